@@ -7,7 +7,7 @@ from dap_prinz_green_jobs.getters.data_getters import load_s3_data, get_s3_data_
 from dap_prinz_green_jobs.getters.industry_getters import load_sic
 from dap_prinz_green_jobs.getters.occupation_getters import load_soc_descriptions
 from dap_prinz_green_jobs.pipeline.green_measures.occupations.occupations_measures_utils import (
-    OccupationMeasures,
+    load_soc_green_measures_dict,
 )
 
 import pandas as pd
@@ -89,21 +89,41 @@ def process_soc_columns(
     occs_measures_df: pd.DataFrame,
 ) -> pd.DataFrame:
     """
-    The SOC column is originally a string of a dictionary of SOC details,
-    format this and move the information into separate columns
+    Format the SOC columns (SOC_2020_EXT, SOC_2020, SOC_2010 and SOC_name) as given by
+    OccupationMeasures.get_measures_table. In older occupation measures files the SOC
+    column is a string of a dictionary of SOC details, so this is moved into these columns.
     """
 
-    # "SOC" is read as a string, but "{... 'name': nan}" causes issues with literal_eval
-    occs_measures_df["SOC"] = occs_measures_df["SOC"].apply(
-        lambda x: ast.literal_eval(x.replace("'name': nan", "'name': 'None'"))
-        if pd.notnull(x)
-        else None
-    )
+    if "SOC" in occs_measures_df.columns:
+        # "SOC" is read as a string, but "{... 'name': nan}" causes issues with literal_eval
+        occs_measures_df["SOC"] = occs_measures_df["SOC"].apply(
+            lambda x: ast.literal_eval(x.replace("'name': nan", "'name': 'None'"))
+            if pd.notnull(x)
+            else None
+        )
 
-    # Separate out the SOC columns
-    for soc_columns in ["SOC_2020_EXT", "SOC_2020", "SOC_2010", "name"]:
-        occs_measures_df[soc_columns] = occs_measures_df["SOC"].apply(
-            lambda x: x[soc_columns] if (x and x != "None") else None
+        # Separate out the SOC columns
+        for soc_column, soc_key in [
+            ("SOC_2020_EXT", "SOC_2020_EXT"),
+            ("SOC_2020", "SOC_2020"),
+            ("SOC_2010", "SOC_2010"),
+            ("SOC_name", "name"),
+        ]:
+            occs_measures_df[soc_column] = occs_measures_df["SOC"].apply(
+                lambda x: x[soc_key] if (x and x != "None") else None
+            )
+        occs_measures_df = occs_measures_df.drop(columns=["SOC"])
+    else:
+        # The SOC codes are read as numbers and the SOC names as a string of a list
+        for soc_column in ["SOC_2020", "SOC_2010"]:
+            occs_measures_df[soc_column] = occs_measures_df[soc_column].apply(
+                lambda x: str(int(float(x))) if pd.notnull(x) else None
+            )
+        occs_measures_df["SOC_2020_EXT"] = occs_measures_df["SOC_2020_EXT"].apply(
+            lambda x: str(x) if pd.notnull(x) else None
+        )
+        occs_measures_df["SOC_name"] = occs_measures_df["SOC_name"].apply(
+            lambda x: safe_literal_eval(x) if isinstance(x, str) else None
         )
 
     occs_measures_df["GREEN TIMESHARE"] = occs_measures_df["GREEN TIMESHARE"].apply(
@@ -272,10 +292,8 @@ def merge_green_measures(
         len
     )
 
-    all_green_measures_df.drop(columns=["SOC"], inplace=True)
-
     all_green_measures_df.rename(
-        columns={"name": "SOC_names", job_id_col: "job_id"}, inplace=True
+        columns={"SOC_name": "SOC_names", job_id_col: "job_id"}, inplace=True
     )
     all_green_measures_df["SOC_2020_name"] = all_green_measures_df["SOC_2020"].map(
         soc_2020_4_dict
@@ -398,14 +416,13 @@ def get_soc_info() -> dict:
 
 
 def add_green_topics(all_green_measures_df: pd.DataFrame) -> pd.DataFrame:
-    om = OccupationMeasures()
-    om.load()
+    soc_green_measures_dict = load_soc_green_measures_dict()
 
     all_green_measures_df["green_topics_lists"] = all_green_measures_df[
         "SOC_2010"
     ].apply(
-        lambda x: om.soc_green_measures_dict.get(x)["ONET_green_topics"]
-        if x in om.soc_green_measures_dict
+        lambda x: soc_green_measures_dict.get(x)["ONET_green_topics"]
+        if x in soc_green_measures_dict
         else None
     )
 
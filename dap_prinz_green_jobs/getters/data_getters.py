@@ -1,4 +1,5 @@
 from fnmatch import fnmatch
+import io
 import json
 import pickle
 import gzip
@@ -105,12 +106,37 @@ def save_to_s3(bucket_name, output_var, output_file_dir):
         obj.put(Body=gzip.compress(json.dumps(output_var).encode()))
     elif fnmatch(output_file_dir, "*.txt"):
         obj.put(Body=output_var)
+    elif fnmatch(output_file_dir, "*.npy"):
+        buffer = io.BytesIO()
+        numpy.save(buffer, output_var)
+        obj.put(Body=buffer.getvalue())
     else:
         obj.put(Body=json.dumps(output_var, cls=CustomJsonEncoder))
 
     logger.info(f"Saved to s3://{bucket_name} + {output_file_dir} ...")
 
 
+def upload_file_to_s3(bucket_name, local_file_path, output_file_dir):
+    """
+    Upload a local file to S3 as it is, e.g. for binary files save_to_s3 doesn't support
+    """
+    get_s3_resource().Bucket(bucket_name).upload_file(local_file_path, output_file_dir)
+
+    logger.info(
+        f"Uploaded {local_file_path} to s3://{bucket_name} + {output_file_dir} ..."
+    )
+
+
+def download_file_from_s3(bucket_name, file_name, local_file_path):
+    """
+    Download a file from S3 to local_file_path as it is
+    """
+    local_dir = os.path.dirname(local_file_path)
+    if local_dir:
+        os.makedirs(local_dir, exist_ok=True)
+    get_s3_resource().Bucket(bucket_name).download_file(file_name, local_file_path)
+
+
 def load_s3_json(s3, bucket_name, file_name):
     """
     Load a file from S3 without relying on the file_name extension
@@ -154,9 +180,11 @@ def load_s3_data(bucket_name, file_name):
     elif fnmatch(file_name, "*.pkl") or fnmatch(file_name, "*.pickle"):
         file = obj.get()["Body"].read().decode()
         return pickle.loads(file)
+    elif fnmatch(file_name, "*.npy"):
+        return numpy.load(io.BytesIO(obj.get()["Body"].read()))
     else:
         logger.error(
-            'Function not supported for file type other than "*.csv", "*.parquet", "*.jsonl.gz", "*.jsonl", or "*.json"'
+            'Function not supported for file type other than "*.csv", "*.parquet", "*.jsonl.gz", "*.jsonl", "*.json" or "*.npy"'
         )
 
 
@@ -0,0 +1,104 @@
+"""
+Compare the company description classifier run with ONNX Runtime (classifier_backend="onnx"
+or "onnx-int8") to the classifier run with PyTorch (classifier_backend="torch").
+
+The sentences used are the reasonable length sentences in a sample of the mixed OJO job adverts,
+preprocessed in the same way as in SicMapper.extract_company_descriptions. For each backend we
+output the time taken to label the sentences and how often its labels agree with the PyTorch labels.
+
+    python dap_prinz_green_jobs/pipeline/evaluation/company_description_classifier_onnx_agreement.py --sample_size 1000
+"""
+
+from argparse import ArgumentParser
+import random
+import time
+
+from dap_prinz_green_jobs.getters.data_getters import save_to_s3
+from dap_prinz_green_jobs.getters.ojo_getters import get_mixed_ojo_sample
+from dap_prinz_green_jobs import BUCKET_NAME, logger
+from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_mapper import (
+    SicMapper,
+)
+from dap_prinz_green_jobs.utils.onnx_models import ONNX_BACKENDS
+
+agreement_output_path = "outputs/data/labelled_job_adverts/evaluation/industries/company_description_classifier_onnx_agreement.json"
+
+
+def label_agreement(torch_labels: dict, onnx_labels: dict) -> dict:
+    """
+    Calculate how often the company description labels from the two backends agree.
+    """
+    confusion = {
+        "both_company": 0,
+        "both_not_company": 0,
+        "only_torch_company": 0,
+        "only_onnx_company": 0,
+    }
+    for sentence, torch_label in torch_labels.items():
+        onnx_label = onnx_labels[sentence]
+        if torch_label and onnx_label:
+            confusion["both_company"] += 1
+        elif not torch_label and not onnx_label:
+            confusion["both_not_company"] += 1
+        elif torch_label:
+            confusion["only_torch_company"] += 1
+        else:
+            confusion["only_onnx_company"] += 1
+
+    num_sentences = len(torch_labels)
+    return {
+        "num_sentences": num_sentences,
+        "agreement": (confusion["both_company"] + confusion["both_not_company"])
+        / num_sentences,
+        **confusion,
+    }
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--sample_size", type=int, default=1000)
+    parser.add_argument("--random_seed", type=int, default=42)
+
+    args = parser.parse_args()
+
+    sm = SicMapper()
+    # Don't use the cached labels, so every backend labels every sentence
+    sm.company_description_cache = None
+
+    mixed_ojo = (
+        get_mixed_ojo_sample()
+        .drop_duplicates(subset="description")
+        .sample(frac=1, random_state=args.random_seed)[: args.sample_size]
+    )
+    job_adverts = [
+        {sm.job_id_key: job_id, sm.job_description_key: description}
+        for job_id, description in zip(mixed_ojo["id"], mixed_ojo["description"])
+    ]
+    sentences = sorted(
+        set(
+            sentence
+            for job_advert in sm.preprocess_job_adverts(job_adverts)
+            for sentence in job_advert[f"{sm.job_description_key}_sentences"]
+            if 10 < len(sentence) < 300
+        )
+    )
+    random.Random(args.random_seed).shuffle(sentences)
+    logger.info(f"Labelling {len(sentences)} unique sentences with each backend")
+
+    labels = {}
+    times = {}
+    for backend in ["torch"] + ONNX_BACKENDS:
+        sm.classifier_backend = backend
+        sm.company_description_classifier = sm.load_company_description_classifier()
+        t0 = time.time()
+        labels[backend] = sm.predict_company_descriptions(sentences)
+        times[backend] = time.time() - t0
+    sm.close()
+
+    agreement_results = {"torch_seconds": times["torch"]}
+    for backend in ONNX_BACKENDS:
+        agreement_results[backend] = label_agreement(labels["torch"], labels[backend])
+        agreement_results[backend]["seconds"] = times[backend]
+        logger.info(f"{backend} backend: {agreement_results[backend]}")
+
+    save_to_s3(BUCKET_NAME, agreement_results, agreement_output_path)
@@ -0,0 +1,57 @@
+"""
+Benchmark how the job advert filtering step at the start of SicMapper.get_sic_codes
+(SicMapper.get_hard_coded_sic_codes) scales with the number of job adverts.
+
+Synthetic job adverts are used, a small proportion of which mention a company with a
+hard coded SIC code. The time per 1000 job adverts should stay roughly constant as the
+number of job adverts increases.
+
+    python dap_prinz_green_jobs/pipeline/evaluation/sicmapper_job_filtering_benchmark.py
+"""
+
+import random
+import time
+
+from dap_prinz_green_jobs import logger
+from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_mapper import (
+    SicMapper,
+)
+
+batch_sizes = [1000, 10000, 100000]
+
+
+def create_job_adverts(num_job_adverts: int, job_id_key: str, job_text_key: str):
+    hard_coded_companies = ["Menzies Distribution", "SaintGobain"]
+    job_adverts = []
+    for i in range(num_job_adverts):
+        if random.random() < 0.05:
+            company = random.choice(hard_coded_companies)
+        else:
+            company = f"company {random.randint(0, num_job_adverts)}"
+        job_adverts.append(
+            {
+                job_id_key: str(i),
+                job_text_key: f"At {company}, we are looking for a driver to join our team. "
+                * 20,
+            }
+        )
+    return job_adverts
+
+
+if __name__ == "__main__":
+    random.seed(42)
+
+    sm = SicMapper()
+    sm.load()
+
+    for batch_size in batch_sizes:
+        job_adverts = create_job_adverts(
+            batch_size, sm.job_id_key, sm.job_description_key
+        )
+        t0 = time.time()
+        sic_codes, job_adverts_to_predict = sm.get_hard_coded_sic_codes(job_adverts)
+        seconds = time.time() - t0
+        logger.info(
+            f"{batch_size} job adverts ({len(sic_codes)} hard coded, {len(job_adverts_to_predict)} to predict) took {seconds:.3f} seconds, {1000 * seconds / batch_size:.4f} seconds per 1000 job adverts"
+        )
+    sm.close()
@@ -0,0 +1,81 @@
+"""
+Compare the SOCMapper using the fast static embeddings encoder (encoder="static") to
+the SOCMapper using the full transformer model (encoder="transformer").
+
+The job titles used are those in the SOCMapper evaluation samples created in
+socmapper_evaluation_sample.py. For each sample we output the time taken to map the
+job titles and how often the two encoders agree on the SOC found.
+
+    python dap_prinz_green_jobs/pipeline/evaluation/socmapper_static_embeddings_benchmark.py
+"""
+
+import time
+
+from dap_prinz_green_jobs.getters.data_getters import load_s3_data, save_to_s3
+from dap_prinz_green_jobs import BUCKET_NAME, logger
+from dap_prinz_green_jobs.pipeline.green_measures.occupations.soc_map import SOCMapper
+
+evaluation_sample_paths = {
+    "common": "outputs/data/labelled_job_adverts/evaluation/occupations/soc_evaluation_sample.csv",
+    "random": "outputs/data/labelled_job_adverts/evaluation/occupations/soc_evaluation_random_sample.csv",
+}
+benchmark_output_path = "outputs/data/labelled_job_adverts/evaluation/occupations/soc_static_embeddings_benchmark.json"
+
+
+def soc_agreement(transformer_socs: list, static_socs: list) -> dict:
+    """
+    Calculate how often the SOCs found with the two encoders agree.
+    Not finding a SOC with both encoders counts as agreeing.
+    """
+
+    def soc_codes(soc):
+        # ((soc_2020_6, soc_2020_4, soc_2010), job_title) or None
+        return soc[0] if soc else (None, None, None)
+
+    num_job_titles = len(transformer_socs)
+    soc_2020_4_agree = 0
+    soc_2020_6_agree = 0
+    for transformer_soc, static_soc in zip(transformer_socs, static_socs):
+        transformer_codes = soc_codes(transformer_soc)
+        static_codes = soc_codes(static_soc)
+        if transformer_codes[1] == static_codes[1]:
+            soc_2020_4_agree += 1
+        if transformer_codes[0] == static_codes[0]:
+            soc_2020_6_agree += 1
+
+    return {
+        "num_job_titles": num_job_titles,
+        "soc_2020_4_agreement": soc_2020_4_agree / num_job_titles,
+        "soc_2020_6_agreement": soc_2020_6_agree / num_job_titles,
+        "transformer_prop_found": sum([1 for s in transformer_socs if s])
+        / num_job_titles,
+        "static_prop_found": sum([1 for s in static_socs if s]) / num_job_titles,
+    }
+
+
+if __name__ == "__main__":
+    soc_mappers = {}
+    for encoder in ["transformer", "static"]:
+        soc_mappers[encoder] = SOCMapper(encoder=encoder)
+        soc_mappers[encoder].load(save_embeds=True)
+
+    benchmark_results = {}
+    for sample_name, sample_path in evaluation_sample_paths.items():
+        job_titles = load_s3_data(BUCKET_NAME, sample_path)["ojo_job_title"].tolist()
+
+        socs = {}
+        times = {}
+        for encoder, soc_mapper in soc_mappers.items():
+            t0 = time.time()
+            socs[encoder] = soc_mapper.get_soc(job_titles)
+            times[encoder] = time.time() - t0
+
+        benchmark_results[sample_name] = soc_agreement(
+            socs["transformer"], socs["static"]
+        )
+        benchmark_results[sample_name]["transformer_seconds"] = times["transformer"]
+        benchmark_results[sample_name]["static_seconds"] = times["static"]
+
+        logger.info(f"{sample_name} sample: {benchmark_results[sample_name]}")
+
+    save_to_s3(BUCKET_NAME, benchmark_results, benchmark_output_path)
@@ -12,9 +12,14 @@ from dap_prinz_green_jobs.pipeline.green_measures.industries.industries_measures
 from dap_prinz_green_jobs.pipeline.green_measures.skills.skill_measures_utils import (
     SkillMeasures,
 )
+from dap_prinz_green_jobs.pipeline.green_measures.prepared_adverts import (
+    PreparedAdvert,
+    prepare_job_adverts,
+)
+from dap_prinz_green_jobs.utils.processing import load_concurrently
 from dap_prinz_green_jobs import PROJECT_DIR
 
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Union
 import yaml
 import os
 from datetime import datetime as date
@@ -39,9 +44,13 @@ class GreenMeasures(object):
         for a given job advert or list of job adverts, extract occupation-level green measures.
     get_industry_measures(job_advert):
         for a given job advert or list of job adverts, extract industry-level green measures.
+    prepare_job_adverts(job_advert):
+        for a given job advert or list of job adverts, clean the text and job titles once for all the measures.
     get_green_measures(job_advert, skill_list=None):
         for a given job advert or list of job adverts, extract skill-, occupation- and industry-level green measures.
             you can also pass a skill list to avoid re-extracting skills.
+    close():
+        stop any processes started by the industry measures (if multi_process is set in the config).
     """
 
     def __init__(self, config_name: str = "base", skills_output_folder: str = ""):
@@ -109,25 +118,54 @@ class GreenMeasures(object):
         self.job_text_key = self.config["job_adverts"]["job_text_key"]
         self.job_title_key = self.config["job_adverts"]["job_title_key"]
         self.company_name_key = self.config["job_adverts"]["company_name_key"]
+        self.text_cleaning_n_jobs = self.config["industries"]["text_cleaning_n_jobs"]
 
         # Occupation attributes
         self.om = OccupationMeasures()
-        self.om.load()
 
         # Industry attributes
         self.im = IndustryMeasures()
-        self.im.load()
 
         # Skills attributes
         self.sm = SkillMeasures(
             config_name="extract_green_skills_esco",
             green_skills_classifier_model_file_name=self.green_skills_classifier_model_file_name,
         )
-        self.sm.initiate_extract_skills(local=False, verbose=True)
+
+        # The occupation, industry and skills models and datasets are independent,
+        # so are loaded at the same time
+        _, load_times = load_concurrently(
+            {
+                "occupation measures": self.om.load,
+                "industry measures": self.im.load,
+                "skill measures": lambda: self.sm.initiate_extract_skills(
+                    local=False, verbose=True
+                ),
+            }
+        )
+        # How long each dataset took to load, in seconds
+        self.load_times = {**load_times, **self.om.load_times, **self.im.load_times}
+
+    def prepare_job_adverts(
+        self, job_advert: Union[Dict[str, str], List[Dict[str, str]]]
+    ) -> Dict[str, PreparedAdvert]:
+        """
+        Prepare the text of the job adverts once for the skill, industry and occupation measures
+        (see prepared_adverts.py)
+        """
+
+        return prepare_job_adverts(
+            job_advert,
+            job_id_key=self.job_id_key,
+            job_text_key=self.job_text_key,
+            job_title_key=self.job_title_key,
+            n_jobs=self.text_cleaning_n_jobs,
+        )
 
     def get_skill_measures(
         self,
         job_advert: Optional[Dict[str, str]] = None,
+        prepared_adverts: Optional[Dict[str, PreparedAdvert]] = None,
     ) -> List[dict]:
         if type(job_advert) == dict:
             job_advert = [job_advert]
@@ -146,11 +184,16 @@ class GreenMeasures(object):
             skill_embeddings_output_path=self.skill_embeddings_output,
             load_skills_embeddings=self.load_skills_embeddings,
             skill_mappings_output_path=self.skill_mappings_output_path,
+            prepared_adverts=prepared_adverts,
         )
 
         return prop_green_skills
 
-    def get_occupation_measures(self, job_advert: Dict[str, str]) -> List[dict]:
+    def get_occupation_measures(
+        self,
+        job_advert: Dict[str, str],
+        prepared_adverts: Optional[Dict[str, PreparedAdvert]] = None,
+    ) -> List[dict]:
         """
         Extract measures of greenness at the occupation-level. Measures include:
             - GREEN CATEGORY: O*NET green occupation categorisation
@@ -176,7 +219,22 @@ class GreenMeasures(object):
                 False
             ), "No job titles found in job advert. Have you specified the correct job title key?"
 
-        job_title_2_match = self.om.precalculate_soc_mapper(unique_job_titles)
+        clean_job_titles = None
+        if prepared_adverts is not None:
+            job_title_2_clean = {
+                job[self.job_title_key]: prepared_adverts[
+                    job[self.job_id_key]
+                ].job_title_clean
+                for job in job_advert
+                if self.job_title_key in job
+            }
+            clean_job_titles = [
+                job_title_2_clean[job_title] for job_title in unique_job_titles
+            ]
+
+        job_title_2_match = self.om.precalculate_soc_mapper(
+            unique_job_titles, clean_job_titles=clean_job_titles
+        )
         occ_green_measures_list = self.om.get_measures(
             job_adverts=job_advert, job_title_key=self.job_title_key
         )
@@ -184,14 +242,15 @@ class GreenMeasures(object):
             zip([j[self.job_id_key] for j in job_advert], occ_green_measures_list)
         )
 
-        soc_name_dict = {
-            "soc_2020_6": self.om.soc_mapper.soc_2020_6_dict,
-            "soc_2020_4": self.om.soc_mapper.soc_2020_4_dict,
-        }
+        soc_name_dict = self.om.get_soc_names()
 
         return green_occupation_measures_dict, soc_name_dict
 
-    def get_industry_measures(self, job_advert: Dict[str, str]) -> List[dict]:
+    def get_industry_measures(
+        self,
+        job_advert: Dict[str, str],
+        prepared_adverts: Optional[Dict[str, PreparedAdvert]] = None,
+    ) -> List[dict]:
         """
         Extract measures of greenness at the industry-level. Measures include:
             - INDUSTRY: SIC GHG emissions based on job advert company name
@@ -199,7 +258,9 @@ class GreenMeasures(object):
         if isinstance(job_advert, dict):
             job_advert = [job_advert]
 
-        ind_green_measures_dict = self.im.get_measures(job_advert)
+        ind_green_measures_dict = self.im.get_measures(
+            job_advert, prepared_adverts=prepared_adverts
+        )
 
         return ind_green_measures_dict
 
@@ -212,17 +273,36 @@ class GreenMeasures(object):
             - skills: green skill %, green skill count and the extracted green skills
             - occupations: O*NET green occupation categorisation and whether occupation name is considered green or not green
             - industry: random choice green or not green
+
+        The job adverts are only cleaned once for all the measures (see prepare_job_adverts).
         """
+        if isinstance(job_advert, dict):
+            job_advert = [job_advert]
+
+        prepared_adverts = self.prepare_job_adverts(job_advert)
+
         green_measures_dict = {}
 
         green_measures_dict["SKILL MEASURES"] = self.get_skill_measures(
-            job_advert=job_advert
+            job_advert=job_advert, prepared_adverts=prepared_adverts
         )
         green_measures_dict["INDUSTRY MEASURES"] = self.get_industry_measures(
-            job_advert=job_advert
+            job_advert=job_advert, prepared_adverts=prepared_adverts
         )
         green_measures_dict["OCCUPATION MEASURES"] = self.get_occupation_measures(
-            job_advert=job_advert
+            job_advert=job_advert, prepared_adverts=prepared_adverts
         )
 
         return green_measures_dict
+
+    def close(self):
+        """
+        Stop any pool of processes started to embed company descriptions for the industry measures.
+        """
+        self.im.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
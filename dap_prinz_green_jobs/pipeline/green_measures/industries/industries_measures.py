@@ -11,14 +11,15 @@ Usage:
     im.load() #load the relevant green industries datasets and SicMapper class
 
     im.get_measures(job_ads) #get the measures for the job advert
+    im.close() #stop any processes used to embed the company descriptions
 
     >>  {1: {'SIC': '62012',
   'SIC_name': 'Business and domestic software development',
   'SIC_confidence': 0.62,
   'SIC_method': 'closest distance',
   'company_description': 'This company sits in the software engineering industry..',
-  'INDUSTRY TOTAL GHG EMISSIONS': 254,
-  'INDUSTRY GHG PER UNIT EMISSIONS': 0,
+  'INDUSTRY TOTAL GHG EMISSIONS': 254.0,
+  'INDUSTRY GHG PER UNIT EMISSIONS': 0.0,
   'INDUSTRY PROP HOURS GREEN TASKS': 9.700000000000001,
   'INDUSTRY PROP WORKERS GREEN TASKS': 43.5,
   'INDUSTRY PROP WORKERS 20PERC GREEN TASKS': 23.599999999999998,
@@ -32,25 +33,19 @@ import pandas as pd
 
 from dap_prinz_green_jobs import PROJECT_DIR, logger
 
-# load industry-level green job measures from yaml file
-from dap_prinz_green_jobs.getters.industry_getters import (
-    load_green_tasks_prop_hours,
-    load_green_tasks_prop_workers,
-    load_green_tasks_prop_workers_20,
-)
+from dap_prinz_green_jobs.utils.processing import load_concurrently
 
-from dap_prinz_green_jobs.pipeline.green_measures.industries.industries_measures_utils import (
-    get_clean_ghg_data,
-    get_clean_employee_emissions_data,
-    create_section_dict,
-    get_ghg_sic,
+from dap_prinz_green_jobs.pipeline.green_measures.industries.industry_measures_table import (
+    build_industry_measures_table,
+    load_industry_measures_datasets,
+    load_industry_measures_table,
 )
 
 from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_mapper import (
     SicMapper,
 )
-from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_mapper_utils import (
-    clean_sic,
+from dap_prinz_green_jobs.pipeline.green_measures.prepared_adverts import (
+    PreparedAdvert,
 )
 
 
@@ -65,6 +60,9 @@ class IndustryMeasures(object):
 
     majority_sic_threshold: float
         Threshold for the majority SIC code confidence.
+
+    config_name: str
+        Name of the config file to use. Default is "base.yaml".
     ----------
     Methods
     ----------
@@ -73,6 +71,8 @@ class IndustryMeasures(object):
     get_measures(job_advert):
         For a given job advert (dict) or list of job adverts (list of dicts),
             extract the industry-level green measures.
+    close():
+        Stops the SIC mapper's pool of processes (if it uses multi_process).
     ----------
     Usage:
 
@@ -82,6 +82,7 @@ class IndustryMeasures(object):
 
     im.load()
     im.get_measures(job_ads)
+    im.close()
     """
 
     def __init__(
@@ -90,47 +91,108 @@ class IndustryMeasures(object):
         majority_sic_threshold: float = 0.3,
         use_gpu: bool = False,
         chunk_size: int = 100,
+        config_name: str = "base",
     ):
         self.closest_distance_threshold = (closest_distance_threshold,)
         self.majority_sic_threshold = majority_sic_threshold
         self.use_gpu = use_gpu
         self.chunk_size = chunk_size
 
+        if ".yaml" not in config_name:
+            config_name += ".yaml"
+        self.config_name = config_name
+        with open(
+            os.path.join(PROJECT_DIR, "dap_prinz_green_jobs/config/", config_name), "r"
+        ) as f:
+            self.config = yaml.load(f, Loader=yaml.FullLoader)
+        self.industry_measures_table_path = self.config["industries"][
+            "industry_measures_table_path"
+        ]
+        self.sic_levels = self.config["industries"]["sic_levels"]
+        # The ONS industry datasets, only loaded if a SIC code isn't in the industry measures table
+        self.industry_measures_datasets = None
+
     def load(self):
         """
         Method to load necessary SIC mapper class and
-            Industry-level greenness datasets.
+            Industry-level greenness datasets, at the same time.
+        """
+
+        def load_sic_mapper():
+            sm = SicMapper(
+                config_name=self.config_name,
+                use_gpu=self.use_gpu,
+                chunk_size=self.chunk_size,
+            )
+            sm.load()
+            return sm
+
+        # The SIC mapper and the industry measures are independent, so are loaded at the same time
+        loaded, load_times = load_concurrently(
+            {
+                "SIC mapper": load_sic_mapper,
+                # Table of the industry-level greenness measures for every SIC code
+                # (see industry_measures_table.py)
+                "industry measures table": lambda: load_industry_measures_table(
+                    self.industry_measures_table_path, sic_levels=self.sic_levels
+                ),
+            }
+        )
+        self.sm = loaded["SIC mapper"]
+        self.industry_measures_table = loaded["industry measures table"]
+        # How long each dataset took to load, in seconds
+        self.load_times = {**self.sm.load_times, **load_times}
+
+    def close(self):
+        """
+        Stops the SIC mapper's pool of processes for embedding company descriptions,
+            if it uses multi_process and load() has been called.
         """
-        self.sm = SicMapper(use_gpu=self.use_gpu, chunk_size=self.chunk_size)
-        self.sm.load()
+        if hasattr(self, "sm"):
+            self.sm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
 
         # can tune the thresholds here
         self.sm.closest_distance_threshold = self.closest_distance_threshold
         self.sm.majority_sic_threshold = self.majority_sic_threshold
 
-        # Dictionary of SIC codes and total GHG emissions and GHG emissions per unit of economy activity
-        self.ghg_emissions_dict, self.ghg_unit_emissions_dict = get_clean_ghg_data()
-        # Dictionary of SIC codes and GHG emissions and carbon dioxide emissions per employee
-        (
-            self.ghg_employee_dict,
-            self.carbon_employee_dict,
-        ) = get_clean_employee_emissions_data()
-        # Dictionary of SIC sector (e.g. "A") to proportion of hours worked spent doing green tasks
-        self.sic_section_2_prop_hours = create_section_dict(
-            load_green_tasks_prop_hours()
-        )
-        # Dictionary of SIC sector (e.g. "A") to proportion of workers doing green tasks
-        self.sic_section_2_prop_workers = create_section_dict(
-            load_green_tasks_prop_workers()
-        )
-        # Dictionary of SIC sector (e.g. "A") to proportion of workers spending at least 20% of
-        # their time doing green tasks per SIC
-        self.sic_section_2_prop_workers_20 = create_section_dict(
-            load_green_tasks_prop_workers_20()
-        )
+    def add_sic_codes_to_table(self, sic_codes: List[str]):
+        """Adds any SIC codes which aren't in the industry measures table to it (e.g. SIC codes
+        from Companies House which aren't in the ONS SIC dataset), finding their measures from
+        the ONS industry datasets in the same way as the rest of the table.
+
+        Args:
+            sic_codes (List[str]): SIC codes given by the SIC mapper
+        """
+        missing_sic_codes = [
+            sic_code
+            for sic_code in dict.fromkeys(sic_codes)
+            if sic_code and sic_code not in self.industry_measures_table.index
+        ]
+        if missing_sic_codes:
+            if self.industry_measures_datasets is None:
+                logger.info(
+                    f"{len(missing_sic_codes)} SIC codes aren't in the industry measures table - loading the ONS industry datasets ..."
+                )
+                self.industry_measures_datasets = load_industry_measures_datasets()
+            self.industry_measures_table = pd.concat(
+                [
+                    self.industry_measures_table,
+                    build_industry_measures_table(
+                        missing_sic_codes, **self.industry_measures_datasets
+                    ),
+                ]
+            )
 
     def get_measures(
-        self, job_adverts: Union[Dict[str, str], List[Dict[str, str]]]
+        self,
+        job_adverts: Union[Dict[str, str], List[Dict[str, str]]],
+        prepared_adverts: Dict[str, PreparedAdvert] = None,
     ) -> List[Dict[str, float]]:
         """Extract industry-level green measures for a given job advert
             or list of job adverts.
@@ -138,47 +200,42 @@ class IndustryMeasures(object):
         Args:
             job_adverts Union[Dict[str, str], List[Dict[str, str]]]: A job advert
                 as a dictionary or list of dictionaries.
+            prepared_adverts (Dict[str, PreparedAdvert]): If given, the already prepared job adverts
+                (see prepare_job_adverts) by job advert id.
 
         Returns:
             Dict[str, float]: Industry-level green measures
                 for a given job advert or list of job adverts.
         """
 
-        sic_codes = self.sm.get_sic_codes(job_adverts)
+        sic_codes = self.sm.get_sic_codes(
+            job_adverts, prepared_adverts=prepared_adverts
+        )
+
+        job_ids = list(sic_codes.keys())
+        self.add_sic_codes_to_table(
+            [sic_codes[job_id]["sic_code"] for job_id in job_ids]
+        )
+        # join the SIC codes to the industry measures table, with None for missing measures
+        industry_measures = self.industry_measures_table.reindex(
+            [sic_codes[job_id]["sic_code"] for job_id in job_ids]
+        )
+        industry_measures = industry_measures.astype(object).where(
+            industry_measures.notna(), None
+        )
 
         industry_measures_dict = {}
-        for job_id, sic_info in sic_codes.items():
-            sic_code = sic_info["sic_code"]
-            # clean sic code if not none else return none
-            sic_clean = clean_sic(sic_code) if sic_code else None
-            sic_section = self.sm.sic_to_section.get(sic_clean)
+        for job_id, job_industry_measures in zip(
+            job_ids, industry_measures.to_dict(orient="records")
+        ):
+            sic_info = sic_codes[job_id]
             industry_measures_dict[job_id] = {
-                "SIC": sic_code,
+                "SIC": sic_info["sic_code"],
                 "SIC_name": sic_info["sic_name"],
                 "SIC_confidence": sic_info["sic_confidence"],
                 "SIC_method": sic_info["sic_method"],
                 "company_description": sic_info["company_description"],
-                "INDUSTRY TOTAL GHG EMISSIONS": get_ghg_sic(
-                    sic_clean, self.ghg_emissions_dict
-                ),
-                "INDUSTRY GHG PER UNIT EMISSIONS": get_ghg_sic(
-                    sic_clean, self.ghg_unit_emissions_dict
-                ),
-                "INDUSTRY PROP HOURS GREEN TASKS": self.sic_section_2_prop_hours.get(
-                    sic_section
-                ),
-                "INDUSTRY PROP WORKERS GREEN TASKS": self.sic_section_2_prop_workers.get(
-                    sic_section
-                ),
-                "INDUSTRY PROP WORKERS 20PERC GREEN TASKS": self.sic_section_2_prop_workers_20.get(
-                    sic_section
-                ),
-                "INDUSTRY GHG EMISSIONS PER EMPLOYEE": self.ghg_employee_dict.get(
-                    sic_section
-                ),
-                "INDUSTRY CARBON DIOXIDE EMISSIONS PER EMPLOYEE": self.carbon_employee_dict.get(
-                    sic_section
-                ),
+                **job_industry_measures,
             }
 
         return industry_measures_dict
@@ -0,0 +1,205 @@
+"""
+A table of the industry measures for every SIC code, so IndustryMeasures can join job
+adverts' SIC codes to their industry measures rather than cleaning the ONS datasets on
+every load and looking up each job advert's measures one at a time.
+
+Each SIC code the SicMapper can give is resolved to its industry measures once, in the same
+way for any SIC code given by the SicMapper:
+    - the total GHG emissions and GHG emissions per unit of economic activity of the first
+        of its 2-, 3- and 4-digit codes in the ONS GHG datasets (see get_ghg_sic)
+    - the green task proportions and emissions per employee of its SIC section
+These SIC codes are the codes in the ONS SIC dataset (see industry_getters.load_sic), their
+prefixes at each of the SIC levels (the majority SIC codes given by find_majority_sics), and
+the hard coded SIC codes. SIC codes which aren't in the table (e.g. from Companies House) are
+resolved from the ONS datasets when they are first found (see IndustryMeasures.get_measures).
+
+The table is indexed by SIC code, with a float column for each measure (NaN if the measure
+isn't found for a SIC code).
+
+To build the table from the ONS datasets and save it to S3, run:
+
+    python dap_prinz_green_jobs/pipeline/green_measures/industries/industry_measures_table.py
+
+Usage:
+
+from dap_prinz_green_jobs.pipeline.green_measures.industries.industry_measures_table import load_industry_measures_table
+
+industry_measures_table = load_industry_measures_table("outputs/data/green_industries/industry_measures_table.parquet")
+industry_measures_table.loc["62012"]
+>>> INDUSTRY TOTAL GHG EMISSIONS                       254.0
+    INDUSTRY GHG PER UNIT EMISSIONS                      0.0
+    ...
+"""
+
+from typing import Dict, Iterable, List
+
+import pandas as pd
+
+from dap_prinz_green_jobs.getters.data_getters import load_s3_data, save_to_s3
+from dap_prinz_green_jobs.getters.industry_getters import (
+    load_green_tasks_prop_hours,
+    load_green_tasks_prop_workers,
+    load_green_tasks_prop_workers_20,
+)
+from dap_prinz_green_jobs.pipeline.green_measures.industries.industries_measures_utils import (
+    get_clean_ghg_data,
+    get_clean_employee_emissions_data,
+    create_section_dict,
+    get_ghg_sic,
+)
+from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_mapper_utils import (
+    clean_sic,
+    hard_coded_sics,
+    sic_to_section,
+)
+from dap_prinz_green_jobs import BUCKET_NAME, logger
+
+INDUSTRY_MEASURE_COLUMNS = [
+    "INDUSTRY TOTAL GHG EMISSIONS",
+    "INDUSTRY GHG PER UNIT EMISSIONS",
+    "INDUSTRY PROP HOURS GREEN TASKS",
+    "INDUSTRY PROP WORKERS GREEN TASKS",
+    "INDUSTRY PROP WORKERS 20PERC GREEN TASKS",
+    "INDUSTRY GHG EMISSIONS PER EMPLOYEE",
+    "INDUSTRY CARBON DIOXIDE EMISSIONS PER EMPLOYEE",
+]
+
+
+def build_industry_measures_table(
+    sic_codes: List[str],
+    sic_to_section: Dict[str, str],
+    ghg_emissions_dict: Dict[str, float],
+    ghg_unit_emissions_dict: Dict[str, float],
+    sic_section_2_prop_hours: Dict[str, float],
+    sic_section_2_prop_workers: Dict[str, float],
+    sic_section_2_prop_workers_20: Dict[str, float],
+    ghg_employee_dict: Dict[str, float],
+    carbon_employee_dict: Dict[str, float],
+) -> pd.DataFrame:
+    """Resolves each SIC code to its industry measures.
+
+    Args:
+        sic_codes (List[str]): The SIC codes to resolve, as given by the SicMapper
+        sic_to_section (Dict[str, str]): The SIC section of each cleaned SIC code
+        ghg_emissions_dict (Dict[str, float]): The total GHG emissions by SIC (see get_clean_ghg_data)
+        ghg_unit_emissions_dict (Dict[str, float]): The GHG emissions per unit of economic activity by SIC
+        sic_section_2_prop_hours (Dict[str, float]): The proportion of hours spent doing green tasks by SIC section
+        sic_section_2_prop_workers (Dict[str, float]): The proportion of workers doing green tasks by SIC section
+        sic_section_2_prop_workers_20 (Dict[str, float]): The proportion of workers spending at least 20% of
+            their time doing green tasks by SIC section
+        ghg_employee_dict (Dict[str, float]): The GHG emissions per employee by SIC section
+        carbon_employee_dict (Dict[str, float]): The carbon dioxide emissions per employee by SIC section
+
+    Returns:
+        pd.DataFrame: The industry measures (INDUSTRY_MEASURE_COLUMNS) of each SIC code, indexed by SIC code
+    """
+    industry_measures = {}
+    for sic_code in sic_codes:
+        sic_clean = clean_sic(sic_code) if sic_code else None
+        sic_section = sic_to_section.get(sic_clean)
+        industry_measures[sic_code] = [
+            get_ghg_sic(sic_clean, ghg_emissions_dict),
+            get_ghg_sic(sic_clean, ghg_unit_emissions_dict),
+            sic_section_2_prop_hours.get(sic_section),
+            sic_section_2_prop_workers.get(sic_section),
+            sic_section_2_prop_workers_20.get(sic_section),
+            ghg_employee_dict.get(sic_section),
+            carbon_employee_dict.get(sic_section),
+        ]
+
+    industry_measures_table = pd.DataFrame.from_dict(
+        industry_measures, orient="index", columns=INDUSTRY_MEASURE_COLUMNS
+    )
+    industry_measures_table.index.name = "SIC"
+
+    return industry_measures_table.apply(pd.to_numeric, errors="coerce").astype(
+        "float64"
+    )
+
+
+def get_sic_code_prefixes(sic_codes: Iterable[str], sic_levels: List[int]) -> List[str]:
+    """The distinct prefixes of the SIC codes at each of the SIC levels (e.g. "620" for "62012" at level 3)"""
+    return list(
+        dict.fromkeys(
+            sic_code[:sic_level]
+            for sic_level in sic_levels
+            for sic_code in sic_codes
+            if len(sic_code) >= sic_level
+        )
+    )
+
+
+def load_industry_measures_datasets() -> Dict[str, Dict[str, str]]:
+    """Loads the ONS datasets the industry measures are found from, as the keyword
+    arguments of build_industry_measures_table (other than sic_codes)
+    """
+    ghg_emissions_dict, ghg_unit_emissions_dict = get_clean_ghg_data()
+    ghg_employee_dict, carbon_employee_dict = get_clean_employee_emissions_data()
+
+    return {
+        "sic_to_section": sic_to_section,
+        "ghg_emissions_dict": ghg_emissions_dict,
+        "ghg_unit_emissions_dict": ghg_unit_emissions_dict,
+        "sic_section_2_prop_hours": create_section_dict(load_green_tasks_prop_hours()),
+        "sic_section_2_prop_workers": create_section_dict(
+            load_green_tasks_prop_workers()
+        ),
+        "sic_section_2_prop_workers_20": create_section_dict(
+            load_green_tasks_prop_workers_20()
+        ),
+        "ghg_employee_dict": ghg_employee_dict,
+        "carbon_employee_dict": carbon_employee_dict,
+    }
+
+
+def create_industry_measures_table(sic_levels: List[int] = [2, 3, 4]) -> pd.DataFrame:
+    """Builds the industry measures table from the ONS industry datasets for every SIC code
+    in the ONS SIC dataset, their prefixes at each of the SIC levels, and the hard coded SIC codes.
+    """
+    ons_sic_codes = list(sic_to_section.keys())
+    sic_codes = dict.fromkeys(
+        ons_sic_codes
+        + get_sic_code_prefixes(ons_sic_codes, sic_levels)
+        + list(hard_coded_sics.values())
+    )
+
+    return build_industry_measures_table(
+        sic_codes=list(sic_codes), **load_industry_measures_datasets()
+    )
+
+
+def load_industry_measures_table(
+    table_path: str = "outputs/data/green_industries/industry_measures_table.parquet",
+    save_table: bool = True,
+    sic_levels: List[int] = [2, 3, 4],
+) -> pd.DataFrame:
+    """
+    Load the industry measures table from S3. If it isn't there, build it from the ONS datasets.
+    """
+    try:
+        industry_measures_table = load_s3_data(BUCKET_NAME, table_path).set_index("SIC")
+    except:
+        logger.info(
+            "Industry measures table not found in S3 - building it from the ONS datasets ..."
+        )
+        industry_measures_table = create_industry_measures_table(sic_levels=sic_levels)
+        if save_table:
+            save_industry_measures_table_to_s3(industry_measures_table, table_path)
+
+    return industry_measures_table
+
+
+def save_industry_measures_table_to_s3(
+    industry_measures_table: pd.DataFrame, table_path: str
+):
+    save_to_s3(BUCKET_NAME, industry_measures_table.reset_index(), table_path)
+
+
+if __name__ == "__main__":
+    logger.info("Building the industry measures table ...")
+    industry_measures_table = create_industry_measures_table()
+    logger.info(f"{len(industry_measures_table)} SIC codes in the table")
+    save_industry_measures_table_to_s3(
+        industry_measures_table,
+        "outputs/data/green_industries/industry_measures_table.parquet",
+    )
@@ -0,0 +1,258 @@
+"""
+A compact index of cleaned Companies House company names to SIC codes, so the SicMapper
+can look up the SIC code of a job advert's company before predicting it from the job advert text.
+
+Rather than loading the Companies House data as Python objects, the index is stored as a few
+numpy arrays which are memory-mapped when loaded:
+    - names.npy: the UTF-8 encoded cleaned company names (see clean_company_name), sorted and concatenated
+    - name_offsets.npy: where each name starts (and the last one ends) in names.npy
+    - sic_codes.npy: the most common first SIC code of the companies with each cleaned name
+    - sic_proportions.npy: the proportion of the companies with each cleaned name which have this SIC code
+
+Placeholder SIC codes which don't say what a company does (e.g. 99999 "Dormant Company", see
+PLACEHOLDER_SIC_CODES) are left out, so company names which only have these aren't in the index.
+
+Names are found with a binary search over the sorted names.
+
+To build the index from the Companies House data and save it to S3, run:
+
+    python dap_prinz_green_jobs/pipeline/green_measures/industries/sic_mapper/companies_house_index.py
+
+Usage:
+
+from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.companies_house_index import CompaniesHouseIndex
+
+ch_index = CompaniesHouseIndex.load("outputs/data/green_industries/companies_house_index/")
+ch_index.get_sic("nesta")
+>>> ('72200', 1.0)
+"""
+
+import os
+from typing import Iterable, Tuple, Union
+
+from botocore.exceptions import ClientError
+import numpy as np
+import pandas as pd
+
+from dap_prinz_green_jobs.getters.data_getters import load_s3_data, save_to_s3
+from dap_prinz_green_jobs.getters.industry_getters import load_companies_house
+from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_mapper_utils import (
+    clean_company_name,
+    clean_sic,
+)
+from dap_prinz_green_jobs import BUCKET_NAME, PROJECT_DIR, logger
+
+# Companies House SIC codes which don't say what industry a company is in
+PLACEHOLDER_SIC_CODES = {
+    99999: "Dormant Company",
+    74990: "Non-trading company",
+    82990: "Other business support service activities not elsewhere classified",
+}
+
+COMPANIES_HOUSE_INDEX_FILES = [
+    "names",
+    "name_offsets",
+    "sic_codes",
+    "sic_proportions",
+]
+
+
+class CompaniesHouseIndex(object):
+    """
+    Class to look up the SIC code of a cleaned company name in Companies House.
+
+    :param names: The sorted UTF-8 encoded cleaned company names, concatenated
+    :type names: np.ndarray
+
+    :param name_offsets: Where each name starts in names, followed by the length of names
+    :type name_offsets: np.ndarray
+
+    :param sic_codes: The SIC code (as an integer) for each name
+    :type sic_codes: np.ndarray
+
+    :param sic_proportions: The proportion of the companies with each name which have this SIC code
+    :type sic_proportions: np.ndarray
+    """
+
+    def __init__(
+        self,
+        names: np.ndarray,
+        name_offsets: np.ndarray,
+        sic_codes: np.ndarray,
+        sic_proportions: np.ndarray,
+    ):
+        self.names = names
+        self.name_offsets = name_offsets
+        self.sic_codes = sic_codes
+        self.sic_proportions = sic_proportions
+
+    @classmethod
+    def from_companies_house(
+        cls,
+        companies_house: pd.DataFrame,
+        placeholder_sic_codes: Iterable[int] = PLACEHOLDER_SIC_CODES,
+    ):
+        """
+        Create the index from the Companies House data (see industry_getters.load_companies_house),
+        using the first SIC code given for each company. Companies with a placeholder SIC code
+        (e.g. dormant companies) are left out.
+        """
+
+        companies_house = pd.DataFrame(
+            {
+                "cleaned_name": companies_house["CompanyName"].map(
+                    clean_company_name, na_action="ignore"
+                ),
+                "sic_code": pd.to_numeric(
+                    companies_house["SICCode.SicText_1"].map(clean_sic),
+                    errors="coerce",
+                ),
+            }
+        ).dropna()
+        companies_house = companies_house[
+            ~companies_house["sic_code"].isin(list(placeholder_sic_codes))
+        ]
+
+        # The most common SIC code for each cleaned name (the lowest if there is a tie)
+        name_sics = (
+            companies_house.groupby(["cleaned_name", "sic_code"])
+            .size()
+            .rename("num_companies")
+            .reset_index()
+            .sort_values(
+                ["cleaned_name", "num_companies", "sic_code"],
+                ascending=[True, False, True],
+            )
+        )
+        name_sics["proportion"] = name_sics["num_companies"] / name_sics.groupby(
+            "cleaned_name"
+        )["num_companies"].transform("sum")
+        name_sics = name_sics.drop_duplicates("cleaned_name")
+
+        encoded_names = [name.encode() for name in name_sics["cleaned_name"]]
+        sort_order = sorted(range(len(encoded_names)), key=encoded_names.__getitem__)
+        encoded_names = [encoded_names[i] for i in sort_order]
+
+        return cls(
+            names=np.frombuffer(b"".join(encoded_names), dtype=np.uint8),
+            name_offsets=np.concatenate(
+                [[0], np.cumsum([len(name) for name in encoded_names])]
+            ).astype(np.int64),
+            sic_codes=name_sics["sic_code"].to_numpy(dtype=np.int32)[sort_order],
+            sic_proportions=name_sics["proportion"].to_numpy(dtype=np.float32)[
+                sort_order
+            ],
+        )
+
+    @classmethod
+    def load(cls, index_dir: str):
+        """Memory-map the index saved in index_dir"""
+        return cls(
+            **{
+                file_name: np.load(
+                    os.path.join(index_dir, f"{file_name}.npy"), mmap_mode="r"
+                )
+                for file_name in COMPANIES_HOUSE_INDEX_FILES
+            }
+        )
+
+    def save(self, index_dir: str):
+        os.makedirs(index_dir, exist_ok=True)
+        for file_name in COMPANIES_HOUSE_INDEX_FILES:
+            np.save(
+                os.path.join(index_dir, f"{file_name}.npy"), getattr(self, file_name)
+            )
+
+    def __len__(self):
+        return len(self.sic_codes)
+
+    def get_name(self, i: int) -> bytes:
+        return self.names[self.name_offsets[i] : self.name_offsets[i + 1]].tobytes()
+
+    def find(self, company_name: str) -> Union[int, None]:
+        """The position of a cleaned company name in the index, or None if it isn't in it"""
+        encoded_name = company_name.encode()
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_name(middle) < encoded_name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self.get_name(low) == encoded_name:
+            return low
+        return None
+
+    def get_sic(self, company_name: str) -> Union[Tuple[str, float], None]:
+        """
+        Get the SIC code of a cleaned company name and the proportion of the companies
+        with this name which have it, or None if the name isn't in Companies House.
+        """
+        if not company_name:
+            return None
+        i = self.find(company_name)
+        if i is None:
+            return None
+        sic_code = int(self.sic_codes[i])
+        # In case the index was built before placeholder SIC codes were left out
+        if sic_code in PLACEHOLDER_SIC_CODES:
+            return None
+        return f"{sic_code:05d}", float(self.sic_proportions[i])
+
+
+def load_companies_house_index(
+    index_dir: str = "outputs/data/green_industries/companies_house_index/",
+    save_index: bool = True,
+) -> CompaniesHouseIndex:
+    """
+    Load the Companies House index from PROJECT_DIR/index_dir, downloading it from S3 if it
+    isn't there. If it isn't in S3 either, build it from the Companies House data.
+    """
+
+    local_index_dir = os.path.join(PROJECT_DIR, index_dir)
+    if not all(
+        os.path.exists(os.path.join(local_index_dir, f"{file_name}.npy"))
+        for file_name in COMPANIES_HOUSE_INDEX_FILES
+    ):
+        try:
+            logger.info("Downloading the Companies House index from S3")
+            index = CompaniesHouseIndex(
+                **{
+                    file_name: load_s3_data(
+                        BUCKET_NAME, os.path.join(index_dir, f"{file_name}.npy")
+                    )
+                    for file_name in COMPANIES_HOUSE_INDEX_FILES
+                }
+            )
+        except ClientError as error:
+            if error.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                raise
+            logger.warning(
+                "Companies House index not found in S3 - rebuilding it from the full Companies House data, this will take a while ..."
+            )
+            index = CompaniesHouseIndex.from_companies_house(load_companies_house())
+            if save_index:
+                save_companies_house_index_to_s3(index, index_dir)
+        index.save(local_index_dir)
+
+    return CompaniesHouseIndex.load(local_index_dir)
+
+
+def save_companies_house_index_to_s3(index: CompaniesHouseIndex, index_dir: str):
+    for file_name in COMPANIES_HOUSE_INDEX_FILES:
+        save_to_s3(
+            BUCKET_NAME,
+            np.asarray(getattr(index, file_name)),
+            os.path.join(index_dir, f"{file_name}.npy"),
+        )
+
+
+if __name__ == "__main__":
+    logger.info("Building the Companies House index ...")
+    companies_house_index = CompaniesHouseIndex.from_companies_house(
+        load_companies_house()
+    )
+    logger.info(f"{len(companies_house_index)} cleaned company names in the index")
+    save_companies_house_index_to_s3(
+        companies_house_index, "outputs/data/green_industries/companies_house_index/"
+    )
@@ -0,0 +1,194 @@
+"""
+A persistent cache of whether sentences are company descriptions, so the company
+description classifier in SicMapper.extract_company_descriptions only needs to be run on
+sentences which haven't been seen before (recruiter boilerplate and company blurbs are
+repeated across many job adverts).
+
+The labels are stored in a SQLite database, keyed by the hash of the sentence and the
+fingerprint of the classifier model used to label it (see classifier_fingerprint), so
+labels from a different model won't be reused. The cache is bounded: once it has more
+than max_size sentences the least recently used ones are removed.
+
+Usage:
+
+from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.company_description_cache import (
+    CompanyDescriptionCache,
+    classifier_fingerprint,
+)
+
+cache = CompanyDescriptionCache("outputs/data/green_industries/company_description_cache.db", classifier_fingerprint("nestauk/jobbert-base-cased-compdecs"))
+cache.add_labels({"We are a leading retailer": True, "Apply now": False})
+cache.get_labels(["We are a leading retailer", "Great benefits"])
+>>> {'We are a leading retailer': True}
+cache.hit_rate()
+>>> 0.5
+"""
+
+import os
+import sqlite3
+import time
+from hashlib import md5
+from typing import Dict, List, Optional
+
+from dap_prinz_green_jobs.utils.processing import list_chunks
+from dap_prinz_green_jobs.utils.text_cleaning import short_hash
+from dap_prinz_green_jobs import logger
+
+# SQLite has a limit on the number of variables in one query
+SQLITE_MAX_VARIABLES = 900
+
+
+def classifier_fingerprint(model_path: str) -> str:
+    """A hash of the company description classifier model path"""
+    return md5(model_path.encode()).hexdigest()
+
+
+def get_sentence_hash(
+    sentence: str, sentence_hashes: Optional[Dict[str, int]] = None
+) -> int:
+    """The short_hash of a sentence, from sentence_hashes if it's in it"""
+    if sentence_hashes and sentence in sentence_hashes:
+        return sentence_hashes[sentence]
+    return short_hash(sentence)
+
+
+class CompanyDescriptionCache(object):
+    """
+    Class to store and retrieve whether sentences are company descriptions.
+
+    :param db_path: The path to the SQLite database, this will be created if it doesn't exist
+    :type db_path: str
+
+    :param fingerprint: The fingerprint of the classifier used to label the sentences
+    :type fingerprint: str
+
+    :param max_size: The maximum number of sentences to keep in the cache
+    :type max_size: int
+    """
+
+    def __init__(self, db_path: str, fingerprint: str, max_size: int = 5000000):
+        self.db_path = db_path
+        self.fingerprint = fingerprint
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        # The connection can be made in a loading thread (see load_concurrently), but it is only
+        # used by one thread at a time
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS company_description_labels (
+                fingerprint TEXT NOT NULL,
+                sentence_hash INTEGER NOT NULL,
+                is_company INTEGER NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (fingerprint, sentence_hash)
+            )
+            """
+        )
+        self.connection.execute(
+            """
+            CREATE INDEX IF NOT EXISTS company_description_labels_last_used
+            ON company_description_labels (last_used)
+            """
+        )
+        self.connection.commit()
+
+    def get_labels(
+        self, sentences: List[str], sentence_hashes: Optional[Dict[str, int]] = None
+    ) -> Dict[str, bool]:
+        """
+        Get the cached labels for the sentences. Sentences which haven't been cached
+        with this fingerprint won't be in the output. The short_hash of (some of) the
+        sentences can be given in sentence_hashes so they aren't hashed again.
+        """
+
+        hash_2_sentence = {
+            get_sentence_hash(sentence, sentence_hashes): sentence
+            for sentence in set(sentences)
+        }
+
+        cached_labels = {}
+        for hashes_chunk in list_chunks(list(hash_2_sentence), SQLITE_MAX_VARIABLES):
+            query = f"""
+                SELECT sentence_hash, is_company FROM company_description_labels
+                WHERE fingerprint = ? AND sentence_hash IN ({",".join("?" * len(hashes_chunk))})
+            """
+            for sentence_hash, is_company in self.connection.execute(
+                query, [self.fingerprint] + list(hashes_chunk)
+            ):
+                cached_labels[hash_2_sentence[sentence_hash]] = bool(is_company)
+
+        # Mark the cached sentences as recently used
+        last_used = time.time()
+        self.connection.executemany(
+            "UPDATE company_description_labels SET last_used = ? WHERE fingerprint = ? AND sentence_hash = ?",
+            [
+                (
+                    last_used,
+                    self.fingerprint,
+                    get_sentence_hash(sentence, sentence_hashes),
+                )
+                for sentence in cached_labels
+            ],
+        )
+        self.connection.commit()
+
+        self.hits += len(cached_labels)
+        self.misses += len(hash_2_sentence) - len(cached_labels)
+        logger.info(
+            f"Found cached company description labels for {len(cached_labels)} of {len(hash_2_sentence)} sentences"
+        )
+
+        return cached_labels
+
+    def add_labels(
+        self,
+        sentence_labels: Dict[str, bool],
+        sentence_hashes: Optional[Dict[str, int]] = None,
+    ):
+        """
+        Cache whether sentences are company descriptions, removing the least
+        recently used sentences if the cache is bigger than max_size
+        """
+
+        last_used = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO company_description_labels VALUES (?, ?, ?, ?)",
+            [
+                (
+                    self.fingerprint,
+                    get_sentence_hash(sentence, sentence_hashes),
+                    int(is_company),
+                    last_used,
+                )
+                for sentence, is_company in sentence_labels.items()
+            ],
+        )
+
+        (num_cached,) = self.connection.execute(
+            "SELECT COUNT(*) FROM company_description_labels"
+        ).fetchone()
+        if num_cached > self.max_size:
+            self.connection.execute(
+                """
+                DELETE FROM company_description_labels WHERE rowid IN (
+                    SELECT rowid FROM company_description_labels ORDER BY last_used LIMIT ?
+                )
+                """,
+                (num_cached - self.max_size,),
+            )
+        self.connection.commit()
+
+    def hit_rate(self) -> float:
+        """The proportion of sentences looked up which were in the cache"""
+        num_lookups = self.hits + self.misses
+        return self.hits / num_lookups if num_lookups else 0.0
+
+    def close(self):
+        self.connection.close()
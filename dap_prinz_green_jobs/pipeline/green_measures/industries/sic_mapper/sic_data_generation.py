@@ -30,6 +30,9 @@ from dap_prinz_green_jobs.getters.data_getters import save_to_s3
 import yaml
 
 from dap_prinz_green_jobs.utils.bert_vectorizer import BertVectorizer
+from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_description_index import (
+    build_sic_description_index,
+)
 
 load_dotenv()  # load the openAI key
 
@@ -210,14 +213,15 @@ if __name__ == "__main__":
     )
 
     bert_model_name = f"sentence-transformers/{config['industries']['bert_model_name']}"
-    bert_model = BertVectorizer(
+    with BertVectorizer(
         bert_model_name=bert_model_name,
         multi_process=config["industries"]["multi_process"],
-    ).fit()
-
-    sic_embeds = bert_model.transform(
-        list(sic_df_grouped.sic_company_description.tolist())
-    )
+        num_workers=config["industries"]["multi_process_workers"],
+        multi_process_chunk_size=config["industries"]["multi_process_chunk_size"],
+    ).fit() as bert_model:
+        sic_embeds = bert_model.transform(
+            list(sic_df_grouped.sic_company_description.tolist())
+        )
     # save the embeddings to s3
     sic_comp_desc_embeds_path = config["industries"]["sic_comp_desc_embeds_path"]
     data_outputs_path = config["job_adverts"]["data_folder_name"]
@@ -227,3 +231,11 @@ if __name__ == "__main__":
         sic_embeds,
         os.path.join(data_outputs_path, "green_industries", sic_comp_desc_embeds_path),
     )
+
+    logger.info("saving the normalised FAISS index of the SIC embeddings...")
+    build_sic_description_index(
+        sic_embeds,
+        sic_df_grouped_dict,
+        os.path.join(data_outputs_path, "green_industries"),
+        sic_comp_desc_embeds_path,
+    )
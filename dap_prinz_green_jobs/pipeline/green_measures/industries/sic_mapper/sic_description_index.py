@@ -0,0 +1,192 @@
+"""
+The FAISS index of SIC company description embeddings the SicMapper searches, and the
+SIC code of each company description in it.
+
+The index is built once from the SIC company description embeddings (with the vectors
+normalised so the inner product is the cosine similarity, as it is for the normalised
+queries) and saved with faiss.write_index, along with the SIC codes as a numpy array. These
+are then memory-mapped when the SicMapper is loaded, rather than parsing the embeddings
+JSON and adding them to a new index on every start.
+
+The files are named after the embeddings file they were built from, e.g.
+    20230911_sic_company_descriptions_embeds_production_True_chunksize_50.faiss
+    20230911_sic_company_descriptions_embeds_production_True_chunksize_50_sic_codes.npy
+
+The index is built when the SIC company description embeddings are generated (see sic_data_generation.py).
+To build it from the embeddings in base.yaml and save it to S3, run:
+
+    python dap_prinz_green_jobs/pipeline/green_measures/industries/sic_mapper/sic_description_index.py
+
+Usage:
+
+from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_description_index import load_sic_description_index
+
+sic_db, sic_codes = load_sic_description_index("outputs/data/green_industries/")
+"""
+
+import os
+from typing import Dict, List, Tuple
+
+import faiss
+import numpy as np
+import yaml
+
+from dap_prinz_green_jobs.getters.data_getters import (
+    download_file_from_s3,
+    load_s3_data,
+    upload_file_to_s3,
+)
+from dap_prinz_green_jobs import BUCKET_NAME, PROJECT_DIR, logger
+
+# Memory-map the index vectors rather than reading them into memory
+# (IO_FLAG_MMAP_IFC is needed for flat indexes in newer versions of faiss)
+SIC_DESCRIPTION_INDEX_IO_FLAGS = (
+    faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) | faiss.IO_FLAG_READ_ONLY
+)
+
+
+def get_sic_description_index_file_names(
+    sic_comp_desc_embeds_file_name: str,
+) -> Tuple[str, str]:
+    """The file names of the FAISS index and SIC codes built from an embeddings file"""
+    file_name_stem = os.path.splitext(sic_comp_desc_embeds_file_name)[0]
+    return f"{file_name_stem}.faiss", f"{file_name_stem}_sic_codes.npy"
+
+
+def create_normalised_index(embeddings: np.ndarray) -> faiss.IndexFlatIP:
+    """Creates a FAISS inner product index of the normalised embeddings
+
+    Args:
+        embeddings (np.ndarray): Embeddings to put in the index.
+
+    Returns:
+        faiss.IndexFlatIP: A FAISS index.
+    """
+    logger.info(f"Creating FAISS index for vectors...")
+    embeddings = np.array(embeddings, dtype=np.float32)
+    faiss.normalize_L2(embeddings)  # normalise to use cosine distance
+    index = faiss.IndexFlatIP(embeddings.shape[1])
+    index.add(embeddings)
+
+    return index
+
+
+def get_sic_description_codes(
+    sic_company_descriptions: List[Dict[str, str]]
+) -> np.ndarray:
+    """The (first) cleaned SIC code of each SIC company description"""
+    return np.array(
+        [
+            str(sic_company_description["sic_code"][0]).strip()
+            for sic_company_description in sic_company_descriptions
+        ]
+    )
+
+
+def build_sic_description_index(
+    sic_comp_desc_embeds: np.ndarray,
+    sic_company_descriptions: List[Dict[str, str]],
+    data_dir: str,
+    sic_comp_desc_embeds_file_name: str,
+    upload: bool = True,
+):
+    """Builds the SIC company description index and saves it to PROJECT_DIR/data_dir,
+    and to data_dir in S3 if upload is True.
+
+    Args:
+        sic_comp_desc_embeds (np.ndarray): The SIC company description embeddings.
+        sic_company_descriptions (List[Dict[str, str]]): The SIC company descriptions, in the same order.
+        data_dir (str): The directory to save the index in.
+        sic_comp_desc_embeds_file_name (str): The name of the embeddings file, which the index files are named after.
+        upload (bool): Whether to upload the index to S3.
+    """
+    if len(sic_comp_desc_embeds) != len(sic_company_descriptions):
+        raise ValueError("There must be an embedding for every SIC company description")
+    index = create_normalised_index(sic_comp_desc_embeds)
+    sic_codes = get_sic_description_codes(sic_company_descriptions)
+
+    for file_name in get_sic_description_index_file_names(
+        sic_comp_desc_embeds_file_name
+    ):
+        local_file_path = os.path.join(PROJECT_DIR, data_dir, file_name)
+        os.makedirs(os.path.dirname(local_file_path), exist_ok=True)
+        if file_name.endswith(".faiss"):
+            faiss.write_index(index, local_file_path)
+        else:
+            np.save(local_file_path, sic_codes)
+        if upload:
+            upload_file_to_s3(
+                BUCKET_NAME, local_file_path, os.path.join(data_dir, file_name)
+            )
+
+
+def load_sic_description_index(
+    data_dir: str = "outputs/data/green_industries/",
+    sic_comp_desc_path: str = "20230911_sic_company_descriptions_dict_production_True_chunksize_50.json",
+    sic_comp_desc_embeds_path: str = "20230911_sic_company_descriptions_embeds_production_True_chunksize_50.json",
+    save_index: bool = True,
+) -> Tuple[faiss.Index, np.ndarray]:
+    """
+    Memory-map the SIC company description index from PROJECT_DIR/data_dir, downloading it
+    from data_dir in S3 if it isn't there. If it isn't in S3 either, build it from the
+    SIC company descriptions and their embeddings in S3.
+
+    Args:
+        data_dir (str): The directory the index is saved in.
+        sic_comp_desc_path (str): The name of the SIC company descriptions file.
+        sic_comp_desc_embeds_path (str): The name of the SIC company description embeddings file.
+        save_index (bool): Whether to upload the index to S3 if it is built.
+
+    Returns:
+        Tuple[faiss.Index, np.ndarray]: The FAISS index, and the SIC code of each vector in it.
+    """
+    file_names = get_sic_description_index_file_names(sic_comp_desc_embeds_path)
+    local_file_paths = [
+        os.path.join(PROJECT_DIR, data_dir, file_name) for file_name in file_names
+    ]
+    if not all(os.path.exists(file_path) for file_path in local_file_paths):
+        try:
+            logger.info("Downloading the SIC company description index from S3")
+            for file_name, local_file_path in zip(file_names, local_file_paths):
+                download_file_from_s3(
+                    BUCKET_NAME, os.path.join(data_dir, file_name), local_file_path
+                )
+        except:
+            logger.info(
+                "SIC company description index not found in S3 - building it from the SIC company description embeddings ..."
+            )
+            build_sic_description_index(
+                load_s3_data(
+                    BUCKET_NAME, os.path.join(data_dir, sic_comp_desc_embeds_path)
+                ),
+                load_s3_data(BUCKET_NAME, os.path.join(data_dir, sic_comp_desc_path)),
+                data_dir,
+                sic_comp_desc_embeds_path,
+                upload=save_index,
+            )
+
+    index_path, sic_codes_path = local_file_paths
+    index = faiss.read_index(index_path, SIC_DESCRIPTION_INDEX_IO_FLAGS)
+    sic_codes = np.load(sic_codes_path)
+
+    return index, sic_codes
+
+
+if __name__ == "__main__":
+    config_path = os.path.join(PROJECT_DIR, "dap_prinz_green_jobs/config/base.yaml")
+    with open(config_path, "r") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+
+    data_dir = os.path.join(
+        config["job_adverts"]["data_folder_name"], "green_industries"
+    )
+    sic_comp_desc_path = config["industries"]["sic_comp_desc_path"]
+    sic_comp_desc_embeds_path = config["industries"]["sic_comp_desc_embeds_path"]
+
+    logger.info("Building the SIC company description index ...")
+    build_sic_description_index(
+        load_s3_data(BUCKET_NAME, os.path.join(data_dir, sic_comp_desc_embeds_path)),
+        load_s3_data(BUCKET_NAME, os.path.join(data_dir, sic_comp_desc_path)),
+        data_dir,
+        sic_comp_desc_embeds_path,
+    )
@@ -22,7 +22,7 @@ import faiss
 
 import os
 import yaml
-from typing import List, Union, Dict
+from typing import List, Union, Dict, Tuple
 
 from tqdm import tqdm
 import numpy as np
@@ -32,13 +32,39 @@ from transformers import pipeline
 import torch
 
 from dap_prinz_green_jobs import PROJECT_DIR, BUCKET_NAME, logger
-from dap_prinz_green_jobs.getters.data_getters import load_s3_data, load_json_dict
+from dap_prinz_green_jobs.getters.data_getters import (
+    load_s3_data,
+    load_json_dict,
+    download_file_from_s3,
+)
 from dap_prinz_green_jobs.getters.industry_getters import load_sic
 
 # utils imports
 from dap_prinz_green_jobs.utils.bert_vectorizer import BertVectorizer
+from dap_prinz_green_jobs.utils.processing import (
+    token_budget_batches,
+    load_concurrently,
+)
+from dap_prinz_green_jobs.utils.onnx_models import (
+    ONNX_BACKENDS,
+    load_onnx_text_classifier,
+)
 import dap_prinz_green_jobs.utils.text_cleaning as tc
+from dap_prinz_green_jobs.pipeline.green_measures.prepared_adverts import (
+    PreparedAdvert,
+)
 import dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_mapper_utils as su
+from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.companies_house_index import (
+    load_companies_house_index,
+)
+from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_description_index import (
+    create_normalised_index,
+    load_sic_description_index,
+)
+from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.company_description_cache import (
+    CompanyDescriptionCache,
+    classifier_fingerprint,
+)
 
 from toolz import partition_all
 
@@ -58,6 +84,8 @@ class SicMapper(object):
         Loads relevant models, tokenizers and datasets necessary for the SicMapper class.
     preprocess_job_advert(job_advert):
         Preprocesses a list of job adverts to extract the company description.
+    predict_company_descriptions(sentences):
+        Predicts whether sentences are company descriptions, batching them by length.
     extract_company_descriptions(preprocessed_job_adverts):
         Extracts the company description from a list of job adverts.
     get_company_description_embeddings(company_description_dict):
@@ -66,8 +94,28 @@ class SicMapper(object):
         Creates a FAISS index for the SIC company description embeddings.
     predict_sic_code(company_description):
         Predicts the SIC code for a company description.
+    predict_sic_codes(company_embeddings):
+        Predicts the SIC codes for many company description embeddings with one FAISS search.
+    resolve_sic_code(top_k_distances, top_k_indices):
+        Applies the closest distance and majority SIC rules to the FAISS search results.
+    resolve_sic_codes(top_k_distances, top_k_indices):
+        Applies the closest distance and majority SIC rules to many FAISS search results at once.
+    get_hard_coded_sic_codes(job_adverts):
+        Finds the hard coded SIC codes for job adverts, and the job adverts left to predict SIC codes for.
+    get_companies_house_sic_codes(job_adverts):
+        Finds the SIC codes for job adverts whose company name is in Companies House, and the job adverts left to predict SIC codes for.
+    get_company_sic_codes(job_adverts):
+        Finds the SIC codes for job adverts from companies in the company SIC cache, and the job adverts left to predict SIC codes for.
+    update_company_sic_cache(job_adverts, sic_codes):
+        Adds confident SIC code predictions to the company SIC cache.
+    add_company_descriptions(job_adverts, sic_codes):
+        Extracts the company descriptions of job adverts whose SIC code was found without them.
     get_sic_codes(preprocessed_job_adverts):
         Predicts the SIC code for a job advert or list of preprocessed job adverts.
+    predict_job_advert_sic_codes(job_adverts):
+        Predicts the SIC codes for job adverts from their company descriptions.
+    close():
+        Stops the pool of processes used to embed company descriptions if multi_process is set.
     ----------
     """
 
@@ -93,45 +141,68 @@ class SicMapper(object):
             logger.setLevel("ERROR")
         self.local = self.config["industries"]["local"]
         self.data_path = self.config["job_adverts"]["data_folder_name"]
-        # for now self.local downloads ALL files in the green_industries folder
-        # in a private bucket - we could change this later for people who don't access
-        # to the bucket and want to use SicMapper
+        # the green_industries folder in S3, which is downloaded to PROJECT_DIR
+        # as files are needed if self.local
+        self.s3_data_dir = os.path.join(self.data_path, "green_industries")
         if self.local:
-            self.data_dir = os.path.join(
-                PROJECT_DIR, self.data_path, "green_industries"
-            )
+            self.data_dir = os.path.join(PROJECT_DIR, self.s3_data_dir)
             logger.info(f"Loading data from {self.data_dir}/")
-            if not os.path.exists(self.data_dir):
-                logger.warning(
-                    "Neccessary data files are not downloaded. Downloading neccessary files..."
-                )
-                os.system(
-                    f"aws s3 sync s3://{BUCKET_NAME}/data {self.data_dir}/green_industries"
-                )
-            else:
-                # count the number of files in the directory to check if all files are there
-                file_num = len(
-                    [
-                        name
-                        for name in os.listdir(self.data_dir)
-                        if os.path.isfile(os.path.join(self.data_dir, name))
-                    ]
-                )
-                if file_num < 5:
-                    logger.warning(
-                        "Neccessary data files are not downloaded. Downloading neccessary files..."
-                    )
-                    os.system(
-                        f"aws s3 sync s3://{BUCKET_NAME}/outputs/data/green_industries {self.data_dir}"
-                    )
         else:
-            self.data_dir = os.path.join(self.data_path, "green_industries")
+            self.data_dir = self.s3_data_dir
             logger.info(f"Loading data from open {BUCKET_NAME} s3 bucket.")
         # get job id and job description keys
         self.job_id_key = self.config["job_adverts"]["job_id_key"]
         self.job_description_key = self.config["job_adverts"]["job_text_key"]
+        self.company_name_key = self.config["job_adverts"]["company_name_key"]
         # load company description classifier model name
         self.model_path = self.config["industries"]["model_path"]
+        # whether to run the company description classifier with PyTorch or ONNX Runtime
+        self.classifier_backend = self.config["industries"]["classifier_backend"]
+        if self.classifier_backend not in ["torch"] + ONNX_BACKENDS:
+            raise ValueError(
+                f"classifier_backend must be one of {['torch'] + ONNX_BACKENDS}, not {self.classifier_backend}"
+            )
+        self.classifier_onnx_dir = self.config["industries"]["classifier_onnx_dir"]
+        # where to cache the company description classifier labels for sentences
+        self.company_description_cache_path = self.config["industries"][
+            "company_description_cache_path"
+        ]
+        self.company_description_cache_max_size = self.config["industries"][
+            "company_description_cache_max_size"
+        ]
+        # the cache is created in load()
+        self.company_description_cache = None
+        # the maximum number of padded tokens in a company description classifier batch
+        self.classifier_token_budget = self.config["industries"][
+            "classifier_token_budget"
+        ]
+        # whether to look up company names in Companies House
+        self.use_companies_house_index = self.config["industries"][
+            "companies_house_index"
+        ]
+        self.companies_house_index_dir = self.config["industries"][
+            "companies_house_index_dir"
+        ]
+        self.companies_house_min_proportion = self.config["industries"][
+            "companies_house_min_proportion"
+        ]
+        # the index is loaded in load()
+        self.companies_house_index = None
+        # whether to reuse confident SIC predictions across job adverts from the same company
+        self.use_company_sic_cache = self.config["industries"]["company_sic_cache"]
+        self.company_sic_confidence_floor = self.config["industries"][
+            "company_sic_confidence_floor"
+        ]
+        # whether to extract the company descriptions of the job adverts which reuse a cached prediction
+        self.company_sic_cache_descriptions = self.config["industries"][
+            "company_sic_cache_descriptions"
+        ]
+        self.company_name_placeholders = set(
+            su.clean_company_name(name)
+            for name in self.config["industries"]["company_name_placeholders"]
+        )
+        # the cache is created in load()
+        self.company_sic_cache = None
         # load relevant information to map company descriptions to SIC codes
         self.sic_comp_desc_path = self.config["industries"]["sic_comp_desc_path"]
         # binary of whether to use companies house data or not as part of the sic
@@ -143,17 +214,36 @@ class SicMapper(object):
             "majority_sic_threshold"
         ]
         self.sic_levels = self.config["industries"]["sic_levels"]
+        self.text_cleaning_n_jobs = self.config["industries"]["text_cleaning_n_jobs"]
         self.sic_comp_desc_embeds_path = self.config["industries"][
             "sic_comp_desc_embeds_path"
         ]
         # load relevant information for BertVectorizer
         self.multi_process = self.config["industries"]["multi_process"]
+        self.multi_process_workers = self.config["industries"]["multi_process_workers"]
+        self.multi_process_chunk_size = self.config["industries"][
+            "multi_process_chunk_size"
+        ]
         self.bert_model_name = self.config["industries"]["bert_model_name"]
+        self.bert_backend = self.config["industries"]["bert_backend"]
         self.bert_model = BertVectorizer(
             multi_process=self.multi_process,
             bert_model_name=f"sentence-transformers/{self.bert_model_name}",
+            backend=self.bert_backend,
+            num_workers=self.multi_process_workers,
+            multi_process_chunk_size=self.multi_process_chunk_size,
         ).fit()
 
+    def close(self):
+        """Stops the BertVectorizer's pool of processes, if `self.multi_process` started one"""
+        self.bert_model.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
     def _fetch_data(self, file_name: str = None):
         """Wrapper to fetch data from local or s3.
 
@@ -166,6 +256,13 @@ class SicMapper(object):
         full_path = os.path.join(self.data_dir, file_name)
         if file_name.endswith(".json"):
             if self.local:
+                if not os.path.exists(full_path):
+                    logger.warning(f"{file_name} is not downloaded. Downloading...")
+                    download_file_from_s3(
+                        BUCKET_NAME,
+                        os.path.join(self.s3_data_dir, file_name),
+                        full_path,
+                    )
                 data = load_json_dict(full_path)
             else:
                 data = load_s3_data(BUCKET_NAME, full_path)
@@ -179,25 +276,34 @@ class SicMapper(object):
         Loads relevant models, tokenizers and datasets.
         """
         logger.info("Loading relevant models, tokenizers and datasets.")
-        # things you need to load
-        tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+        # things you need to load - these are independent, so are downloaded and parsed at the same time
+        loaders = {
+            "company description classifier": self.load_company_description_classifier,
+            # memory-map the FAISS index of the (normalised) SIC company description
+            # embeddings, and the SIC code of each company description in it
+            "SIC company description index": lambda: load_sic_description_index(
+                self.s3_data_dir,
+                self.sic_comp_desc_path,
+                self.sic_comp_desc_embeds_path,
+            ),
+            "SIC data": load_sic,
+        }
+        if self.use_companies_house_index:
+            loaders["Companies House index"] = lambda: load_companies_house_index(
+                self.companies_house_index_dir
+            )
+        loaded, self.load_times = load_concurrently(loaders)
 
-        device = torch.device(f"cuda:0" if torch.cuda.is_available() else "cpu")
-        model = AutoModelForSequenceClassification.from_pretrained(self.model_path).to(
-            device
-        )
-        self.company_description_classifier = pipeline(
-            "text-classification", model=model, tokenizer=tokenizer, device=device
+        self.company_description_classifier = loaded["company description classifier"]
+        self.sic_db, self.sic_description_codes = loaded[
+            "SIC company description index"
+        ]
+        # the SIC code prefixes at each SIC level, integer coded to count them with numpy
+        self.sic_description_prefixes = su.encode_sic_prefixes(
+            self.sic_description_codes, self.sic_levels
         )
 
-        self.sic_company_desc_dict = self._fetch_data(self.sic_comp_desc_path)
-        # load your SIC company description embeddings to put in a FAISS index
-        sic_embeds = self._fetch_data(self.sic_comp_desc_embeds_path)
-        self.sic_comp_desc_embeds = np.float32(np.array(sic_embeds))
-
-        self.sic_db = self.create_vector_index(self.sic_comp_desc_embeds)
-
-        sic_data = load_sic()
+        sic_data = loaded["SIC data"]
         self.sic_names = dict(
             zip(sic_data["Most disaggregated level"], sic_data["Description"])
         )
@@ -210,11 +316,67 @@ class SicMapper(object):
             ).items()
         }
 
+        if self.company_description_cache_path:
+            self.company_description_cache = CompanyDescriptionCache(
+                os.path.join(PROJECT_DIR, self.company_description_cache_path),
+                classifier_fingerprint(
+                    self.model_path
+                    if self.classifier_backend == "torch"
+                    else f"{self.model_path}_{self.classifier_backend}"
+                ),
+                max_size=self.company_description_cache_max_size,
+            )
+        else:
+            self.company_description_cache = None
+
+        self.companies_house_index = loaded.get("Companies House index")
+
+        if self.use_company_sic_cache:
+            # cleaned company name: SIC code information
+            self.company_sic_cache = {}
+            self.company_sic_cache_lookups = 0
+            self.company_sic_cache_hits = 0
+        else:
+            self.company_sic_cache = None
+
         # based on evaluation, we have hard coded for some companies
         self.hard_coded_sics = su.hard_coded_sics
+        self.hard_coded_sics_automaton = su.create_hard_coded_sics_automaton(
+            self.hard_coded_sics
+        )
+        # The number of job adverts each hard coded SIC rule has been used for
+        self.hard_coded_sic_counts = dict.fromkeys(self.hard_coded_sics, 0)
+
+    def load_company_description_classifier(self):
+        """Loads the company description classifier with the configured backend.
+
+        The "onnx" and "onnx-int8" backends run the classifier with ONNX Runtime on CPU,
+        exporting (and quantising) the model the first time they are used.
+        """
+        if self.classifier_backend in ONNX_BACKENDS:
+            logger.info(
+                f"Loading the company description classifier with the {self.classifier_backend} backend."
+            )
+            return load_onnx_text_classifier(
+                self.model_path,
+                os.path.join(PROJECT_DIR, self.classifier_onnx_dir),
+                quantize=self.classifier_backend == "onnx-int8",
+            )
+
+        tokenizer = AutoTokenizer.from_pretrained(self.model_path)
+
+        device = torch.device(f"cuda:0" if torch.cuda.is_available() else "cpu")
+        model = AutoModelForSequenceClassification.from_pretrained(self.model_path).to(
+            device
+        )
+        return pipeline(
+            "text-classification", model=model, tokenizer=tokenizer, device=device
+        )
 
     def preprocess_job_adverts(
-        self, job_adverts: List[Dict[str, str]]
+        self,
+        job_adverts: List[Dict[str, str]],
+        prepared_adverts: Dict[str, PreparedAdvert] = None,
     ) -> List[Dict[str, str]]:
         """Preprocesses a list of job adverts to extract the company description.
 
@@ -224,15 +386,35 @@ class SicMapper(object):
 
         Args:
             job_adverts (List[Dict[str, str]]]): A list of job adverts.
+            prepared_adverts (Dict[str, PreparedAdvert]): If given, the already prepared job adverts
+                (see prepare_job_adverts) by job advert id, which are used rather than cleaning the job adverts again.
 
         Returns:
             List[Dict[str, str]]: A job advert with a pre-processed job description.
         """
         logger.info(f"preprocessing {len(job_adverts)} job adverts...")
+        if prepared_adverts is not None:
+            preprocessed_job_adverts = []
+            for job_advert in job_adverts:
+                prepared_advert = prepared_adverts[job_advert[self.job_id_key]]
+                preprocessed_job_adverts.append(
+                    {
+                        self.job_id_key: job_advert[self.job_id_key],
+                        f"{self.job_description_key}_clean": prepared_advert.job_text_clean,
+                        f"{self.job_description_key}_sentences": prepared_advert.sentences,
+                        f"{self.job_description_key}_sentence_hashes": prepared_advert.sentence_hashes,
+                    }
+                )
+            return preprocessed_job_adverts
+
+        cleaned_job_descriptions = tc.clean_and_split_texts(
+            [job_advert[self.job_description_key] for job_advert in job_adverts],
+            n_jobs=self.text_cleaning_n_jobs,
+        )
         preprocessed_job_adverts = []
-        for job_advert in job_adverts:
-            job_description_clean = tc.clean_text(job_advert[self.job_description_key])
-            job_description_sentences = tc.split_sentences(job_description_clean)
+        for job_advert, (job_description_clean, job_description_sentences) in zip(
+            job_adverts, cleaned_job_descriptions
+        ):
             preprocessed_job_adverts.append(
                 {
                     self.job_id_key: job_advert[self.job_id_key],
@@ -242,6 +424,59 @@ class SicMapper(object):
             )
         return preprocessed_job_adverts
 
+    def predict_company_descriptions(
+        self, sentences: List[str], chunk_size: int = 100
+    ) -> Dict[str, bool]:
+        """Predicts whether each sentence is a company description.
+
+        If `self.classifier_token_budget` is set, the sentences are batched by their number of tokens
+        (see token_budget_batches) so similar length sentences are padded together, with at most
+        chunk_size sentences in a batch. Otherwise they are batched in the order given, in chunk_size
+        batches on GPU or one at a time on CPU.
+
+        Args:
+            sentences (List[str]): A list of sentences.
+            chunk_size (int): The (maximum) number of sentences to predict at once.
+
+        Returns:
+            Dict[str, bool]: Whether each sentence is a company description.
+        """
+        if not sentences:
+            return {}
+
+        if self.classifier_token_budget:
+            sentence_lengths = [
+                len(input_ids)
+                for input_ids in self.company_description_classifier.tokenizer(
+                    sentences
+                )["input_ids"]
+            ]
+            sentence_batches = [
+                [sentences[i] for i in batch_indices]
+                for batch_indices in token_budget_batches(
+                    sentence_lengths,
+                    max_tokens=self.classifier_token_budget,
+                    max_batch_size=chunk_size,
+                )
+            ]
+            batch_size = None
+        elif self.use_gpu:
+            sentence_batches = [sentences]
+            batch_size = chunk_size
+        else:
+            sentence_batches = list(partition_all(chunk_size, sentences))
+            batch_size = 1
+
+        sent_labels = {}
+        for sentence_batch in sentence_batches:
+            preds = self.company_description_classifier(
+                list(sentence_batch), batch_size=batch_size or len(sentence_batch)
+            )
+            for pred, sentence in zip(preds, sentence_batch):
+                sent_labels[sentence] = pred["label"] == "LABEL_1"
+
+        return sent_labels
+
     def extract_company_descriptions(
         self, preprocessed_job_adverts: List[Dict[str, str]], chunk_size=100
     ) -> List[Dict[str, str]]:
@@ -260,7 +495,15 @@ class SicMapper(object):
 
         # Get all the individual sentences per job advert
         job_ad_sents = {}
+        # The hashes of the sentences, if the job adverts were prepared (see prepare_job_adverts)
+        sent_hashes = {}
         for job_advert in preprocessed_job_adverts:
+            sent_hashes.update(
+                zip(
+                    job_advert[f"{self.job_description_key}_sentences"],
+                    job_advert.get(f"{self.job_description_key}_sentence_hashes", []),
+                )
+            )
             sents = []
             for sentence in job_advert[f"{self.job_description_key}_sentences"]:
                 if (
@@ -277,22 +520,29 @@ class SicMapper(object):
             f"...deduplicated to {len(all_sents)} unique sentences for processing ..."
         )
 
-        # Predict whether a sentence is a company description
-        sent_is_company = set()
-        if self.use_gpu:
-            preds = self.company_description_classifier(
-                all_sents, batch_size=chunk_size
+        # Predict whether a sentence is a company description, using the cached labels if there are any
+        sent_labels = {}
+        if self.company_description_cache:
+            sent_labels = self.company_description_cache.get_labels(
+                all_sents, sentence_hashes=sent_hashes
             )
-            for pred, sentence in zip(preds, all_sents):
-                if pred["label"] == "LABEL_1":
-                    sent_is_company.add(sentence)
-        else:
-            all_sents_chunks = list(partition_all(chunk_size, all_sents))
-            for sents_chunk in all_sents_chunks:
-                preds = self.company_description_classifier(list(sents_chunk))
-                for pred, sentence in zip(preds, sents_chunk):
-                    if pred["label"] == "LABEL_1":
-                        sent_is_company.add(sentence)
+        sents_to_predict = [sent for sent in all_sents if sent not in sent_labels]
+
+        new_sent_labels = self.predict_company_descriptions(
+            sents_to_predict, chunk_size=chunk_size
+        )
+
+        if self.company_description_cache:
+            self.company_description_cache.add_labels(
+                new_sent_labels, sentence_hashes=sent_hashes
+            )
+            logger.info(
+                f"Company description cache hit rate: {self.company_description_cache.hit_rate():.2f}"
+            )
+        sent_labels.update(new_sent_labels)
+        sent_is_company = set(
+            sentence for sentence, is_company in sent_labels.items() if is_company
+        )
 
         # Join all the information together
         company_descriptions = []
@@ -342,7 +592,8 @@ class SicMapper(object):
         return comp_embeds_dict
 
     def create_vector_index(self, sic_embeddings: np.ndarray) -> faiss.IndexFlatIP:
-        """Creates a FAISS index for a given set of embeddings.
+        """Creates a FAISS index for a given set of embeddings, normalising them
+            so the inner product is the cosine similarity.
 
         Args:
             embeddings (np.ndarray): Embeddings to put in the index.
@@ -350,14 +601,7 @@ class SicMapper(object):
         Returns:
             faiss.IndexFlatIP: A FAISS index.
         """
-        logger.info(f"Creating FAISS index for vectors...")
-        d = sic_embeddings.shape[1]  # define the dimensionality of the vectors
-        # lets use brute force L2
-        llm_index = faiss.IndexFlatIP(d)
-        # faiss.normalize_L2(sic_embeddings)  # normalise to use cosine distance
-        llm_index.add(sic_embeddings)  # add vectors to the index
-
-        return llm_index
+        return create_normalised_index(sic_embeddings)
 
     def predict_sic_code(self, company_embedding: np.ndarray) -> Union[str, None]:
         """Predicts the majority SIC code at a given level for a company description embedding.
@@ -368,137 +612,457 @@ class SicMapper(object):
         Returns:
             Union[str, None]: The predicted SIC code or None if not found.
         """
-        _vector = np.array([company_embedding])
-        faiss.normalize_L2(_vector)  # normalise to use cosine distance
 
-        D, I = self.sic_db.search(_vector, self.faiss_k)  # search
+        return self.predict_sic_codes(np.array([company_embedding]))[0]
 
-        closest_distance = D[0][0]
-        top_k_indices, top_k_distances = I[0], D[0]
+    def predict_sic_codes(
+        self, company_embeddings: np.ndarray
+    ) -> List[Tuple[Union[str, None], ...]]:
+        """Predicts the SIC codes for many company description embeddings, searching
+            the FAISS index for all of them at once.
 
-        if closest_distance > self.closest_distance_threshold:
-            sic_code_indx, sic_prob = top_k_indices[0], round(top_k_distances[0], 2)
-            sics = self.sic_company_desc_dict[sic_code_indx]["sic_code"]
-            sic_code = [str(code).strip() for code in sics][0]
-            sic_name = self.sic_names.get(sic_code)
-            sic_method = "closest distance"
+        Args:
+            company_embeddings (np.ndarray): An array of company description embeddings.
 
-        else:
-            std = np.std(D)
-            std_threshold = closest_distance + 2 * std  # Use a std threshold
-            top_dists = [d for d in top_k_distances if d < std_threshold]
-            top_sics = su.convert_indx_to_sic(
-                top_k_indices[: len(top_dists)], self.sic_company_desc_dict
-            )
+        Returns:
+            List[Tuple[Union[str, None], ...]]: The (sic_code, sic_prob, sic_method, sic_name)
+                for each company description embedding.
+        """
+        if len(company_embeddings) == 0:
+            return []
 
-            # find the majority sic at sic levels 2-,3- and 4-
-            top_candidate_sics = [
-                su.find_majority_sic(top_sics, lvl) for lvl in self.sic_levels
-            ]
-            all_maj_sics = {k: v for d in top_candidate_sics for k, v in d.items()}
-            sic_method = "majority SIC"
-
-            if all_maj_sics != {}:
-                sic_code = sorted(
-                    all_maj_sics.items(), key=lambda x: x[1], reverse=True
-                )[0][0]
-
-                # calculate the average distance of the top majority SIC
-                # make sure its above the majority SIC threshold
-                sic_prob = su.calculate_average_distance(sic_code, top_sics, top_dists)
-                sic_name = self.sic_names.get(sic_code)
-                if sic_prob < self.majority_sic_threshold:
-                    sic_code = None
-                    sic_prob = None
-                    sic_method = None
-                    sic_name = None
+        _vectors = np.array(company_embeddings, dtype=np.float32)
+        faiss.normalize_L2(_vectors)  # normalise to use cosine distance
 
-            else:
-                return None, None, None, None
+        D, I = self.sic_db.search(_vectors, self.faiss_k)  # search
 
-        return sic_code, sic_prob, sic_method, sic_name
+        return self.resolve_sic_codes(D, I)
 
-    def get_sic_codes(self, job_adverts: Union[Dict[str, str], List[Dict[str, str]]]):
-        """Finds the SIC code for a job advert or list of job adverts.
+    def resolve_sic_code(
+        self, top_k_distances: np.ndarray, top_k_indices: np.ndarray
+    ) -> Tuple[Union[str, None], ...]:
+        """Applies the closest distance and majority SIC rules to the FAISS search
+            results for one company description embedding.
 
         Args:
-            job_adverts (Union[Dict[str, str], List[Dict[str, str]]]): A job advert or list of job adverts.
+            top_k_distances (np.ndarray): The distances to the k closest SIC company descriptions.
+            top_k_indices (np.ndarray): The indices of the k closest SIC company descriptions.
 
         Returns:
-            List[int]: The predicted SIC code(s) associated to a job advert or list of job adverts.
+            Tuple[Union[str, None], ...]: The sic_code, sic_prob, sic_method and sic_name.
         """
+        return self.resolve_sic_codes(
+            np.array([top_k_distances]), np.array([top_k_indices])
+        )[0]
+
+    def resolve_sic_codes(
+        self, top_k_distances: np.ndarray, top_k_indices: np.ndarray
+    ) -> List[Tuple[Union[str, None], ...]]:
+        """Applies the closest distance and majority SIC rules to the FAISS search
+            results for many company description embeddings.
+
+        If the closest SIC company description is within the closest distance threshold, its
+            SIC code is used. Otherwise the majority SIC code at the SIC levels of the SIC company
+            descriptions within a std threshold is used, if its average distance is above the
+            majority SIC threshold. The majority SIC codes are found for all the search results
+            at once with the integer coded SIC code prefixes made in load().
 
-        if isinstance(job_adverts, dict):
-            job_adverts = [job_adverts]
+        Args:
+            top_k_distances (np.ndarray): The distances to the k closest SIC company descriptions, for each embedding.
+            top_k_indices (np.ndarray): The indices of the k closest SIC company descriptions, for each embedding.
+
+        Returns:
+            List[Tuple[Union[str, None], ...]]: The sic_code, sic_prob, sic_method and sic_name
+                for each embedding.
+        """
+        is_closest = top_k_distances[:, 0] > self.closest_distance_threshold
+        majority_sics = iter(
+            su.find_majority_sics(
+                top_k_distances[~is_closest],
+                top_k_indices[~is_closest],
+                self.sic_description_prefixes,
+            )
+        )
+
+        sic_codes = []
+        for closest, distances, indices in zip(
+            is_closest, top_k_distances, top_k_indices
+        ):
+            if closest:
+                sic_code = str(self.sic_description_codes[indices[0]])
+                sic_codes.append(
+                    (
+                        sic_code,
+                        round(distances[0], 2),
+                        "closest distance",
+                        self.sic_names.get(sic_code),
+                    )
+                )
+                continue
+            sic_code, sic_prob = next(majority_sics)
+            # make sure the majority SIC is above the majority SIC threshold
+            if sic_code is None or sic_prob < self.majority_sic_threshold:
+                sic_codes.append((None, None, None, None))
+            else:
+                sic_codes.append(
+                    (sic_code, sic_prob, "majority SIC", self.sic_names.get(sic_code))
+                )
 
+        return sic_codes
+
+    def get_hard_coded_sic_codes(
+        self, job_adverts: List[Dict[str, str]]
+    ) -> Tuple[Dict[str, Dict[str, str]], List[Dict[str, str]]]:
+        """Finds the hard coded SIC codes for job adverts where part of the job advert text
+            is in `self.hard_coded_sics`. If there are several, the first rule in `self.hard_coded_sics`
+            is used. The rules are checked in one pass over the text using `self.hard_coded_sics_automaton`,
+            and the number of times each rule is used is counted in `self.hard_coded_sic_counts`.
+
+        Args:
+            job_adverts (List[Dict[str, str]]): A list of job adverts.
+
+        Returns:
+            Tuple[Dict[str, Dict[str, str]], List[Dict[str, str]]]: The SIC code information for the
+                job adverts with hard coded SIC codes, and the job adverts (with text) left to predict SIC codes for.
+        """
         sic_codes = {}
-        job_ids_to_predict = []
-        # lets first hard code sic codes  if part of the company description is in `self.hard_coded_sics`
+        job_ids_to_predict = set()
         for job_ad in job_adverts:
             job_ad_text = job_ad.get(self.job_description_key)
             if job_ad_text:
-                sic_code = [
-                    v for k, v in self.hard_coded_sics.items() if k in job_ad_text
-                ]
-                if sic_code != []:
+                hard_coded_sic = su.find_hard_coded_sic(
+                    job_ad_text, self.hard_coded_sics_automaton
+                )
+                if hard_coded_sic:
+                    _, company_text, sic_code = hard_coded_sic
+                    self.hard_coded_sic_counts[company_text] += 1
                     sic_codes[job_ad.get(self.job_id_key)] = {
                         "company_description": None,
-                        "sic_code": sic_code[0],
-                        "sic_name": self.sic_names.get(sic_code[0]),
+                        "sic_code": sic_code,
+                        "sic_name": self.sic_names.get(sic_code),
                         "sic_method": "hard coded sic",
                         "sic_confidence": None,
                     }
                 else:
-                    job_ids_to_predict.append(job_ad.get(self.job_id_key))
+                    job_ids_to_predict.add(str(job_ad.get(self.job_id_key)))
 
-        if len(job_ids_to_predict) > 0:
-            logger.info(
-                f"{len(job_ids_to_predict)} job adverts don't have SIC codes associated to them in companies house..."
+        job_adverts_to_predict = [
+            job_ad
+            for job_ad in job_adverts
+            if str(job_ad.get(self.job_id_key)) in job_ids_to_predict
+        ]
+
+        return sic_codes, job_adverts_to_predict
+
+    def get_company_name_key(self, job_advert: Dict[str, str]) -> Union[str, None]:
+        """The cleaned company name of a job advert, or None if it doesn't have a usable one."""
+        return su.get_company_name_key(
+            job_advert.get(self.company_name_key), self.company_name_placeholders
+        )
+
+    def get_companies_house_sic_codes(
+        self, job_adverts: List[Dict[str, str]]
+    ) -> Tuple[Dict[str, Dict[str, str]], List[Dict[str, str]]]:
+        """Finds the SIC codes for job adverts whose (cleaned) company name is in Companies House,
+            if at least `self.companies_house_min_proportion` of the companies with that name have the SIC code.
+
+        Args:
+            job_adverts (List[Dict[str, str]]): A list of job adverts.
+
+        Returns:
+            Tuple[Dict[str, Dict[str, str]], List[Dict[str, str]]]: The SIC code information for the
+                job adverts found in Companies House, and the job adverts left to predict SIC codes for.
+        """
+        sic_codes = {}
+        job_adverts_to_predict = []
+        for job_ad in job_adverts:
+            companies_house_sic = self.companies_house_index.get_sic(
+                self.get_company_name_key(job_ad)
             )
-            logger.info(
-                f"predicting SIC code for {len(job_ids_to_predict)} job adverts..."
+            if (
+                companies_house_sic
+                and companies_house_sic[1] >= self.companies_house_min_proportion
+            ):
+                sic_code, sic_proportion = companies_house_sic
+                sic_codes[job_ad[self.job_id_key]] = {
+                    "company_description": None,
+                    "sic_code": sic_code,
+                    "sic_name": self.sic_names.get(sic_code),
+                    "sic_method": "companies house",
+                    "sic_confidence": round(sic_proportion, 2),
+                }
+            else:
+                job_adverts_to_predict.append(job_ad)
+
+        logger.info(
+            f"Found SIC codes in Companies House for {len(sic_codes)} of {len(job_adverts)} job adverts"
+        )
+
+        return sic_codes, job_adverts_to_predict
+
+    def get_company_sic_codes(
+        self, job_adverts: List[Dict[str, str]], count_lookups: bool = True
+    ) -> Tuple[Dict[str, Dict[str, str]], List[Dict[str, str]]]:
+        """Finds the SIC codes for job adverts from companies with a confident SIC prediction
+            in `self.company_sic_cache`, and counts the cache hits.
+
+        The company descriptions of these job adverts aren't extracted (they're None), unless
+            `self.company_sic_cache_descriptions` is set (see get_sic_codes and add_company_descriptions).
+
+        Args:
+            job_adverts (List[Dict[str, str]]): A list of job adverts.
+            count_lookups (bool): Whether to count these job adverts as cache lookups for the hit rate
+                (False if they have already been looked up).
+
+        Returns:
+            Tuple[Dict[str, Dict[str, str]], List[Dict[str, str]]]: The SIC code information for the
+                job adverts from cached companies, and the job adverts left to predict SIC codes for.
+        """
+        sic_codes = {}
+        job_adverts_to_predict = []
+        for job_ad in job_adverts:
+            company_name = self.get_company_name_key(job_ad)
+            if company_name:
+                if count_lookups:
+                    self.company_sic_cache_lookups += 1
+                if company_name in self.company_sic_cache:
+                    self.company_sic_cache_hits += 1
+                    sic_codes[job_ad[self.job_id_key]] = {
+                        "company_description": None,
+                        **self.company_sic_cache[company_name],
+                        "sic_method": "company cache",
+                    }
+                    continue
+            job_adverts_to_predict.append(job_ad)
+
+        return sic_codes, job_adverts_to_predict
+
+    def update_company_sic_cache(
+        self, job_adverts: List[Dict[str, str]], sic_codes: Dict[str, Dict[str, str]]
+    ):
+        """Adds the SIC codes predicted for job adverts to `self.company_sic_cache`
+        if their confidence is at least `self.company_sic_confidence_floor`.
+        Only the SIC code, name and confidence are cached, not the company description.
+        """
+        for job_ad in job_adverts:
+            company_name = self.get_company_name_key(job_ad)
+            sic_code_info = sic_codes.get(job_ad[self.job_id_key])
+            if (
+                company_name
+                and company_name not in self.company_sic_cache
+                and sic_code_info
+                and sic_code_info["sic_code"]
+                and sic_code_info["sic_confidence"] is not None
+                and sic_code_info["sic_confidence"] >= self.company_sic_confidence_floor
+            ):
+                self.company_sic_cache[company_name] = {
+                    "sic_code": sic_code_info["sic_code"],
+                    "sic_name": sic_code_info["sic_name"],
+                    "sic_confidence": sic_code_info["sic_confidence"],
+                }
+
+    def add_company_descriptions(
+        self,
+        job_adverts: List[Dict[str, str]],
+        sic_codes: Dict[str, Dict[str, str]],
+        prepared_adverts: Dict[str, PreparedAdvert] = None,
+    ):
+        """Extracts the company descriptions of job adverts whose SIC code was found without
+            them (e.g. from the company SIC cache), and adds them to their SIC code information.
+            The company descriptions aren't embedded or used to predict SIC codes.
+
+        Args:
+            job_adverts (List[Dict[str, str]]): A list of job adverts.
+            sic_codes (Dict[str, Dict[str, str]]): The SIC code information for each job advert,
+                which is updated in place.
+            prepared_adverts (Dict[str, PreparedAdvert]): If given, the already prepared job adverts
+                (see prepare_job_adverts) by job advert id.
+        """
+        if len(job_adverts) > 0:
+            for job_ad in self.extract_company_descriptions(
+                self.preprocess_job_adverts(
+                    job_adverts, prepared_adverts=prepared_adverts
+                )
+            ):
+                sic_codes[job_ad[self.job_id_key]]["company_description"] = job_ad[
+                    "company_description"
+                ]
+
+    def company_sic_cache_hit_rate(self) -> float:
+        """The proportion of job adverts with a usable company name which were found in the company SIC cache"""
+        if self.company_sic_cache_lookups == 0:
+            return 0.0
+        return self.company_sic_cache_hits / self.company_sic_cache_lookups
+
+    def get_sic_codes(
+        self,
+        job_adverts: Union[Dict[str, str], List[Dict[str, str]]],
+        prepared_adverts: Dict[str, PreparedAdvert] = None,
+    ):
+        """Finds the SIC code for a job advert or list of job adverts.
+
+        Job adverts with a hard coded SIC code are found first, then (if `self.companies_house_index`
+        is used) job adverts whose company name is in Companies House.
+        If `self.company_sic_cache` is used, confident SIC predictions are reused for the other
+        job adverts from the same company (by cleaned company name, with `sic_method="company cache"`),
+        without running the company description classifier on them, so their `company_description`
+        is None. If `self.company_sic_cache_descriptions` is set, their own company descriptions are
+        extracted (but not embedded or used to predict SIC codes). Job adverts from new companies
+        are predicted in two rounds - first one job advert per company, then the rest of the job
+        adverts from companies which didn't get a confident SIC prediction.
+
+        Args:
+            job_adverts (Union[Dict[str, str], List[Dict[str, str]]]): A job advert or list of job adverts.
+            prepared_adverts (Dict[str, PreparedAdvert]): If given, the already prepared job adverts
+                (see prepare_job_adverts) by job advert id.
+
+        Returns:
+            List[int]: The predicted SIC code(s) associated to a job advert or list of job adverts.
+        """
+
+        if isinstance(job_adverts, dict):
+            job_adverts = [job_adverts]
+
+        sic_codes, job_adverts = self.get_hard_coded_sic_codes(job_adverts)
+
+        if self.companies_house_index is not None:
+            companies_house_sic_codes, job_adverts = self.get_companies_house_sic_codes(
+                job_adverts
+            )
+            sic_codes.update(companies_house_sic_codes)
+
+        if self.company_sic_cache is not None:
+            job_adverts_to_look_up = job_adverts
+            company_sic_codes, job_adverts = self.get_company_sic_codes(job_adverts)
+            sic_codes.update(company_sic_codes)
+            cached_job_adverts = [
+                job_ad
+                for job_ad in job_adverts_to_look_up
+                if job_ad[self.job_id_key] in company_sic_codes
+            ]
+
+            # Predict one job advert per company first, so the rest can use the cache
+            first_job_adverts = []
+            later_job_adverts = []
+            seen_company_names = set()
+            for job_ad in job_adverts:
+                company_name = self.get_company_name_key(job_ad)
+                if company_name in seen_company_names:
+                    later_job_adverts.append(job_ad)
+                else:
+                    if company_name:
+                        seen_company_names.add(company_name)
+                    first_job_adverts.append(job_ad)
+
+            first_sic_codes = self.predict_job_advert_sic_codes(
+                first_job_adverts, prepared_adverts=prepared_adverts
             )
+            self.update_company_sic_cache(first_job_adverts, first_sic_codes)
+            sic_codes.update(first_sic_codes)
 
-            job_adverts = [
-                advert
-                for advert in job_adverts
-                if str(advert["id"]) in map(str, job_ids_to_predict)
+            company_sic_codes, job_adverts = self.get_company_sic_codes(
+                later_job_adverts, count_lookups=False
+            )
+            sic_codes.update(company_sic_codes)
+            cached_job_adverts += [
+                job_ad
+                for job_ad in later_job_adverts
+                if job_ad[self.job_id_key] in company_sic_codes
             ]
+            if self.company_sic_cache_descriptions:
+                self.add_company_descriptions(
+                    cached_job_adverts, sic_codes, prepared_adverts=prepared_adverts
+                )
 
-            preprocessed_job_adverts = self.preprocess_job_adverts(job_adverts)
+        sic_codes.update(
+            self.predict_job_advert_sic_codes(
+                job_adverts, prepared_adverts=prepared_adverts
+            )
+        )
+
+        if self.company_sic_cache is not None:
+            logger.info(
+                f"Company SIC cache hit rate: {self.company_sic_cache_hit_rate():.2f}"
+            )
+
+        return sic_codes
+
+    def predict_job_advert_sic_codes(
+        self,
+        job_adverts: List[Dict[str, str]],
+        prepared_adverts: Dict[str, PreparedAdvert] = None,
+    ) -> Dict[str, Dict[str, str]]:
+        """Predicts the SIC codes for job adverts from their company descriptions.
+
+        Args:
+            job_adverts (List[Dict[str, str]]): A list of job adverts.
+            prepared_adverts (Dict[str, PreparedAdvert]): If given, the already prepared job adverts
+                (see prepare_job_adverts) by job advert id.
+
+        Returns:
+            Dict[str, Dict[str, str]]: The SIC code information for each job advert.
+        """
+        sic_codes = {}
+        if len(job_adverts) > 0:
+            logger.info(
+                f"{len(job_adverts)} job adverts don't have SIC codes associated to them in companies house..."
+            )
+            logger.info(f"predicting SIC code for {len(job_adverts)} job adverts...")
+
+            preprocessed_job_adverts = self.preprocess_job_adverts(
+                job_adverts, prepared_adverts=prepared_adverts
+            )
 
             preprocessed_job_adverts_comp_desc = self.extract_company_descriptions(
                 preprocessed_job_adverts
             )
 
-            company_descriptions = list(
-                set(
-                    [
-                        job_advert["company_description"]
-                        for job_advert in preprocessed_job_adverts_comp_desc
-                    ]
+            # Hash each unique company description once
+            company_description_hashes = {
+                company_description: tc.short_hash(company_description)
+                for company_description in set(
+                    job_advert["company_description"]
+                    for job_advert in preprocessed_job_adverts_comp_desc
                 )
-            )
-            company_description_hashes = [
-                tc.short_hash(company_description)
-                for company_description in company_descriptions
-            ]
+            }
 
-            company_description_dict = dict(
-                zip(company_description_hashes, company_descriptions)
-            )
+            company_description_dict = {
+                company_desc_hash: company_description
+                for company_description, company_desc_hash in company_description_hashes.items()
+            }
 
             comp_embeds = self.get_company_description_embeddings(
                 company_description_dict
             )
 
+            # Predict the SIC code for all the (non-empty) company descriptions at once
+            company_desc_hashes_to_predict = [
+                company_desc_hash
+                for company_desc_hash, company_description in company_description_dict.items()
+                if company_description != ""
+            ]
+            company_desc_sic_codes = dict(
+                zip(
+                    company_desc_hashes_to_predict,
+                    self.predict_sic_codes(
+                        np.array(
+                            [
+                                comp_embeds[company_desc_hash]
+                                for company_desc_hash in company_desc_hashes_to_predict
+                            ]
+                        )
+                    ),
+                )
+            )
+
             for job_ad in preprocessed_job_adverts_comp_desc:
                 if job_ad["company_description"] != "":
-                    company_desc_hash = tc.short_hash(job_ad["company_description"])
-                    comp_embed = comp_embeds.get(company_desc_hash)
-                    sic_code, sic_prob, sic_method, sic_name = self.predict_sic_code(
-                        np.array(comp_embed)
-                    )
+                    company_desc_hash = company_description_hashes[
+                        job_ad["company_description"]
+                    ]
+                    sic_code, sic_prob, sic_method, sic_name = company_desc_sic_codes[
+                        company_desc_hash
+                    ]
                 else:
                     sic_code, sic_prob, sic_method, sic_name = None, None, None, None
                 sic_codes[job_ad[self.job_id_key]] = {
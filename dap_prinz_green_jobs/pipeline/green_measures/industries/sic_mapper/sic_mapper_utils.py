@@ -2,9 +2,10 @@
 Functions and variables to map company descriptions
     to SIC codes.
 """
-from typing import List, Dict
+from typing import List, Dict, Tuple, Union
 from dap_prinz_green_jobs.getters.industry_getters import load_sic
 
+import ahocorasick
 import numpy as np
 import re
 
@@ -112,6 +113,53 @@ def clean_sic(sic_name: str) -> str:
         return None
 
 
+def create_hard_coded_sics_automaton(
+    hard_coded_sics: Dict[str, str] = hard_coded_sics
+) -> ahocorasick.Automaton:
+    """Compiles the hard coded SIC rules into an Aho-Corasick automaton, so a text
+        can be checked against all of them in one pass.
+
+    Args:
+        hard_coded_sics (Dict[str, str]): Dictionary of text to look for and its SIC code
+
+    Returns:
+        ahocorasick.Automaton: An automaton where each text's value is (rule index, text, SIC code)
+    """
+    automaton = ahocorasick.Automaton()
+    for rule_index, (company_text, sic_code) in enumerate(hard_coded_sics.items()):
+        automaton.add_word(company_text, (rule_index, company_text, sic_code))
+    automaton.make_automaton()
+
+    return automaton
+
+
+def find_hard_coded_sic(
+    text: str, hard_coded_sics_automaton: ahocorasick.Automaton
+) -> Union[Tuple[int, str, str], None]:
+    """Finds the first hard coded SIC rule (in the order of hard_coded_sics) whose
+        text is in a job advert text.
+
+    Args:
+        text (str): The job advert text
+        hard_coded_sics_automaton (ahocorasick.Automaton): The output of create_hard_coded_sics_automaton
+
+    Returns:
+        Union[Tuple[int, str, str], None]: The (rule index, text, SIC code) of the first rule found, or None
+    """
+    if hard_coded_sics_automaton.kind != ahocorasick.AHOCORASICK:
+        # There are no rules
+        return None
+
+    first_match = None
+    for _, match in hard_coded_sics_automaton.iter(text):
+        if first_match is None or match[0] < first_match[0]:
+            first_match = match
+            if first_match[0] == 0:
+                break
+
+    return first_match
+
+
 def clean_company_name(
     name: str,
     word_mapper: dict = {},
@@ -277,3 +325,137 @@ def calculate_average_distance(
     ]
 
     return round(np.mean(top_sic_probs), 2)
+
+
+def encode_sic_prefixes(
+    sic_codes: np.ndarray, sic_levels: List[int]
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """Integer codes the first sic_level characters of SIC codes, for each SIC level.
+
+    Args:
+        sic_codes (np.ndarray): The SIC codes, e.g. of each SIC company description
+        sic_levels (List[int]): The lengths of SIC code to count in find_majority_sic
+
+    Returns:
+        List[Tuple[np.ndarray, np.ndarray]]: For each SIC level, the integer code of each SIC code's
+            prefix (-1 if the SIC code is shorter than the level) and the prefix of each integer code
+    """
+    sic_codes = np.asarray(sic_codes, dtype=str)
+    sic_code_lengths = np.char.str_len(sic_codes)
+
+    sic_prefixes = []
+    for sic_level in sic_levels:
+        if sic_level <= 0:
+            continue
+        prefix_ids = np.full(len(sic_codes), -1, dtype=np.int32)
+        is_long_enough = sic_code_lengths >= sic_level
+        prefixes, prefix_ids[is_long_enough] = np.unique(
+            sic_codes[is_long_enough].astype(f"<U{sic_level}"), return_inverse=True
+        )
+        sic_prefixes.append((prefix_ids, prefixes))
+
+    return sic_prefixes
+
+
+def find_majority_sics(
+    top_k_distances: np.ndarray,
+    top_k_indices: np.ndarray,
+    sic_prefixes: List[Tuple[np.ndarray, np.ndarray]],
+    batch_size: int = 1024,
+) -> List[Tuple[Union[str, None], Union[float, None]]]:
+    """Finds the majority SIC code and its average distance for many FAISS search results at once.
+
+    This gives the same results as applying find_majority_sic at each SIC level to the
+        SIC codes closer than the std threshold, taking the most common (at the lowest level
+        and first found if there is a tie) and calculate_average_distance, but counts the
+        SIC code prefixes with numpy.
+
+    Args:
+        top_k_distances (np.ndarray): The distances to the k closest SIC company descriptions, for each search
+        top_k_indices (np.ndarray): The indices of the k closest SIC company descriptions, for each search
+        sic_prefixes (List[Tuple[np.ndarray, np.ndarray]]): The SIC code prefixes of each
+            SIC company description, for each SIC level (see encode_sic_prefixes)
+        batch_size (int): The number of searches to count prefixes for at a time
+
+    Returns:
+        List[Tuple[Union[str, None], Union[float, None]]]: The majority SIC code and its average distance
+            for each search, or (None, None) if no SIC code prefix is found more than once
+    """
+    top_k_distances = np.asarray(top_k_distances)
+    top_k_indices = np.asarray(top_k_indices)
+    k = top_k_distances.shape[1]
+    # whether the ith result is before the jth
+    is_earlier = np.tri(k, k, -1, dtype=bool)
+
+    majority_sics = []
+    for start in range(0, len(top_k_distances), batch_size):
+        distances = top_k_distances[start : start + batch_size]
+        indices = top_k_indices[start : start + batch_size]
+
+        std_thresholds = distances[:, 0] + 2 * np.std(distances, axis=1)
+        is_top_dist = distances < std_thresholds[:, None]
+        # the top SIC codes are the first (not necessarily the closer) len(top_dists) results
+        is_top_sic = np.arange(k) < is_top_dist.sum(axis=1)[:, None]
+
+        level_prefix_ids = []
+        level_counts = []
+        for prefix_ids, _ in sic_prefixes:
+            top_prefix_ids = np.where(is_top_sic, prefix_ids[indices], -1)
+            is_same = (top_prefix_ids[:, :, None] == top_prefix_ids[:, None, :]) & (
+                top_prefix_ids[:, None, :] >= 0
+            )
+            counts = is_same.sum(axis=2)
+            # only count each prefix at its first position, and only if it's found more than once
+            is_first = (top_prefix_ids >= 0) & ~(is_same & is_earlier).any(axis=2)
+            level_prefix_ids.append(top_prefix_ids)
+            level_counts.append(np.where(is_first & (counts > 1), counts, 0))
+
+        if not level_counts:
+            majority_sics += [(None, None)] * len(distances)
+            continue
+
+        # the most common prefix, at the lowest level and first position if there is a tie
+        level_counts = np.stack(level_counts, axis=1).reshape(len(distances), -1)
+        majority_positions = level_counts.argmax(axis=1)
+        has_majority = level_counts.max(axis=1) > 0
+
+        for i, (majority_position, majority_found) in enumerate(
+            zip(majority_positions, has_majority)
+        ):
+            if not majority_found:
+                majority_sics.append((None, None))
+                continue
+            level, position = divmod(majority_position, k)
+            top_prefix_ids = level_prefix_ids[level][i]
+            majority_prefix_id = top_prefix_ids[position]
+            top_dists = distances[i][is_top_dist[i]]
+            is_majority_sic = top_prefix_ids[: len(top_dists)] == majority_prefix_id
+            majority_sics.append(
+                (
+                    str(sic_prefixes[level][1][majority_prefix_id]),
+                    round(np.mean(top_dists[is_majority_sic]), 2),
+                )
+            )
+
+    return majority_sics
+
+
+def get_company_name_key(
+    name: Union[str, None], placeholder_names: set = set()
+) -> Union[str, None]:
+    """Get the cleaned company name to reuse SIC codes across a company's job adverts by
+
+    :param name: A company name
+    :type: str
+    :param placeholder_names: Cleaned names which don't identify a company (e.g. those
+        given to all the job adverts from recruitment agencies)
+    :type: set
+    :return: The cleaned company name, or None if it isn't usable
+    :rtype: str
+    """
+    if not isinstance(name, str):
+        return None
+    company_name = clean_company_name(name)
+    if company_name in placeholder_names:
+        return None
+    return company_name
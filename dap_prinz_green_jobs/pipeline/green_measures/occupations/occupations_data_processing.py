@@ -1,6 +1,8 @@
 import pandas as pd
 
 import re
+from functools import lru_cache
+from typing import List, Union
 
 
 def process_job_title_soc(jobtitle_soc_data: pd.DataFrame()) -> pd.DataFrame():
@@ -145,3 +147,88 @@ def job_title_cleaner(text, lower_case_all_end_words=lower_case_all_end_words):
                 text = text[0:-1].strip()
 
     return text
+
+
+job_title_findreplace = {
+    "&amp;": " and ",
+    "&#160;": " ",
+    "&#163;": "£",
+    "(part time)": " ",
+}
+# The patterns used in job_title_cleaner, compiled once for batch_job_title_cleaner
+multiple_spaces_pattern = re.compile(r"\s{2,}")
+hours_pattern = re.compile(r"\d+\s*hrs")
+
+
+@lru_cache(maxsize=8)
+def compile_end_words_pattern(lower_case_all_end_words: tuple) -> re.Pattern:
+    """A pattern which matches if any of the end words are in a text"""
+    return re.compile("|".join(re.escape(word) for word in lower_case_all_end_words))
+
+
+def batch_job_title_cleaner(
+    job_titles: Union[pd.Series, List[str]],
+    lower_case_all_end_words=lower_case_all_end_words,
+) -> Union[pd.Series, List[str]]:
+    """
+    A batch version of job_title_cleaner which gives identical outputs. Each distinct job title
+    is only cleaned once, and the cleaning steps are applied to all of them at once using
+    pandas string methods and precompiled patterns.
+
+    :param job_titles: The job titles to clean
+    :type job_titles: pd.Series or list
+
+    :return: The cleaned job titles, a pd.Series (with the same index) if job_titles was a pd.Series otherwise a list
+    :rtype: pd.Series or list
+    """
+
+    job_titles_series = pd.Series(job_titles, dtype=object)
+
+    # Empty/None job titles are left as they are
+    to_clean = job_titles_series.map(bool)
+    job_title_ids, unique_job_titles = pd.factorize(
+        job_titles_series[to_clean].map(str)
+    )
+    text = pd.Series(unique_job_titles, dtype=object)
+
+    # One after another as in job_title_cleaner, since a replacement can make a
+    # later one match e.g. "(part&#160;time)" -> "(part time)" -> " "
+    for f, r in job_title_findreplace.items():
+        text = text.str.replace(f, r, regex=False)
+    # Get rid of any double + spaces
+    text = text.str.replace(multiple_spaces_pattern, " ", regex=True).str.strip()
+    # Remove mentions of hours e.g. Customer Service 30hrs -> Customer Service
+    text = text.str.replace(hours_pattern, "", regex=True).str.strip()
+
+    # If there is a "£" (unless it occurs very early in the text) remove everything after the last one
+    late_pound = text.str.find("£") > 4
+    if late_pound.any():
+        text[late_pound] = (
+            text[late_pound].str.rpartition("£")[0].str.replace("£", " ").str.strip()
+        )
+
+    # If any of the end words are after the last dash then remove everything after it
+    has_dash = text.str.contains(" - ", regex=False)
+    if has_dash.any():
+        dash_split = text[has_dash].str.split(" - ")
+        last_bit = dash_split.str[-1].str.strip().str.lower()
+        found = last_bit.str.contains(
+            compile_end_words_pattern(tuple(lower_case_all_end_words)), regex=True
+        ) | (last_bit == "")
+        if found.any():
+            text[found[found].index] = (
+                dash_split[found].str[:-1].str.join(" - ").str.strip()
+            )
+
+    # The cleaning may make it so we are left with nothing
+    ends_with_dash = text.str.endswith("-")
+    if ends_with_dash.any():
+        text[ends_with_dash] = text[ends_with_dash].str[:-1].str.strip()
+
+    cleaned_job_titles = job_titles_series.copy()
+    cleaned_job_titles[to_clean] = text.to_numpy()[job_title_ids]
+
+    if isinstance(job_titles, pd.Series):
+        return cleaned_job_titles
+    else:
+        return cleaned_job_titles.tolist()
@@ -14,11 +14,19 @@ from dap_prinz_green_jobs.getters.occupation_getters import (
 from dap_prinz_green_jobs.pipeline.green_measures.occupations.occupations_data_processing import (
     process_green_gla_soc,
     process_green_timeshare_soc,
+    batch_job_title_cleaner,
 )
 from dap_prinz_green_jobs.getters.data_getters import save_to_s3, load_s3_data
+from dap_prinz_green_jobs.utils.processing import load_concurrently
 from dap_prinz_green_jobs.pipeline.green_measures.occupations.soc_map import SOCMapper
+from dap_prinz_green_jobs.pipeline.green_measures.occupations.soc_match_store import (
+    SOCMatchStore,
+)
+
+from dap_prinz_green_jobs import logger, BUCKET_NAME, PROJECT_DIR
+import os
 
-from dap_prinz_green_jobs import logger, BUCKET_NAME
+SOC_GREEN_MEASURES_PATH = "outputs/data/green_occupations/soc_green_measures.json"
 
 
 def clean_job_title(job_title: str) -> str:
@@ -102,6 +110,102 @@ def process_green_topics(green_topics):
     return green_topics, green_topics_2_soc2020
 
 
+def create_soc_green_measures_dict() -> dict:
+    """
+    Combine the GLA green categories, the ONS green timeshares and the ONET green topics
+    into one set of green measures per SOC 2010 code. The ONET occupations are mapped to
+    UK SOC using the SOCMapper, so this is slow.
+
+    :return: SOC 2010 code to its green measures, e.g. {'2425': {'SOC_name': [...], 'GLA_Green Category': 'Green New & Emerging',
+        'GLA_Green/Non-green': 'Green', 'timeshare_2019': 12.5, 'ONET_green_topics': [...]}, ...}
+    :rtype: dict
+    """
+
+    # Load the datasets (at the same time, as they are independent)
+    loaded, _ = load_concurrently(
+        {
+            "GLA green SOC data": lambda: process_green_gla_soc(load_green_gla_soc()),
+            "green timeshare SOC data": lambda: process_green_timeshare_soc(
+                load_green_timeshare_soc()
+            ),
+            "ONET green topics": load_onet_green_topics,
+        }
+    )
+    green_gla_data = loaded["GLA green SOC data"]
+    green_timeshares = loaded["green timeshare SOC data"]
+    green_topics = loaded["ONET green topics"]
+
+    logger.info("Predict UK SOC for the occupations in the ONET green topics data")
+
+    green_topics, _ = process_green_topics(green_topics)
+
+    # The list of green topics per occupation in the ONET data e.g. {'9120': ['Land use planning', 'Green construction', 'Earth science',]..}
+    onet_green_topics = (
+        green_topics.groupby("SOC_2010")
+        .agg({"Topic": lambda x: list(set(x)), "SOC_name": lambda x: list(set(x))})
+        .reset_index()
+    )
+
+    onet_green_topics.rename(columns={"Topic": "ONET_green_topics"}, inplace=True)
+
+    # Combine all the green measures per SOC 2010
+    green_soc_data = pd.merge(
+        green_gla_data,
+        green_timeshares,
+        how="outer",
+        on="SOC_2010",
+    )
+    green_soc_data = pd.merge(
+        green_soc_data,
+        onet_green_topics,
+        how="outer",
+        on="SOC_2010",
+    )
+
+    return green_soc_data.set_index("SOC_2010")[
+        [
+            "SOC_name",
+            "GLA_Green Category",
+            "GLA_Green/Non-green",
+            "timeshare_2019",
+            "ONET_green_topics",
+        ]
+    ].T.to_dict()
+
+
+def load_soc_green_measures_dict(
+    soc_green_measures_path: str = SOC_GREEN_MEASURES_PATH,
+    save_measures: bool = True,
+) -> dict:
+    """
+    Load the green measures per SOC 2010 code (the output of create_soc_green_measures_dict) from S3.
+    If they haven't been saved yet then they are created (and saved if save_measures is True).
+    The saved measures will need deleting if the input datasets change.
+
+    :param soc_green_measures_path: Where the green measures are saved in S3
+    :type soc_green_measures_path: str
+
+    :param save_measures: Whether to save the green measures if they have to be created
+    :type save_measures: bool
+
+    :return: SOC 2010 code to its green measures
+    :rtype: dict
+    """
+
+    try:
+        logger.info(
+            f"Loading the green measures per SOC from {soc_green_measures_path}"
+        )
+        soc_green_measures_dict = load_s3_data(BUCKET_NAME, soc_green_measures_path)
+    except:
+        logger.info("Green measures per SOC not found in S3 - creating ...")
+        soc_green_measures_dict = create_soc_green_measures_dict()
+        if save_measures:
+            save_to_s3(BUCKET_NAME, soc_green_measures_dict, soc_green_measures_path)
+
+    return soc_green_measures_dict
+
+
 class OccupationMeasures(object):
     """
     Class to extract occupation measures for a given job advert or list of job adverts.
@@ -110,19 +214,33 @@ class OccupationMeasures(object):
     Arguments
     ----------
     The arguments to this class are all for the use of SOCMapper - as such more information about them can be found in soc_map.py
-    For most purposes they can be kept as their default values
+    For most purposes they can be kept as their default values.
+    load() only loads the green measures per SOC (see load_soc_green_measures_dict), the SOC mapper is loaded
+    the first time job titles need mapping to SOC.
+    If soc_match_store_path is given to load(), then job title to SOC matches are stored in (and reused from)
+    a SQLite database at this location - see soc_match_store.py
 
     ----------
     Methods
     ----------
     get_measures(job_advert, job_title_key):
         for a given job advert (dict) or list of job adverts (list of dicts), extract the occupation-level green measures.
+    load_soc_mapper():
+        Load the SOC mapper model and embeddings, this is only done when job titles need mapping
+    get_soc_names():
+        The names of the SOC 2020 codes, which only needs the SOC data rather than the SOC mapper model and embeddings
     precalculate_soc_mapper():
         Loading the SOC mapper (job titles to SOC) is more efficient if you run it on all unique job titles first, rather than one by one
     get_green_measure_for_job_title(self, job_title):
         Get the green measures for a single job title
     get_measures(job_adverts, job_title_key):
         Get the green measures for many job adverts (in dict format where the job title is given in the job_title_key key)
+    get_job_title_soc_table():
+        The job title to SOC matches (from precalculate_soc_mapper) as a DataFrame
+    get_soc_green_measures_table():
+        The green measures per SOC 2010 code as a DataFrame
+    get_measures_table(job_titles):
+        A vectorised version of get_measures for a column of job titles, which outputs a DataFrame
 
     ----------
     Usage
@@ -137,6 +255,8 @@ class OccupationMeasures(object):
     >>> {'GREEN CATEGORY': 'Green New & Emerging', 'GREEN/NOT GREEN': 'Green', 'GREEN TIMESHARE': 12.5, 'GREEN TOPICS': 30, 'SOC': {'SOC_2020_EXT': '2433/02', 'SOC_2020': '2433', 'SOC_2010': '2425', 'name': ['Mathematicians ', 'Data scientists', 'Economists', 'Statisticians ']}}
     or
     om.get_measures(job_adverts= [{'description': 'We are looking for a sales ...', 'job_title': 'Data Scientist'}], job_title_key='job_title')
+    or for a large number of job adverts
+    om.get_measures_table(job_adverts_df["job_title"])
     """
 
     def load(
@@ -150,12 +270,17 @@ class OccupationMeasures(object):
         minimum_n=3,
         minimum_prop=0.5,
         save_embeds=True,
+        soc_match_store_path="",
+        encoder="transformer",
+        coarse_search_groups=None,
     ):
-        # Load the datasets
-        green_gla_data = process_green_gla_soc(load_green_gla_soc())
-        green_timeshares = process_green_timeshare_soc(load_green_timeshare_soc())
-        green_topics = load_onet_green_topics()
+        # self.load_times is how long each dataset took to load, in seconds
+        loaded, self.load_times = load_concurrently(
+            {"green measures per SOC": load_soc_green_measures_dict}
+        )
+        self.soc_green_measures_dict = loaded["green measures per SOC"]
 
+        # The SOC mapper model and embeddings are only loaded when job titles need mapping (see load_soc_mapper)
         self.soc_mapper = SOCMapper(
             local=local,
             embeddings_output_dir=embeddings_output_dir,
@@ -165,62 +290,103 @@ class OccupationMeasures(object):
             top_n_sim_threshold=top_n_sim_threshold,
             minimum_n=minimum_n,
             minimum_prop=minimum_prop,
+            encoder=encoder,
+            coarse_search_groups=coarse_search_groups,
         )
-        self.soc_mapper.load(save_embeds=save_embeds)
+        self.save_embeds = save_embeds
+        self.soc_mapper_loaded = False
 
-        logger.info("Predict UK SOC for the occupations in the ONET green topics data")
+        if soc_match_store_path:
+            self.soc_match_store = SOCMatchStore(
+                os.path.join(PROJECT_DIR, soc_match_store_path),
+                self.soc_mapper.fingerprint(),
+            )
+        else:
+            self.soc_match_store = None
 
-        green_topics, self.green_topics_2_soc2020 = process_green_topics(green_topics)
+    def load_soc_mapper(self) -> SOCMapper:
+        """
+        Load the SOC mapper if it hasn't been already. This loads the sentence transformer and
+        the SOC embeddings, so it is only done when job titles need mapping to SOC.
+        """
 
-        # The list of green topics per occupation in the ONET data e.g. {'9120': ['Land use planning', 'Green construction', 'Earth science',]..}
-        onet_green_topics = (
-            green_topics.groupby("SOC_2010")
-            .agg({"Topic": lambda x: list(set(x)), "SOC_name": lambda x: list(set(x))})
-            .reset_index()
-        )
+        if not self.soc_mapper_loaded:
+            self.soc_mapper.load(save_embeds=self.save_embeds)
+            self.soc_mapper_loaded = True
 
-        onet_green_topics.rename(columns={"Topic": "ONET_green_topics"}, inplace=True)
+        return self.soc_mapper
 
-        # Combine all the green measures per SOC 2010
-        green_soc_data = pd.merge(
-            green_gla_data,
-            green_timeshares,
-            how="outer",
-            on="SOC_2010",
-        )
-        green_soc_data = pd.merge(
-            green_soc_data,
-            onet_green_topics,
-            how="outer",
-            on="SOC_2010",
-        )
+    def get_soc_names(self) -> dict:
+        """
+        The names of the SOC 2020 6 and 4 digit codes. This only loads the SOC data (if the
+        SOC mapper hasn't been loaded already), not the sentence transformer and SOC embeddings.
 
-        self.soc_green_measures_dict = green_soc_data.set_index("SOC_2010")[
-            [
-                "SOC_name",
-                "GLA_Green Category",
-                "GLA_Green/Non-green",
-                "timeshare_2019",
-                "ONET_green_topics",
-            ]
-        ].T.to_dict()
+        :return: {"soc_2020_6": SOC 2020 6 digit code to its name, "soc_2020_4": SOC 2020 4 digit code to its name}
+        :rtype: dict
+        """
+
+        self.soc_mapper.load_soc_names()
 
-    def precalculate_soc_mapper(self, unique_job_titles, output_path=""):
+        return {
+            "soc_2020_6": self.soc_mapper.soc_2020_6_dict,
+            "soc_2020_4": self.soc_mapper.soc_2020_4_dict,
+        }
+
+    def precalculate_soc_mapper(
+        self, unique_job_titles, output_path="", clean_job_titles=None
+    ):
         """
         This just needs to be done once to calculate the SOCs for each unique job title in the dataset
         It's quicker to use soc_mapper with a bulk unique input, rather than use it one job title at a time
+        If a SOC match store was loaded, then only the (cleaned) job titles not already in it are
+        input to soc_mapper, and their matches are added to the store
 
         Args:
             unique_job_titles (set): The job titles you want to find SOCs for
             output_path (str): If this is given then the job_title to SOC mapping dict will be saved
             to S3.
+            clean_job_titles (list): If given, the cleaned version of each job title (see batch_job_title_cleaner),
+            e.g. from prepare_job_adverts, so they aren't cleaned again
 
         Returns:
             dict: job title to SOC maps
 
         """
 
-        soc_matches = self.soc_mapper.get_soc(job_titles=unique_job_titles)
+        if clean_job_titles is None:
+            clean_job_titles = batch_job_title_cleaner(list(unique_job_titles))
+        if self.soc_match_store:
+            clean_job_title_2_match = self.soc_match_store.get_matches(
+                [job_title for job_title in clean_job_titles if job_title is not None]
+            )
+            new_clean_job_titles = list(
+                dict.fromkeys(
+                    job_title
+                    for job_title in clean_job_titles
+                    if job_title not in clean_job_title_2_match
+                )
+            )
+            if new_clean_job_titles:
+                logger.info(
+                    f"Finding SOCs for {len(new_clean_job_titles)} job titles not in the SOC match store"
+                )
+                new_soc_matches = dict(
+                    zip(
+                        new_clean_job_titles,
+                        self.load_soc_mapper().get_soc(
+                            job_titles=new_clean_job_titles, clean_job_title=False
+                        ),
+                    )
+                )
+                self.soc_match_store.add_matches(new_soc_matches)
+                clean_job_title_2_match.update(new_soc_matches)
+            soc_matches = [
+                clean_job_title_2_match[job_title] for job_title in clean_job_titles
+            ]
+        else:
+            soc_matches = self.load_soc_mapper().get_soc(
+                job_titles=clean_job_titles, clean_job_title=False
+            )
         self.job_title_2_match = dict(zip(unique_job_titles, soc_matches))
         if output_path:
             logger.info(f"Saving job title to SOC maps to {output_path}")
@@ -301,3 +467,122 @@ class OccupationMeasures(object):
             )
 
         return occ_green_measures_list
+
+    def get_job_title_soc_table(self) -> pd.DataFrame:
+        """
+        Convert the job title to SOC matches into a table with a row for each job title that has a SOC match
+
+        Returns:
+            pd.DataFrame: With the columns job_title, SOC_2020_EXT, SOC_2020 and SOC_2010
+        """
+
+        soc_matches = [
+            (job_title, *soc_match[0])
+            for job_title, soc_match in self.job_title_2_match.items()
+            if soc_match
+        ]
+
+        return pd.DataFrame(
+            soc_matches,
+            columns=["job_title", "SOC_2020_EXT", "SOC_2020", "SOC_2010"],
+        )
+
+    def get_soc_green_measures_table(self) -> pd.DataFrame:
+        """
+        Convert the green measures per SOC 2010 code into a table, with the green measures
+        columns named as in get_green_measure_for_job_title
+
+        Returns:
+            pd.DataFrame: With a row per SOC 2010 code
+        """
+
+        soc_green_measures = pd.DataFrame.from_dict(
+            self.soc_green_measures_dict, orient="index"
+        ).reindex(
+            columns=[
+                "SOC_name",
+                "GLA_Green Category",
+                "GLA_Green/Non-green",
+                "timeshare_2019",
+                "ONET_green_topics",
+            ]
+        )
+        soc_green_measures.index.name = "SOC_2010"
+
+        return soc_green_measures.rename(
+            columns={
+                "GLA_Green Category": "GREEN CATEGORY",
+                "GLA_Green/Non-green": "GREEN/NOT GREEN",
+                "timeshare_2019": "GREEN TIMESHARE",
+            }
+        ).reset_index()
+
+    def get_measures_table(
+        self, job_titles: Union[pd.Series, List[str]], return_all_green_topics=False
+    ) -> pd.DataFrame:
+        """
+        Get the green measures for a column of job titles. The job title to SOC matches
+        and the green measures per SOC 2010 code are joined on in one go, so this is much
+        faster than get_measures for large numbers of job adverts.
+        As with get_green_measure_for_job_title, if a job title has no SOC match, or there are no
+        green measures for its SOC 2010 code, then its measures and SOC codes are all missing.
+
+        Args:
+            job_titles (pd.Series or list): The job titles, these need to have been input to precalculate_soc_mapper
+            return_all_green_topics (bool): Whether you want to return all the ONET green topics linked or just a count.
+        Returns:
+            pd.DataFrame: A row per job title (with the same index as job_titles if it is a pd.Series) and the columns
+                job_title, GREEN CATEGORY, GREEN/NOT GREEN, GREEN TIMESHARE, GREEN TOPICS,
+                SOC_2020_EXT, SOC_2020, SOC_2010 and SOC_name
+        """
+
+        job_titles = pd.Series(job_titles)
+
+        soc_green_measures = self.get_soc_green_measures_table()
+        # Calculate the number of green topics once per SOC rather than once per job title
+        soc_green_measures["GREEN TOPICS COUNT"] = soc_green_measures[
+            "ONET_green_topics"
+        ].map(lambda x: len(x) if isinstance(x, list) else 0)
+        soc_green_measures["has_measures"] = True
+
+        measures = pd.DataFrame({"job_title": job_titles.values})
+        measures = measures.merge(
+            self.get_job_title_soc_table(), how="left", on="job_title"
+        ).merge(soc_green_measures, how="left", on="SOC_2010")
+
+        has_measures = measures["has_measures"].eq(True)
+        soc_columns = ["SOC_2020_EXT", "SOC_2020", "SOC_2010"]
+        measures[soc_columns] = measures[soc_columns].where(has_measures)
+
+        if return_all_green_topics:
+            measures["GREEN TOPICS"] = measures["ONET_green_topics"].where(
+                has_measures, None
+            )
+        else:
+            measures["GREEN TOPICS"] = (
+                measures["GREEN TOPICS COUNT"].fillna(0).astype("int64")
+            )
+
+        measures = measures.astype(
+            {
+                "GREEN CATEGORY": "string",
+                "GREEN/NOT GREEN": "string",
+                "GREEN TIMESHARE": "float64",
+                "SOC_2020_EXT": "string",
+                "SOC_2020": "string",
+                "SOC_2010": "string",
+            }
+        )
+        measures.index = job_titles.index
+
+        return measures[
+            [
+                "job_title",
+                "GREEN CATEGORY",
+                "GREEN/NOT GREEN",
+                "GREEN TIMESHARE",
+                "GREEN TOPICS",
+            ]
+            + soc_columns
+            + ["SOC_name"]
+        ]
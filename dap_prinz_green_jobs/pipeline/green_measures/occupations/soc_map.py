@@ -13,22 +13,28 @@ soc_mapper.get_soc(job_titles, return_soc_name=True)
 
 """
 from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+import json
 import os
-from typing import List, Union
+from typing import Iterable, Iterator, List, Tuple, Union
 
 from sentence_transformers import SentenceTransformer
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 import pandas as pd
 from tqdm import tqdm
+from toolz import partition_all
 import numpy as np
 
 from dap_prinz_green_jobs.getters.occupation_getters import load_job_title_soc
 from dap_prinz_green_jobs.pipeline.green_measures.occupations.occupations_data_processing import (
     process_job_title_soc,
-    job_title_cleaner,
+    batch_job_title_cleaner,
 )
 
 from dap_prinz_green_jobs.utils.processing import list_chunks
+from dap_prinz_green_jobs.utils.static_embeddings import StaticEmbedder
 from dap_prinz_green_jobs.getters.data_getters import (
     save_to_s3,
     load_s3_data,
@@ -36,6 +42,10 @@ from dap_prinz_green_jobs.getters.data_getters import (
 )
 from dap_prinz_green_jobs import BUCKET_NAME, logger, config, PROJECT_DIR
 
+# Increase this if the ONS SOC job titles data or the way it is processed in
+# unique_soc_job_titles changes, so a stale cached dictionary isn't loaded
+SOC_JOB_TITLE_DICT_VERSION = "v1"
+
 
 class SOCMapper(object):
     """Class for linking job titles to SOC codes.
@@ -72,24 +82,60 @@ class SOCMapper(object):
     :param minimum_prop: If a group of SOC matches have a high proportion (>= minimum_prop) of the same SOC being matched, then use this SOC.
     :type minimum_prop: float
 
+    :param bert_model_name: The sentence transformers model used to embed job titles, defaults to "sentence-transformers/all-MiniLM-L6-v2"
+    :type bert_model_name: str
+
+    :param encoder: How to embed job titles. "transformer" runs the full sentence transformers model, "static" uses
+    static token embeddings distilled from the same model (see utils/static_embeddings.py) which is much faster but a bit less accurate.
+    Defaults to "transformer"
+    :type encoder: str
+
+    :param coarse_search_groups: If given, a two-stage search is used to find the most similar SOC job titles. Job titles are
+    first compared to the centroid of the SOC job title embeddings in each 4-digit SOC group, and then only to the SOC job titles in the
+    coarse_search_groups most similar groups. This is faster but may miss some matches (see evaluate_coarse_search_recall).
+    Defaults to None, which compares job titles to every SOC job title.
+    :type coarse_search_groups: int, None
+
     ----------
     Methods
     ----------
 
     load_process_soc_data():
         Load the SOC data
+    load_soc_names():
+        Load the SOC data and the names of the SOC 2020 codes, without the model
     unique_soc_job_titles(jobtitle_soc_data):
         Convert the SOC data into a dict where each key is a job title and the value is the SOC code
+    load_soc_job_title_dict(save_dict=False):
+        Load the cached output of unique_soc_job_titles, or create (and optionally save) it
         embed_texts(texts):
                 Get sentence embeddings for a list of input texts
+        load_static_embedder(save_embeds=False):
+                Load (or distill) the static token embeddings used when encoder="static"
         load(save_embeds=False):
                 Load everything to use this class, calculate SOC embeddings if they weren't inputted, save embeddings if desired
+        index_soc_job_titles():
+                Create arrays of SOC codes for the SOC job titles, used for batch matching, and the SOC group index for the two-stage search
+        fingerprint():
+                A hash of everything which affects the SOC matches, used to version stored matches
         find_most_similar_matches(job_titles, job_title_embeddings):
                 Using the inputted job title embeddings and the SOC embeddings, find the full information about the most similar SOC job titles
         find_most_likely_soc(match_row):
                 For the full match information for one job title, find the most likely SOC (via top match, or group of top matches)
+        format_top_matches(job_titles, top_soc_ix, top_soc_scores):
+                Find the full information about the most similar SOC job titles from the outputs of find_top_matches
+        find_top_matches(job_title_embeddings):
+                Find the indices and similarity scores of the most similar SOC job titles for each job title embedding
+        find_top_matches_coarse(job_title_embeddings):
+                A faster two-stage version of find_top_matches, used if coarse_search_groups is set
+        evaluate_coarse_search_recall(job_title_embeddings):
+                Measure how many of the exhaustive search matches the two-stage search finds
+        find_most_likely_socs(top_soc_ix, top_soc_scores, return_soc_name=False):
+                A batch version of find_most_likely_soc using numpy, which takes the outputs of find_top_matches
         get_soc(job_titles, additional_info=False):
                 (main function) For inputted job titles, output the best SOC match, add extra information about matches using the additional_info argument
+        get_soc_iter(job_titles, batch_size=10000):
+                A streaming version of get_soc which yields (job title, best SOC match) one batch of job titles at a time
 
         ----------
     Usage
@@ -111,6 +157,9 @@ class SOCMapper(object):
         top_n_sim_threshold: float = 0.5,
         minimum_n: int = 3,
         minimum_prop: float = 0.5,
+        bert_model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        encoder: str = "transformer",
+        coarse_search_groups: int = None,
     ):
         self.local = local
         self.embeddings_output_dir = embeddings_output_dir
@@ -120,6 +169,15 @@ class SOCMapper(object):
         self.top_n_sim_threshold = top_n_sim_threshold
         self.minimum_n = minimum_n
         self.minimum_prop = minimum_prop
+        self.bert_model_name = bert_model_name
+        if encoder not in ["transformer", "static"]:
+            raise ValueError(
+                f"encoder must be 'transformer' or 'static', not '{encoder}'"
+            )
+        self.encoder = encoder
+        self.coarse_search_groups = coarse_search_groups
+        # The SOC data is loaded in load_soc_names()
+        self.jobtitle_soc_data = None
 
     def load_process_soc_data(self):
         """
@@ -131,6 +189,28 @@ class SOCMapper(object):
 
         return jobtitle_soc_data
 
+    def load_soc_names(self):
+        """
+        Load the SOC data (if it hasn't been already) and the names of the SOC 2020 6 and 4 digit codes.
+        This doesn't need the sentence transformers model or the SOC embeddings.
+        """
+
+        if self.jobtitle_soc_data is None:
+            self.jobtitle_soc_data = self.load_process_soc_data()
+
+            self.soc_2020_6_dict = dict(
+                zip(
+                    self.jobtitle_soc_data["SOC_2020_EXT"],
+                    self.jobtitle_soc_data["SUB-UNIT GROUP DESCRIPTIONS"],
+                )
+            )
+            self.soc_2020_4_dict = dict(
+                zip(
+                    self.jobtitle_soc_data["SOC_2020"],
+                    self.jobtitle_soc_data["SOC 2020 UNIT GROUP DESCRIPTIONS"],
+                )
+            )
+
     def unique_soc_job_titles(self, jobtitle_soc_data: pd.DataFrame()) -> dict:
         """
         Taking the dataset of job titles and which SOC they belong to - create a unique
@@ -142,54 +222,69 @@ class SOCMapper(object):
         col_name_0 = "INDEXOCC NATURAL WORD ORDER"
         col_name_1 = "ADD"
         col_name_2 = "IND"
-
-        jobtitle_soc_data[f"{col_name_0} and {col_name_1}"] = jobtitle_soc_data.apply(
-            lambda x: x[col_name_0] + " " + x[col_name_1]
-            if pd.notnull(x[col_name_1])
-            else x[col_name_0],
-            axis=1,
-        )
-        jobtitle_soc_data[
-            f"{col_name_0} and {col_name_1} and {col_name_2}"
-        ] = jobtitle_soc_data.apply(
-            lambda x: x[f"{col_name_0} and {col_name_1}"] + " " + x[col_name_2]
-            if pd.notnull(x[col_name_2])
-            else x[f"{col_name_0} and {col_name_1}"],
-            axis=1,
+        col_name_0_1 = f"{col_name_0} and {col_name_1}"
+        col_name_0_1_2 = f"{col_name_0} and {col_name_1} and {col_name_2}"
+
+        jobtitle_soc_data[col_name_0_1] = (
+            jobtitle_soc_data[col_name_0] + " " + jobtitle_soc_data[col_name_1]
+        ).where(jobtitle_soc_data[col_name_1].notnull(), jobtitle_soc_data[col_name_0])
+        jobtitle_soc_data[col_name_0_1_2] = (
+            jobtitle_soc_data[col_name_0_1] + " " + jobtitle_soc_data[col_name_2]
+        ).where(
+            jobtitle_soc_data[col_name_2].notnull(), jobtitle_soc_data[col_name_0_1]
         )
 
+        soc_data = jobtitle_soc_data[jobtitle_soc_data[col_name_0].notnull()]
+
+        # How many different 6-digit SOCs each job title has when using more and more words
+        # to describe it. A job title is only used at the first level where it's unique.
+        level_cols = [
+            [col_name_0],
+            [col_name_0, col_name_0_1],
+            [col_name_0, col_name_0_1, col_name_0_1_2],
+        ]
+        num_socs = [
+            soc_data.groupby(cols)["SOC_2020_EXT"].transform("nunique")
+            for cols in level_cols
+        ]
+        level_masks = [
+            num_socs[0] == 1,
+            (num_socs[0] != 1) & (num_socs[1] == 1),
+            (num_socs[0] != 1) & (num_socs[1] != 1) & (num_socs[2] == 1),
+        ]
+
         # Try to find a unique job title to SOC 2020 4 or 6 code mapping
-        job_title_2_soc6_4 = {}
-        for job_title, grouped_soc_data in jobtitle_soc_data.groupby(col_name_0):
-            if grouped_soc_data["SOC_2020_EXT"].nunique() == 1:
-                job_title_2_soc6_4[job_title] = (
-                    grouped_soc_data["SOC_2020_EXT"].unique()[0],
-                    grouped_soc_data["SOC_2020"].unique()[0],
-                    grouped_soc_data["SOC_2010"].unique()[0],
+        unique_titles = []
+        for cols, level_mask in zip(level_cols, level_masks):
+            level_titles = soc_data[level_mask].drop_duplicates(subset=cols)
+            unique_titles.append(
+                pd.DataFrame(
+                    {
+                        "sort_0": level_titles[col_name_0],
+                        "sort_1": level_titles[cols[1]] if len(cols) > 1 else "",
+                        "sort_2": level_titles[cols[2]] if len(cols) > 2 else "",
+                        "job_title": level_titles[cols[-1]],
+                        "SOC_2020_EXT": level_titles["SOC_2020_EXT"],
+                        "SOC_2020": level_titles["SOC_2020"],
+                        "SOC_2010": level_titles["SOC_2010"],
+                    }
                 )
-            else:
-                for job_title_1, grouped_soc_data_1 in grouped_soc_data.groupby(
-                    f"{col_name_0} and {col_name_1}"
-                ):
-                    if grouped_soc_data_1["SOC_2020_EXT"].nunique() == 1:
-                        job_title_2_soc6_4[job_title_1] = (
-                            grouped_soc_data_1["SOC_2020_EXT"].unique()[0],
-                            grouped_soc_data_1["SOC_2020"].unique()[0],
-                            grouped_soc_data_1["SOC_2010"].unique()[0],
-                        )
-                    else:
-                        for (
-                            job_title_2,
-                            grouped_soc_data_2,
-                        ) in grouped_soc_data_1.groupby(
-                            f"{col_name_0} and {col_name_1} and {col_name_2}"
-                        ):
-                            if grouped_soc_data_2["SOC_2020_EXT"].nunique() == 1:
-                                job_title_2_soc6_4[job_title_2] = (
-                                    grouped_soc_data_2["SOC_2020_EXT"].unique()[0],
-                                    grouped_soc_data_2["SOC_2020"].unique()[0],
-                                    grouped_soc_data_2["SOC_2010"].unique()[0],
-                                )
+            )
+        # Order the job titles in the same way as a nested groupby would
+        unique_titles = pd.concat(unique_titles).sort_values(
+            ["sort_0", "sort_1", "sort_2"], kind="mergesort"
+        )
+
+        job_title_2_soc6_4 = dict(
+            zip(
+                unique_titles["job_title"],
+                zip(
+                    unique_titles["SOC_2020_EXT"],
+                    unique_titles["SOC_2020"],
+                    unique_titles["SOC_2010"],
+                ),
+            )
+        )
 
         return job_title_2_soc6_4
 
@@ -223,34 +318,95 @@ class SOCMapper(object):
         logger.info(f"Embedding texts in {len(texts)/self.batch_size} batches")
         all_embeddings = []
         for batch_texts in tqdm(list_chunks(texts, self.batch_size)):
-            all_embeddings.append(
-                self.bert_model.encode(np.array(batch_texts), batch_size=32)
-            )
+            if self.encoder == "static":
+                all_embeddings.append(self.static_embedder.encode(batch_texts))
+            else:
+                all_embeddings.append(
+                    self.bert_model.encode(np.array(batch_texts), batch_size=32)
+                )
         all_embeddings = np.concatenate(all_embeddings)
 
         return all_embeddings
 
-    def load(self, save_embeds=False, job_titles=True):
-        self.bert_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-        self.bert_model.max_seq_length = 512
+    def load_soc_job_title_dict(self, save_dict: bool = False) -> dict:
+        """
+        Load the cached dictionary of unique SOC job titles to SOC codes (as created by
+        unique_soc_job_titles), or create it if a cached version can't be found.
+        The cached version is saved in the embeddings_output_dir with a version number.
+        """
 
-        self.jobtitle_soc_data = self.load_process_soc_data()
+        job_title_dict_path = os.path.join(
+            self.embeddings_output_dir,
+            f"soc_job_title_dict_{SOC_JOB_TITLE_DICT_VERSION}.json",
+        )
 
-        self.soc_2020_6_dict = dict(
-            zip(
-                self.jobtitle_soc_data["SOC_2020_EXT"],
-                self.jobtitle_soc_data["SUB-UNIT GROUP DESCRIPTIONS"],
+        try:
+            logger.info(f"Loading SOC job title dictionary")
+            if self.local:
+                job_title_2_soc6_4 = load_json_dict(
+                    os.path.join(PROJECT_DIR, job_title_dict_path)
+                )
+            else:
+                job_title_2_soc6_4 = load_s3_data(BUCKET_NAME, job_title_dict_path)
+            job_title_2_soc6_4 = {k: tuple(v) for k, v in job_title_2_soc6_4.items()}
+        except:
+            logger.info(
+                f"SOC job title dictionary not found locally or in S3 - creating ..."
             )
+            job_title_2_soc6_4 = self.unique_soc_job_titles(self.jobtitle_soc_data)
+            if save_dict:
+                logger.info(f"Saving SOC job title dictionary")
+                save_to_s3(BUCKET_NAME, job_title_2_soc6_4, job_title_dict_path)
+
+        return job_title_2_soc6_4
+
+    def load_static_embedder(self, save_embeds: bool = False) -> StaticEmbedder:
+        """
+        Load the static token embeddings for the "static" encoder, or distill them from
+        the transformer model if they can't be found.
+        """
+
+        token_embeddings_path = os.path.join(
+            self.embeddings_output_dir, "static_token_embeddings.npy"
         )
-        self.soc_2020_4_dict = dict(
-            zip(
-                self.jobtitle_soc_data["SOC_2020"],
-                self.jobtitle_soc_data["SOC 2020 UNIT GROUP DESCRIPTIONS"],
+
+        try:
+            logger.info(f"Loading static token embeddings")
+            if self.local:
+                token_embeddings = np.load(
+                    os.path.join(PROJECT_DIR, token_embeddings_path)
+                )
+            else:
+                token_embeddings = load_s3_data(BUCKET_NAME, token_embeddings_path)
+            static_embedder = StaticEmbedder(
+                self.bert_model.tokenizer, token_embeddings
             )
-        )
+        except:
+            logger.info(
+                f"Static token embeddings not found locally or in S3 - distilling ..."
+            )
+            static_embedder = StaticEmbedder.distill(self.bert_model)
+            if save_embeds:
+                logger.info(f"Saving static token embeddings")
+                save_to_s3(
+                    BUCKET_NAME, static_embedder.token_embeddings, token_embeddings_path
+                )
+
+        return static_embedder
+
+    def load(self, save_embeds=False, job_titles=True):
+        self.bert_model = SentenceTransformer(self.bert_model_name)
+        self.bert_model.max_seq_length = 512
+
+        if self.encoder == "static":
+            self.static_embedder = self.load_static_embedder(save_embeds=save_embeds)
+
+        self.load_soc_names()
 
         if job_titles:
-            self.job_title_2_soc6_4 = self.unique_soc_job_titles(self.jobtitle_soc_data)
+            self.job_title_2_soc6_4 = self.load_soc_job_title_dict(
+                save_dict=save_embeds
+            )
         else:
             # This is a bit of an appended use case - so I've called the variable the same
             # so it fits in with the rest of the pipeline
@@ -258,11 +414,14 @@ class SOCMapper(object):
                 self.jobtitle_soc_data
             )
 
+        # The SOC job titles need to be embedded in the same way as the input job titles
+        embeddings_suffix = "_static" if self.encoder == "static" else ""
         embeddings_path = os.path.join(
-            self.embeddings_output_dir, "soc_job_embeddings.json"
+            self.embeddings_output_dir, f"soc_job_embeddings{embeddings_suffix}.json"
         )
         job_titles_path = os.path.join(
-            self.embeddings_output_dir, "soc_job_embeddings_titles.json"
+            self.embeddings_output_dir,
+            f"soc_job_embeddings_titles{embeddings_suffix}.json",
         )
 
         try:
@@ -292,6 +451,68 @@ class SOCMapper(object):
                 save_to_s3(BUCKET_NAME, self.all_soc_embeddings, embeddings_path)
                 save_to_s3(BUCKET_NAME, self.soc_job_titles, job_titles_path)
 
+        self.index_soc_job_titles()
+
+    def index_soc_job_titles(self):
+        """
+        Create arrays of the SOC information for each SOC job title, in the same order as
+        the SOC job title embeddings, so the SOC matching rules can be applied to many
+        job titles at once with numpy.
+        """
+
+        self.soc_2020_4_ids, self.soc_2020_4_codes = pd.factorize(
+            np.array(
+                [
+                    self.job_title_2_soc6_4[soc_text][1]
+                    for soc_text in self.soc_job_titles
+                ],
+                dtype=object,
+            )
+        )
+
+        if self.coarse_search_groups:
+            # For the two-stage search: the normalised SOC job title embeddings, the
+            # normalised centroid of each 4-digit SOC group, and the SOC job titles in each group
+            self.soc_embeddings_norm = normalize(np.array(self.all_soc_embeddings))
+            num_groups = len(self.soc_2020_4_codes)
+            self.soc_group_centroids = np.zeros(
+                (num_groups, self.soc_embeddings_norm.shape[1])
+            )
+            np.add.at(
+                self.soc_group_centroids, self.soc_2020_4_ids, self.soc_embeddings_norm
+            )
+            self.soc_group_centroids = normalize(self.soc_group_centroids)
+            soc_ix_by_group = np.argsort(self.soc_2020_4_ids, kind="stable")
+            group_starts = np.searchsorted(
+                self.soc_2020_4_ids[soc_ix_by_group], np.arange(num_groups + 1)
+            )
+            self.soc_group_members = [
+                soc_ix_by_group[group_starts[i] : group_starts[i + 1]]
+                for i in range(num_groups)
+            ]
+
+    def fingerprint(self) -> str:
+        """
+        Create a hash of the parameters, model and SOC data version which affect the
+        output of get_soc. Stored SOC matches are only reused if their fingerprint
+        is the same as the current SOCMapper's.
+        """
+
+        mapper_params = {
+            "embeddings_output_dir": self.embeddings_output_dir,
+            "match_top_n": self.match_top_n,
+            "sim_threshold": self.sim_threshold,
+            "top_n_sim_threshold": self.top_n_sim_threshold,
+            "minimum_n": self.minimum_n,
+            "minimum_prop": self.minimum_prop,
+            "bert_model_name": self.bert_model_name,
+            "encoder": self.encoder,
+            "coarse_search_groups": self.coarse_search_groups,
+            "soc_job_title_dict_version": SOC_JOB_TITLE_DICT_VERSION,
+        }
+
+        return md5(json.dumps(mapper_params, sort_keys=True).encode()).hexdigest()
+
     def find_most_similar_matches(
         self,
         job_titles: Union[str, List[str]],
@@ -302,17 +523,28 @@ class SOCMapper(object):
         find the top n SOC job titles which are most similar to each input job title.
         """
 
-        logger.info(f"Finding most similar job titles for {len(job_titles)} job titles")
+        top_soc_ix, top_soc_scores = self.find_top_matches(job_title_embeddings)
 
-        similarities = cosine_similarity(job_title_embeddings, self.all_soc_embeddings)
+        return self.format_top_matches(job_titles, top_soc_ix, top_soc_scores)
+
+    def format_top_matches(
+        self,
+        job_titles: List[str],
+        top_soc_ix: np.ndarray,
+        top_soc_scores: np.ndarray,
+    ) -> List[dict]:
+        """
+        Using the outputs of find_top_matches, find the full information about
+        the top n SOC job titles which are most similar to each input job title.
+        """
 
         # Top matches for each data point
         job_top_soc_matches = []
-        for job_title_ix, job_title in tqdm(enumerate(job_titles)):
+        for job_title, soc_ixs, soc_scores in tqdm(
+            zip(job_titles, top_soc_ix, top_soc_scores)
+        ):
             top_soc_matches = []
-            for soc_ix in np.flip(np.argsort(similarities[job_title_ix]))[
-                0 : self.match_top_n
-            ]:
+            for soc_ix, soc_score in zip(soc_ixs, soc_scores):
                 soc_text = self.soc_job_titles[soc_ix]
                 top_soc_matches.append(
                     [
@@ -320,7 +552,7 @@ class SOCMapper(object):
                         self.job_title_2_soc6_4[soc_text][0],  # 6 digit
                         self.job_title_2_soc6_4[soc_text][1],  # 4 digit
                         self.job_title_2_soc6_4[soc_text][2],  # 2010 4 digit
-                        similarities[job_title_ix][soc_ix],
+                        soc_score,
                     ]
                 )
             job_top_soc_matches.append(
@@ -332,6 +564,106 @@ class SOCMapper(object):
 
         return job_top_soc_matches
 
+    def find_top_matches(
+        self, job_title_embeddings: np.array(object)
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the indices (in soc_job_titles) and similarity scores of the top n most similar SOC
+        job titles for each job title embedding. Both outputs have the shape (number of job titles, match_top_n)
+        and are ordered from most to least similar.
+        """
+
+        logger.info(
+            f"Finding most similar job titles for {len(job_title_embeddings)} job titles"
+        )
+
+        if self.coarse_search_groups and self.coarse_search_groups < len(
+            self.soc_group_members
+        ):
+            return self.find_top_matches_coarse(job_title_embeddings)
+
+        similarities = cosine_similarity(job_title_embeddings, self.all_soc_embeddings)
+
+        top_soc_ix = np.flip(np.argsort(similarities, axis=1), axis=1)[
+            :, 0 : self.match_top_n
+        ]
+        top_soc_scores = np.take_along_axis(similarities, top_soc_ix, axis=1)
+
+        return top_soc_ix, top_soc_scores
+
+    def find_top_matches_coarse(
+        self, job_title_embeddings: np.array(object)
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        A two-stage version of find_top_matches. Each job title is compared to the 4-digit SOC group centroids,
+        and then the exact similarities are only calculated for the SOC job titles in the
+        coarse_search_groups most similar groups. The outputs are in the same format as find_top_matches.
+        """
+
+        job_title_embeddings = normalize(np.array(job_title_embeddings))
+
+        # Stage 1: the most similar 4-digit SOC groups
+        group_similarities = job_title_embeddings @ self.soc_group_centroids.T
+        top_groups = np.argpartition(
+            -group_similarities, self.coarse_search_groups - 1, axis=1
+        )[:, 0 : self.coarse_search_groups]
+
+        # Stage 2: exact search over the SOC job titles in these groups
+        top_soc_ix = []
+        top_soc_scores = []
+        for job_title_embedding, job_title_top_groups in zip(
+            job_title_embeddings, top_groups
+        ):
+            candidate_soc_ix = np.concatenate(
+                [self.soc_group_members[group] for group in job_title_top_groups]
+            )
+            if len(candidate_soc_ix) < self.match_top_n:
+                # Too few SOC job titles in the groups, so compare to all of them
+                candidate_soc_ix = np.arange(len(self.soc_embeddings_norm))
+            candidate_scores = self.soc_embeddings_norm[candidate_soc_ix].dot(
+                job_title_embedding
+            )
+            top_candidates = np.argsort(-candidate_scores, kind="stable")[
+                0 : self.match_top_n
+            ]
+            top_soc_ix.append(candidate_soc_ix[top_candidates])
+            top_soc_scores.append(candidate_scores[top_candidates])
+
+        return np.array(top_soc_ix), np.array(top_soc_scores)
+
+    def evaluate_coarse_search_recall(
+        self, job_title_embeddings: np.array(object)
+    ) -> dict:
+        """
+        Measure how well the two-stage search (find_top_matches_coarse) does compared to
+        comparing each job title to all the SOC job titles.
+
+        Returns:
+            dict: "top_match_recall" is the proportion of job titles where the most similar SOC job title
+                is the same, "top_n_recall" is the proportion of the exhaustive top n SOC job titles which
+                are also found in the two-stage top n.
+        """
+
+        coarse_search_groups = self.coarse_search_groups
+        try:
+            self.coarse_search_groups = None
+            exact_top_soc_ix, _ = self.find_top_matches(job_title_embeddings)
+        finally:
+            self.coarse_search_groups = coarse_search_groups
+        coarse_top_soc_ix, _ = self.find_top_matches_coarse(job_title_embeddings)
+
+        top_n_found = [
+            len(set(exact_ix).intersection(coarse_ix))
+            for exact_ix, coarse_ix in zip(exact_top_soc_ix, coarse_top_soc_ix)
+        ]
+
+        return {
+            "top_match_recall": float(
+                np.mean(exact_top_soc_ix[:, 0] == coarse_top_soc_ix[:, 0])
+            ),
+            "top_n_recall": sum(top_n_found) / exact_top_soc_ix.size,
+        }
+
     def find_most_likely_soc(
         self,
         match_row: dict,
@@ -386,6 +718,98 @@ class SOCMapper(object):
             else:
                 return None
 
+    def find_most_likely_socs(
+        self,
+        top_soc_ix: np.ndarray,
+        top_soc_scores: np.ndarray,
+        return_soc_name: bool = False,
+    ) -> List[Union[tuple, None]]:
+        """
+        Find the most likely SOC for many job titles at once, using the outputs of find_top_matches.
+        This applies the same rules as find_most_likely_soc (see its docstring) and gives the same outputs,
+        but the rules are evaluated on the (number of job titles, match_top_n) matrices with numpy.
+        If return_soc_name then the SOC names will be added to the output.
+        """
+
+        logger.info(f"Finding most likely SOC")
+
+        # 1. The top match is very similar
+        top_match_found = top_soc_scores[:, 0] > self.sim_threshold
+
+        # 2. The 4-digit SOCs of the good matches in the top n
+        good_matches = top_soc_scores > self.top_n_sim_threshold
+        num_good_matches = good_matches.sum(axis=1)
+        soc_2020_4_ids = self.soc_2020_4_ids[top_soc_ix]
+
+        # How many good matches have the same 4-digit SOC as each good match.
+        # The first of the most common is used (as in Counter.most_common)
+        same_soc_counts = (
+            (soc_2020_4_ids[:, :, None] == soc_2020_4_ids[:, None, :])
+            & good_matches[:, None, :]
+        ).sum(axis=2)
+        same_soc_counts[~good_matches] = -1
+        common_soc_position = same_soc_counts.argmax(axis=1)
+        num_common_soc = np.take_along_axis(
+            same_soc_counts, common_soc_position[:, None], axis=1
+        )[:, 0]
+        common_soc_ids = np.take_along_axis(
+            soc_2020_4_ids, common_soc_position[:, None], axis=1
+        )[:, 0]
+
+        # 3. There are a few good matches and a high proportion of these have the same SOC.
+        # The proportion is compared as in find_most_likely_soc, since e.g. 63 > 0.7 * 90 but 63 / 90 == 0.7
+        # (job titles without good matches have num_common_soc == -1, so aren't found)
+        prop_common_soc = num_common_soc / np.maximum(num_good_matches, 1)
+        common_soc_found = (
+            ~top_match_found
+            & (num_good_matches >= self.minimum_n)
+            & (prop_common_soc > self.minimum_prop)
+        )
+        common_soc_matches = good_matches & (soc_2020_4_ids == common_soc_ids[:, None])
+
+        most_likely_socs = []
+        for job_title_ix in range(len(top_soc_ix)):
+            if top_match_found[job_title_ix]:
+                job_title = self.soc_job_titles[top_soc_ix[job_title_ix, 0]]
+                (soc_2020_6, soc_2020_4, soc_2010_4) = self.job_title_2_soc6_4[
+                    job_title
+                ]
+            elif common_soc_found[job_title_ix]:
+                soc_2020_6 = None
+                soc_2020_4 = self.soc_2020_4_codes[common_soc_ids[job_title_ix]]
+                soc_2010_4 = None
+                job_title = set(
+                    self.soc_job_titles[soc_ix]
+                    for soc_ix in top_soc_ix[job_title_ix][
+                        common_soc_matches[job_title_ix]
+                    ]
+                )
+            else:
+                most_likely_socs.append(None)
+                continue
+            if return_soc_name:
+                most_likely_socs.append(
+                    (
+                        (
+                            (soc_2020_6, self.soc_2020_6_dict.get(soc_2020_6)),
+                            (soc_2020_4, self.soc_2020_4_dict.get(soc_2020_4)),
+                            soc_2010_4,
+                        ),
+                        job_title,
+                    )
+                )
+            else:
+                most_likely_socs.append(
+                    ((soc_2020_6, soc_2020_4, soc_2010_4), job_title)
+                )
+
+        found_count = int((top_match_found | common_soc_found).sum())
+        logger.info(
+            f"Found SOCs for {found_count*100/max(len(top_soc_ix), 1)}% of the job titles"
+        )
+
+        return most_likely_socs
+
     def get_soc(
         self,
         job_titles: Union[str, List[str]],
@@ -415,49 +839,88 @@ class SOCMapper(object):
         if isinstance(job_titles, str):
             job_titles = [job_titles]
 
-        # Clean the job titles
-        if clean_job_title:
-            job_titles = [job_title_cleaner(job_title) for job_title in job_titles]
-
-        # Embed the input job titles
-        job_title_embeddings = self.embed_texts(job_titles)
-
-        top_soc_matches = self.find_most_similar_matches(
-            job_titles, job_title_embeddings
+        # Clean and embed the input job titles
+        job_titles, job_title_embeddings = self.clean_and_embed(
+            job_titles, clean_job_title=clean_job_title
         )
 
-        logger.info(f"Finding most likely SOC")
-        found_count = 0
-        for job_matches in top_soc_matches:
-            most_likely_soc = self.find_most_likely_soc(job_matches)
-            if most_likely_soc:
-                ((soc_2020_6, soc_2020_4, soc_2010_4), job_title) = most_likely_soc
-                if return_soc_name:
-                    job_matches["most_likely_soc"] = (
-                        (
-                            (soc_2020_6, self.soc_2020_6_dict.get(soc_2020_6)),
-                            (soc_2020_4, self.soc_2020_4_dict.get(soc_2020_4)),
-                            soc_2010_4,
-                        ),
-                        job_title,
-                    )
-                else:
-                    job_matches["most_likely_soc"] = (
-                        (soc_2020_6, soc_2020_4, soc_2010_4),
-                        job_title,
-                    )
-            else:
-                job_matches["most_likely_soc"] = None
-            if most_likely_soc:
-                found_count += 1
+        top_soc_ix, top_soc_scores = self.find_top_matches(job_title_embeddings)
 
-        logger.info(
-            f"Found SOCs for {found_count*100/len(top_soc_matches)}% of the job titles"
+        most_likely_socs = self.find_most_likely_socs(
+            top_soc_ix, top_soc_scores, return_soc_name=return_soc_name
         )
 
         if additional_info:
+            top_soc_matches = self.format_top_matches(
+                job_titles, top_soc_ix, top_soc_scores
+            )
+            for job_matches, most_likely_soc in zip(top_soc_matches, most_likely_socs):
+                job_matches["most_likely_soc"] = most_likely_soc
             return top_soc_matches
         else:
-            return [
-                job_matches.get("most_likely_soc") for job_matches in top_soc_matches
-            ]
+            return most_likely_socs
+
+    def clean_and_embed(
+        self, job_titles: List[str], clean_job_title: bool = True
+    ) -> Tuple[List[str], np.array(object)]:
+        """Clean (if desired) and embed a list of job titles"""
+
+        if clean_job_title:
+            job_titles = batch_job_title_cleaner(list(job_titles))
+
+        return job_titles, self.embed_texts(job_titles)
+
+    def get_soc_iter(
+        self,
+        job_titles: Iterable[str],
+        batch_size: int = 10000,
+        return_soc_name: bool = False,
+        clean_job_title: bool = True,
+    ) -> Iterator[Tuple[str, Union[tuple, None]]]:
+        """Get the most likely SOC for each inputted job title, one batch of job titles at a time.
+
+        Unlike get_soc, the job titles can be any iterable (e.g. a generator reading from a file)
+        and only up to two batches are held in memory at once. Whilst the similarity search for one
+        batch is happening, the next batch is being embedded in a background thread.
+
+                :param job_titles: An iterable of raw job titles
+        :type job_titles: iterable of str
+                :param batch_size: The number of job titles to process at a time
+        :type batch_size: int
+                :param return_soc_name: Whether to output the SOC names of the most likely SOC (or just the codes).
+        :type return_soc_name: bool
+            :param clean_job_title: Whether to apply the cleaning function to the job title.
+        :type clean_job_title: bool
+
+        :return: A generator of (job title, most likely SOC) for each job title inputted,
+            the most likely SOC is in the same format as the output of get_soc
+        :rtype: generator
+
+        """
+
+        job_title_batches = partition_all(batch_size, job_titles)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            job_title_batch = next(job_title_batches, None)
+            if job_title_batch is None:
+                return
+            embed_future = executor.submit(
+                self.clean_and_embed, job_title_batch, clean_job_title
+            )
+            while job_title_batch is not None:
+                clean_job_titles, job_title_embeddings = embed_future.result()
+
+                # Start embedding the next batch before searching this one
+                next_job_title_batch = next(job_title_batches, None)
+                if next_job_title_batch is not None:
+                    embed_future = executor.submit(
+                        self.clean_and_embed, next_job_title_batch, clean_job_title
+                    )
+
+                top_soc_ix, top_soc_scores = self.find_top_matches(job_title_embeddings)
+                most_likely_socs = self.find_most_likely_socs(
+                    top_soc_ix, top_soc_scores, return_soc_name=return_soc_name
+                )
+                yield from zip(job_title_batch, most_likely_socs)
+
+                job_title_batch = next_job_title_batch
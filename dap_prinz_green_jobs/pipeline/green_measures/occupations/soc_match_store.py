@@ -0,0 +1,127 @@
+"""
+A persistent store of job title to SOC matches, so the SOCMapper only needs to be run
+on job titles which haven't been seen before.
+
+The matches are stored in a SQLite database and keyed by the cleaned job title and the
+fingerprint of the SOCMapper used to find them (see SOCMapper.fingerprint). If any of the
+mapper thresholds, the model or the SOC data version change then the fingerprint changes,
+so old matches won't be reused.
+
+Usage:
+
+from dap_prinz_green_jobs.pipeline.green_measures.occupations.soc_match_store import SOCMatchStore
+
+soc_match_store = SOCMatchStore("outputs/data/green_occupations/soc_matching/job_title_soc_store.db", soc_mapper.fingerprint())
+soc_match_store.add_matches({"data scientist": (("2433/02", "2433", "2425"), "data scientist")})
+soc_match_store.get_matches(["data scientist", "nurse"])
+>>> {'data scientist': (('2433/02', '2433', '2425'), 'data scientist')}
+"""
+
+import json
+import os
+import sqlite3
+from typing import Dict, List, Union
+
+from dap_prinz_green_jobs.getters.data_getters import CustomJsonEncoder
+from dap_prinz_green_jobs.utils.processing import list_chunks
+from dap_prinz_green_jobs import logger
+
+# SQLite has a limit on the number of variables in one query
+SQLITE_MAX_VARIABLES = 900
+
+
+def encode_soc_match(soc_match: Union[tuple, None]) -> str:
+    """Convert the output of SOCMapper.get_soc for one job title into a string to store"""
+    return json.dumps(soc_match, cls=CustomJsonEncoder)
+
+
+def decode_soc_match(soc_match: str) -> Union[tuple, None]:
+    """
+    Convert a stored SOC match back into the format SOCMapper.get_soc outputs, i.e.
+    ((soc_2020_6, soc_2020_4, soc_2010), job_title) where job_title can be a set of job titles
+    """
+    soc_match = json.loads(soc_match)
+    if soc_match:
+        soc_codes, job_title = soc_match
+        return (
+            tuple(soc_codes),
+            set(job_title) if isinstance(job_title, list) else job_title,
+        )
+    else:
+        return None
+
+
+class SOCMatchStore(object):
+    """
+    Class to store and retrieve the most likely SOC for cleaned job titles.
+
+    :param db_path: The path to the SQLite database, this will be created if it doesn't exist
+    :type db_path: str
+
+    :param fingerprint: The fingerprint of the SOCMapper used to find the matches
+    :type fingerprint: str
+    """
+
+    def __init__(self, db_path: str, fingerprint: str):
+        self.db_path = db_path
+        self.fingerprint = fingerprint
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        # The connection can be made in a loading thread (see load_concurrently), but it is only
+        # used by one thread at a time
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS soc_matches (
+                fingerprint TEXT NOT NULL,
+                job_title TEXT NOT NULL,
+                most_likely_soc TEXT,
+                PRIMARY KEY (fingerprint, job_title)
+            )
+            """
+        )
+        self.connection.commit()
+
+    def get_matches(self, job_titles: List[str]) -> Dict[str, Union[tuple, None]]:
+        """
+        Get the stored SOC matches for the job titles. Job titles which haven't been stored
+        with this fingerprint won't be in the output.
+        """
+
+        job_titles = list(set(job_titles))
+
+        stored_matches = {}
+        for job_titles_chunk in list_chunks(job_titles, SQLITE_MAX_VARIABLES):
+            query = f"""
+                SELECT job_title, most_likely_soc FROM soc_matches
+                WHERE fingerprint = ? AND job_title IN ({",".join("?" * len(job_titles_chunk))})
+            """
+            for job_title, soc_match in self.connection.execute(
+                query, [self.fingerprint] + list(job_titles_chunk)
+            ):
+                stored_matches[job_title] = decode_soc_match(soc_match)
+
+        logger.info(
+            f"Found stored SOC matches for {len(stored_matches)} of {len(job_titles)} job titles"
+        )
+
+        return stored_matches
+
+    def add_matches(self, job_title_2_match: Dict[str, Union[tuple, None]]):
+        """Store SOC matches (in the output format of SOCMapper.get_soc) for job titles"""
+
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO soc_matches VALUES (?, ?, ?)",
+            [
+                (self.fingerprint, job_title, encode_soc_match(soc_match))
+                for job_title, soc_match in job_title_2_match.items()
+                if job_title is not None
+            ],
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,140 @@
+"""
+The text of job adverts prepared once for all the green measures, so the skill, industry and
+occupation measures in GreenMeasures don't each clean the same job adverts again.
+
+Each job advert's text is hashed (with short_hash), and the text of each distinct hash is only
+prepared once:
+    - the cleaned job text and its sentences (see text_cleaning.clean_and_split_texts), used
+        to find company descriptions in SicMapper
+    - the hash of each sentence, used by the company description cache
+Job adverts with the same text share the same PreparedAdvert text and sentences rather than
+having copies of them. The job titles are cleaned in one go (see batch_job_title_cleaner), and
+are used to find the SOC codes in OccupationMeasures. The skill measures use the text hashes
+to only extract skills once from each distinct job text.
+
+Usage:
+
+from dap_prinz_green_jobs.pipeline.green_measures.prepared_adverts import prepare_job_adverts
+
+prepared_adverts = prepare_job_adverts(
+    [{"id": 1, "job_title": "Data Scientist - London", "job_text": "We are a retailerWe need a data scientist. Apply now"}],
+    job_id_key="id",
+    job_text_key="job_text",
+    job_title_key="job_title",
+)
+sorted(prepared_adverts[1].sentences)
+>>> ['.', 'Apply now', 'We are a retailer', 'We need a data scientist']
+prepared_adverts[1].job_title_clean
+>>> 'Data Scientist'
+"""
+
+from typing import Dict, List, Union
+
+from dap_prinz_green_jobs.pipeline.green_measures.occupations.occupations_data_processing import (
+    batch_job_title_cleaner,
+)
+import dap_prinz_green_jobs.utils.text_cleaning as tc
+
+
+class PreparedAdvert(object):
+    """
+    Class to hold the prepared text of a job advert.
+
+    :param text_hash: The short_hash of the job text
+    :type text_hash: int
+
+    :param job_text_clean: The cleaned job text (see text_cleaning.clean_text)
+    :type job_text_clean: str
+
+    :param sentences: The sentences of the cleaned job text (see text_cleaning.split_sentences)
+    :type sentences: list
+
+    :param sentence_hashes: The short_hash of each sentence
+    :type sentence_hashes: list
+
+    :param job_title_clean: The cleaned job title (see batch_job_title_cleaner)
+    :type job_title_clean: str
+    """
+
+    __slots__ = [
+        "text_hash",
+        "job_text_clean",
+        "sentences",
+        "sentence_hashes",
+        "job_title_clean",
+    ]
+
+    def __init__(
+        self,
+        text_hash: int,
+        job_text_clean: str,
+        sentences: List[str],
+        sentence_hashes: List[int],
+        job_title_clean: Union[str, None],
+    ):
+        self.text_hash = text_hash
+        self.job_text_clean = job_text_clean
+        self.sentences = sentences
+        self.sentence_hashes = sentence_hashes
+        self.job_title_clean = job_title_clean
+
+    def __repr__(self):
+        return f"PreparedAdvert(text_hash={self.text_hash}, job_title_clean={self.job_title_clean!r}, {len(self.sentences)} sentences)"
+
+
+def prepare_job_adverts(
+    job_adverts: Union[Dict[str, str], List[Dict[str, str]]],
+    job_id_key: str = "id",
+    job_text_key: str = "job_text",
+    job_title_key: str = "job_title",
+    n_jobs: int = 1,
+) -> Dict[str, PreparedAdvert]:
+    """Prepares the text of a job advert or list of job adverts for the green measures.
+
+    Args:
+        job_adverts (Union[Dict[str, str], List[Dict[str, str]]]): A job advert or list of job adverts.
+        job_id_key (str): The key for the job advert id.
+        job_text_key (str): The key for the job text.
+        job_title_key (str): The key for the job title.
+        n_jobs (int): The number of processes to clean the job texts in (see text_cleaning.clean_and_split_texts).
+
+    Returns:
+        Dict[str, PreparedAdvert]: The prepared advert for each job advert id.
+    """
+    if isinstance(job_adverts, dict):
+        job_adverts = [job_adverts]
+
+    # Only prepare each distinct job text once
+    text_hashes = [
+        tc.short_hash(str(job_advert.get(job_text_key))) for job_advert in job_adverts
+    ]
+    hash_2_text = {}
+    for text_hash, job_advert in zip(text_hashes, job_adverts):
+        hash_2_text.setdefault(text_hash, job_advert.get(job_text_key))
+
+    cleaned_texts = tc.clean_and_split_texts(list(hash_2_text.values()), n_jobs=n_jobs)
+
+    sentence_2_hash = {}
+    prepared_texts = {}
+    for text_hash, (job_text_clean, sentences) in zip(hash_2_text, cleaned_texts):
+        for sentence in sentences:
+            if sentence not in sentence_2_hash:
+                sentence_2_hash[sentence] = tc.short_hash(sentence)
+        prepared_texts[text_hash] = (
+            job_text_clean,
+            sentences,
+            [sentence_2_hash[sentence] for sentence in sentences],
+        )
+
+    job_titles_clean = batch_job_title_cleaner(
+        [job_advert.get(job_title_key) for job_advert in job_adverts]
+    )
+
+    return {
+        job_advert[job_id_key]: PreparedAdvert(
+            text_hash, *prepared_texts[text_hash], job_title_clean
+        )
+        for job_advert, text_hash, job_title_clean in zip(
+            job_adverts, text_hashes, job_titles_clean
+        )
+    }
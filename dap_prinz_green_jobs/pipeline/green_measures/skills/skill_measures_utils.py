@@ -7,6 +7,9 @@ from dap_prinz_green_jobs.pipeline.green_measures.skills.green_skill_classifier
 from dap_prinz_green_jobs.pipeline.green_measures.skills.map_skills_utils import (
     map_esco_skills,
 )
+from dap_prinz_green_jobs.pipeline.green_measures.prepared_adverts import (
+    PreparedAdvert,
+)
 
 from ojd_daps_skills.pipeline.extract_skills.extract_skills import ExtractSkills
 from ojd_daps_skills.pipeline.skill_ner.ner_spacy import JobNER
@@ -74,6 +77,7 @@ class SkillMeasures(object):
         ]
 
         self.formatted_taxonomy_path = self.config["taxonomy_path"]
+        self.bert_backend = self.config["bert_backend"]
         self.green_skills_classifier_model_file_name = os.path.join(
             "s3://", BUCKET_NAME, green_skills_classifier_model_file_name
         )
@@ -129,6 +133,7 @@ class SkillMeasures(object):
         load: bool = False,
         job_text_key: str = "job_text",
         job_id_key: str = "id",
+        prepared_adverts: Dict[str, PreparedAdvert] = None,
     ) -> dict:
         """
         Get entities for job adverts - whether by prediction or by loading existing predictions
@@ -139,6 +144,8 @@ class SkillMeasures(object):
                 load (bool): If you want to load entities from output_path (True) or predict them again (False)
                 job_text_key (str): the key for the job text
                 job_id_key (str): the key for the job advert id
+                prepared_adverts (dict): If given, the already prepared job adverts (see prepare_job_adverts)
+                    by job advert id, whose text hashes are used to only predict skills once for each job text
         Returns:
                 dict: A dictionary of job advert ids to the predicted entities
         """
@@ -152,9 +159,24 @@ class SkillMeasures(object):
         else:
             logger.info(f"Predicting skills for {len(job_adverts)} job adverts")
 
-            predicted_skills = self.es.get_skills(
-                [j[job_text_key] for j in job_adverts]
-            )  # extract skills from list of job adverts
+            if prepared_adverts is not None:
+                # Job adverts with the same text will have the same skills
+                text_hashes = [
+                    prepared_adverts[j[job_id_key]].text_hash for j in job_adverts
+                ]
+                hash_2_text = {}
+                for text_hash, j in zip(text_hashes, job_adverts):
+                    hash_2_text.setdefault(text_hash, j[job_text_key])
+                hash_2_skills = dict(
+                    zip(hash_2_text, self.es.get_skills(list(hash_2_text.values())))
+                )
+                predicted_skills = [
+                    hash_2_skills[text_hash] for text_hash in text_hashes
+                ]
+            else:
+                predicted_skills = self.es.get_skills(
+                    [j[job_text_key] for j in job_adverts]
+                )  # extract skills from list of job adverts
             predicted_skills = dict(
                 zip([j[job_id_key] for j in job_adverts], predicted_skills)
             )
@@ -202,7 +224,9 @@ class SkillMeasures(object):
                 logger.info(
                     f"Calculating skill embeddings for {len(needed_embeddings)} skills"
                 )
-                new_extracted_skills_embeddings_dict = get_embeddings(needed_embeddings)
+                new_extracted_skills_embeddings_dict = get_embeddings(
+                    needed_embeddings, backend=self.bert_backend
+                )
 
                 self.all_extracted_skills_embeddings_dict = (
                     loaded_extracted_skills_embeddings_dict.update(
@@ -222,7 +246,9 @@ class SkillMeasures(object):
         else:
             logger.info(f"Calculating skill embeddings for {len(skills_list)} skills")
 
-            self.all_extracted_skills_embeddings_dict = get_embeddings(skills_list)
+            self.all_extracted_skills_embeddings_dict = get_embeddings(
+                skills_list, backend=self.bert_backend
+            )
 
             if output_path:
                 logger.info(f"Saving skill embeddings to {output_path}")
@@ -268,6 +294,7 @@ class SkillMeasures(object):
             self.taxonomy_skills_embeddings_dict = get_embeddings(
                 self.formatted_taxonomy["description"].to_list(),
                 id_list=list(self.formatted_taxonomy.index),
+                backend=self.bert_backend,
             )
 
             if output_path:
@@ -386,6 +413,7 @@ class SkillMeasures(object):
         skill_embeddings_output_path: str = "",
         load_skills_embeddings: bool = False,
         skill_mappings_output_path: str = "",
+        prepared_adverts: Dict[str, PreparedAdvert] = None,
     ):
         """
         Get skills measures for a list of job adverts.
@@ -400,6 +428,7 @@ class SkillMeasures(object):
             skill_embeddings_output_path (str): The output path if you want to save/load the embeddings
             load_skills_embeddings (bool): If you want to load embeddings from output_path (True) or create them again (False)
             skill_mappings_output_path (str): The location to save all the skill mapped to all of ESCO (not just green)
+            prepared_adverts (dict): If given, the already prepared job adverts (see prepare_job_adverts) by job advert id
         Returns:
             dict: A dictionary of job advert ids and green measures information
         """
@@ -417,6 +446,7 @@ class SkillMeasures(object):
             load=load_skills,
             job_text_key=job_text_key,
             job_id_key=job_id_key,
+            prepared_adverts=prepared_adverts,
         )
 
         ents_per_job = {}
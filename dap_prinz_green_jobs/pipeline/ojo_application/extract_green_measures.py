@@ -89,6 +89,7 @@ if __name__ == "__main__":
 
     logger.info("extracting green industries...")
     green_industry_outputs_dict = gm.get_industry_measures(job_advert=ojo_sample_raw)
+    gm.close()
 
     logger.info("extracting green occupations...")
     green_occupation_outputs_dict, soc_name_dict = gm.get_occupation_measures(
@@ -89,6 +89,7 @@ if __name__ == "__main__":
                 f"ojo_large_sample_industry_green_measures_production_{production}_interim/{i}.json",
             ),
         )
+    im.close()
 
     # Read them back in and save altogether
     ind_measures_locs = get_s3_data_paths(
@@ -4,9 +4,11 @@ Run the occupation measures for the large sample of job adverts.
 python -i dap_prinz_green_jobs/pipeline/ojo_application/flows/ojo_occupation_measures.py
 
 Took about 1h30m
+(before the SOC match store and the vectorised OccupationMeasures.get_measures_table)
 """
 from tqdm import tqdm
 
+import json
 import os
 from toolz import partition_all
 from datetime import datetime as date
@@ -18,11 +20,7 @@ from dap_prinz_green_jobs import config, BUCKET_NAME
 from dap_prinz_green_jobs.getters.ojo_getters import (
     get_large_ojo_job_title_sample,
 )
-from dap_prinz_green_jobs.getters.data_getters import (
-    save_to_s3,
-    get_s3_data_paths,
-    load_s3_data,
-)
+from dap_prinz_green_jobs.getters.data_getters import save_to_s3
 
 import pandas as pd
 
@@ -45,12 +43,12 @@ if __name__ == "__main__":
         minimum_n=config["occupations"]["minimum_n"],
         minimum_prop=config["occupations"]["minimum_prop"],
         save_embeds=config["occupations"]["save_embeds"],
+        soc_match_store_path=config["occupations"]["soc_match_store_path"],
+        encoder=config["occupations"]["encoder"],
+        coarse_search_groups=config["occupations"]["coarse_search_groups"],
     )
 
-    soc_name_dict = {
-        "soc_2020_6": om.soc_mapper.soc_2020_6_dict,
-        "soc_2020_4": om.soc_mapper.soc_2020_4_dict,
-    }
+    soc_name_dict = om.get_soc_names()
 
     save_to_s3(
         BUCKET_NAME,
@@ -97,69 +95,44 @@ if __name__ == "__main__":
 
     print("Extract SOC codes for unique job titles")
 
-    for i, job_title_chunk in tqdm(enumerate(job_title_chunks)):
-        job_title_2_match = om.precalculate_soc_mapper(job_title_chunk)
-        save_to_s3(
-            BUCKET_NAME,
-            job_title_2_match,
-            os.path.join(
-                folder_name,
-                f"ojo_large_sample_jobtitles2soc_production_{str(production).lower()}/{i}.json",
-            ),
-        )
+    # Job titles already in the SOC match store (from previous runs) aren't re-mapped
+    all_job_title_2_match = {}
+    for job_title_chunk in tqdm(job_title_chunks):
+        all_job_title_2_match.update(om.precalculate_soc_mapper(job_title_chunk))
 
-    job_title_2_match_locs = get_s3_data_paths(
+    save_to_s3(
         BUCKET_NAME,
+        all_job_title_2_match,
         os.path.join(
             folder_name,
-            f"ojo_large_sample_jobtitles2soc_production_{str(production).lower()}",
+            f"ojo_large_sample_jobtitles2soc_production_{str(production).lower()}.json",
         ),
-        file_types=["*.json"],
     )
 
-    print("Load job title to SOC")
-    all_job_title_2_match = {}
-    for job_title_2_match_loc in tqdm(job_title_2_match_locs):
-        all_job_title_2_match.update(load_s3_data(BUCKET_NAME, job_title_2_match_loc))
-
     om.job_title_2_match = all_job_title_2_match
 
-    job_ad_chunks = list(partition_all(chunk_size, ojo_jobs_data))
-
-    print(
-        f"Finding green measures information for {len(job_ad_chunks)} batches of {chunk_size} job adverts each."
-    )
-
-    all_green_occupation_measures_dict = {}
-
-    for job_ad_chunk in tqdm(job_ad_chunks):
-        occ_green_measures_list = om.get_measures(
-            job_adverts=job_ad_chunk, job_title_key=job_title_column
-        )
+    print(f"Finding green measures information for {len(ojo_jobs_data)} job adverts.")
 
-        green_occupation_measures_dict = dict(
-            zip([j[id_column] for j in job_ad_chunk], occ_green_measures_list)
-        )
-        all_green_occupation_measures_dict.update(green_occupation_measures_dict)
+    ojo_jobs_data = pd.DataFrame(ojo_jobs_data)
+    occs_measures_df = om.get_measures_table(ojo_jobs_data[job_title_column])
+    occs_measures_df.insert(0, "job_id", ojo_jobs_data[id_column])
 
     print("saving to s3...")
 
     save_to_s3(
         BUCKET_NAME,
-        all_green_occupation_measures_dict,
+        json.loads(
+            occs_measures_df.drop(columns=["job_title"])
+            .set_index("job_id")
+            .to_json(orient="index")
+        ),
         os.path.join(
             folder_name,
             f"ojo_large_sample_occupation_green_measures_production_{str(production).lower()}.json",
         ),
     )
 
-    # make parquet file and save to s3
-    occs_measures_df = (
-        pd.DataFrame.from_dict(all_green_occupation_measures_dict, orient="index")
-        .reset_index()
-        .rename(columns={"index": "job_id"})
-    )
-
+    # make csv file and save to s3
     occs_df_path = os.path.join(
         BUCKET_NAME,
         folder_name,
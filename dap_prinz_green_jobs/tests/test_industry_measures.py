@@ -8,6 +8,9 @@ from dap_prinz_green_jobs.pipeline.green_measures.industries.industries_measures
 
 from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_mapper_utils import (
     clean_sic,
+    create_hard_coded_sics_automaton,
+    find_hard_coded_sic,
+    get_company_name_key,
 )
 
 import os
@@ -40,6 +43,51 @@ def test_clean_sic():
     assert clean_sic("") == None
 
 
+def test_find_hard_coded_sic():
+    hard_coded_sics = {"Menzies Distribution": "49", "Menzies": "50", "Gobain": "231"}
+    automaton = create_hard_coded_sics_automaton(hard_coded_sics)
+
+    # The first rule found is used, even if another rule's text comes first in the job advert
+    assert find_hard_coded_sic("Join Gobain and Menzies Distribution", automaton) == (
+        0,
+        "Menzies Distribution",
+        "49",
+    )
+    assert find_hard_coded_sic("Join Menzies Logistics", automaton) == (
+        1,
+        "Menzies",
+        "50",
+    )
+    assert find_hard_coded_sic("Nothing helpful here.", automaton) == None
+    assert find_hard_coded_sic("Menzies", create_hard_coded_sics_automaton({})) == None
+
+
+def test_get_company_name_key():
+    placeholder_names = {"this_is_a_madeup_company_name"}
+    assert get_company_name_key(
+        "Apple Ltd.", placeholder_names
+    ) == get_company_name_key("apple  limited", placeholder_names)
+    assert (
+        get_company_name_key("this_is_a_madeup_company_name", placeholder_names) == None
+    )
+    assert get_company_name_key(None, placeholder_names) == None
+    assert get_company_name_key(float("nan"), placeholder_names) == None
+
+
+def test_token_budget_batches():
+    from dap_prinz_green_jobs.utils.processing import token_budget_batches
+
+    lengths = [5, 1, 10, 3, 3, 100, 0]
+    batches = token_budget_batches(lengths, max_tokens=20)
+    assert batches == [[5], [2, 0], [3, 4, 1, 6]]
+    assert token_budget_batches(lengths, max_tokens=1000, max_batch_size=3) == [
+        [5, 2, 0],
+        [3, 4, 1],
+        [6],
+    ]
+    assert token_budget_batches([], max_tokens=20) == []
+
+
 def test_get_ghg_sic():
     ghg_emissions_dict = {"01": 10, "82": 20, "254": 30, "2351": 40}
     assert get_ghg_sic("01121", ghg_emissions_dict) == 10
@@ -101,3 +149,1074 @@ def test_industry_measures():
     assert type(industry_measures[2]["INDUSTRY PROP HOURS GREEN TASKS"]) == float
     assert industry_measures[4]["SIC"] == None
     assert type(industry_measures["5"]["SIC"]) == str
+
+
+def test_company_description_cache(tmp_path):
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.company_description_cache import (
+        CompanyDescriptionCache,
+        classifier_fingerprint,
+    )
+
+    db_path = str(tmp_path / "company_description_cache.db")
+    cache = CompanyDescriptionCache(
+        db_path, classifier_fingerprint("model_a"), max_size=3
+    )
+    cache.add_labels({"We are a retailer": True, "Apply now": False})
+    assert cache.get_labels(["We are a retailer", "Apply now", "Great pay"]) == {
+        "We are a retailer": True,
+        "Apply now": False,
+    }
+    assert cache.hit_rate() == 2 / 3
+
+    # The least recently used sentence is removed when the cache is too big
+    cache.get_labels(["We are a retailer"])
+    cache.add_labels({"Great pay": False, "We make phones": True})
+    assert cache.get_labels(["Apply now", "We make phones"]) == {"We make phones": True}
+    cache.close()
+
+    # Labels from a different model aren't used
+    other_model_cache = CompanyDescriptionCache(
+        db_path, classifier_fingerprint("model_b")
+    )
+    assert other_model_cache.get_labels(["We are a retailer"]) == {}
+    other_model_cache.close()
+
+
+def test_companies_house_index(tmp_path):
+    import pandas as pd
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.companies_house_index import (
+        CompaniesHouseIndex,
+    )
+
+    companies_house = pd.DataFrame(
+        {
+            "CompanyName": ["Nesta Ltd", "NESTA limited", "Nesta", "Café Ltd", None],
+            "SICCode.SicText_1": [
+                "72200 - Research",
+                "72200 - Research",
+                "1110 - Growing",
+                "56101 - Restaurants",
+                "62012 - Software",
+            ],
+        }
+    )
+    CompaniesHouseIndex.from_companies_house(companies_house).save(tmp_path)
+    ch_index = CompaniesHouseIndex.load(tmp_path)
+
+    assert len(ch_index) == 2
+    assert ch_index.get_sic("nesta")[0] == "72200"
+    assert round(ch_index.get_sic("nesta")[1], 2) == 0.67
+    assert ch_index.get_sic("café") == ("56101", 1.0)
+    assert ch_index.get_sic("apple") == None
+    assert ch_index.get_sic(None) == None
+
+
+def test_companies_house_index_placeholder_sics(tmp_path):
+    import pandas as pd
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.companies_house_index import (
+        CompaniesHouseIndex,
+    )
+
+    companies_house = pd.DataFrame(
+        {
+            "CompanyName": ["Nesta", "Nesta", "Nesta Ltd", "Shell Co", "Shell Co"],
+            "SICCode.SicText_1": [
+                "99999 - Dormant Company",
+                "99999 - Dormant Company",
+                "72200 - Research",
+                "74990 - Non-trading company",
+                "82990 - Other business support service activities n.e.c.",
+            ],
+        }
+    )
+    ch_index = CompaniesHouseIndex.from_companies_house(companies_house)
+
+    # The dormant companies don't outvote the trading one
+    assert ch_index.get_sic("nesta") == ("72200", 1.0)
+    # Company names with only placeholder SIC codes aren't matched
+    assert ch_index.get_sic("shell co") == None
+
+    # Nor are placeholder SIC codes in an index built before they were left out
+    old_ch_index = CompaniesHouseIndex.from_companies_house(
+        companies_house, placeholder_sic_codes=[]
+    )
+    assert old_ch_index.find("nesta") is not None
+    assert old_ch_index.get_sic("nesta") == None
+
+
+def test_load_companies_house_index(tmp_path, monkeypatch):
+    import pandas as pd
+    from botocore.exceptions import ClientError
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper import (
+        companies_house_index,
+    )
+
+    companies_house = pd.DataFrame(
+        {
+            "CompanyName": ["Nesta", "Café Ltd"],
+            "SICCode.SicText_1": ["72200 - Research", "56101 - Restaurants"],
+        }
+    )
+
+    def missing_s3_data(bucket_name, file_name):
+        raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+
+    saved_to_s3 = []
+    monkeypatch.setattr(companies_house_index, "load_s3_data", missing_s3_data)
+    monkeypatch.setattr(
+        companies_house_index, "load_companies_house", lambda: companies_house
+    )
+    monkeypatch.setattr(
+        companies_house_index,
+        "save_companies_house_index_to_s3",
+        lambda index, index_dir: saved_to_s3.append(index_dir),
+    )
+
+    # Not in S3, so it's built from the Companies House data and saved
+    index_dir = str(tmp_path / "companies_house_index")
+    ch_index = companies_house_index.load_companies_house_index(index_dir)
+    assert ch_index.get_sic("nesta") == ("72200", 1.0)
+    assert saved_to_s3 == [index_dir]
+
+    # The saved index is loaded (memory-mapped) the next time
+    def no_companies_house():
+        raise AssertionError("The Companies House data shouldn't be loaded")
+
+    monkeypatch.setattr(
+        companies_house_index, "load_companies_house", no_companies_house
+    )
+    cached_ch_index = companies_house_index.load_companies_house_index(index_dir)
+    assert cached_ch_index.get_sic("café") == ("56101", 1.0)
+    for file_name in companies_house_index.COMPANIES_HOUSE_INDEX_FILES:
+        assert (
+            getattr(cached_ch_index, file_name) == getattr(ch_index, file_name)
+        ).all()
+
+    # The index is downloaded from S3 if it isn't saved locally
+    monkeypatch.setattr(
+        companies_house_index,
+        "load_s3_data",
+        lambda bucket_name, file_name: getattr(
+            ch_index, os.path.basename(file_name)[: -len(".npy")]
+        ),
+    )
+    downloaded_ch_index = companies_house_index.load_companies_house_index(
+        str(tmp_path / "downloaded_index")
+    )
+    assert downloaded_ch_index.get_sic("nesta") == ("72200", 1.0)
+
+    # Other S3 errors aren't hidden by rebuilding the index
+    def s3_access_denied(bucket_name, file_name):
+        raise ClientError({"Error": {"Code": "AccessDenied"}}, "GetObject")
+
+    monkeypatch.setattr(companies_house_index, "load_s3_data", s3_access_denied)
+    with pytest.raises(ClientError):
+        companies_house_index.load_companies_house_index(str(tmp_path / "new_index"))
+
+
+def create_sic_mapper_without_models(monkeypatch):
+    """A SicMapper which doesn't load the sentence embedding model, for testing the
+    steps which don't need it. Nothing is loaded (see SicMapper.load)."""
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper import (
+        sic_mapper,
+    )
+
+    class DummyVectorizer:
+        def __init__(self, **kwargs):
+            self.kwargs = kwargs
+
+        def fit(self):
+            return self
+
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(sic_mapper, "BertVectorizer", DummyVectorizer)
+    return sic_mapper.SicMapper()
+
+
+def test_get_hard_coded_sic_codes(monkeypatch):
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_mapper_utils import (
+        hard_coded_sics,
+    )
+
+    sm = create_sic_mapper_without_models(monkeypatch)
+    sm.sic_names = {"49": "Land transport"}
+    sm.hard_coded_sics_automaton = create_hard_coded_sics_automaton(hard_coded_sics)
+    sm.hard_coded_sic_counts = dict.fromkeys(hard_coded_sics, 0)
+
+    job_adverts = job_ads + [
+        {"id": 6, "job_text": None},
+        {"id": 7},
+        {"id": "8", "job_text": "Menzies Distribution are hiring."},
+        {"id": 9, "job_text": "We are a charity."},
+    ]
+    sic_codes, job_adverts_to_predict = sm.get_hard_coded_sic_codes(job_adverts)
+
+    assert sic_codes == {
+        job_id: {
+            "company_description": None,
+            "sic_code": "49",
+            "sic_name": "Land transport",
+            "sic_method": "hard coded sic",
+            "sic_confidence": None,
+        }
+        for job_id in ["5", "8"]
+    }
+    assert sm.hard_coded_sic_counts["Menzies Distribution"] == 2
+    # Job adverts without text aren't predicted, the others keep their order
+    assert [job_ad["id"] for job_ad in job_adverts_to_predict] == [1, 2, 3, 4, 9]
+
+
+def test_predict_job_advert_sic_codes(monkeypatch):
+    import numpy as np
+
+    sm = create_sic_mapper_without_models(monkeypatch)
+
+    company_descriptions = {
+        1: "We are a technology company",
+        2: "We are a jewellery brand",
+        3: "We are a technology company",
+        4: "",
+    }
+    monkeypatch.setattr(
+        sm,
+        "preprocess_job_adverts",
+        lambda job_adverts, prepared_adverts=None: job_adverts,
+    )
+    monkeypatch.setattr(
+        sm,
+        "extract_company_descriptions",
+        lambda job_adverts: [
+            {
+                "id": job_ad["id"],
+                "company_description": company_descriptions[job_ad["id"]],
+            }
+            for job_ad in job_adverts
+        ],
+    )
+
+    embedded_company_descriptions = []
+
+    def get_company_description_embeddings(company_descriptions_dict):
+        embedded_company_descriptions.extend(company_descriptions_dict.values())
+        return {
+            company_desc_hash: np.array([len(company_description)])
+            for company_desc_hash, company_description in company_descriptions_dict.items()
+        }
+
+    predicted_embeddings = []
+
+    def predict_sic_codes(company_embeddings):
+        predicted_embeddings.extend(company_embeddings[:, 0].tolist())
+        return [
+            (f"{int(embedding[0])}", 0.8, "closest distance", None)
+            for embedding in company_embeddings
+        ]
+
+    monkeypatch.setattr(
+        sm, "get_company_description_embeddings", get_company_description_embeddings
+    )
+    monkeypatch.setattr(sm, "predict_sic_codes", predict_sic_codes)
+
+    sic_codes = sm.predict_job_advert_sic_codes(job_ads[:4])
+
+    # Each unique company description is embedded once, and the empty one isn't predicted
+    assert sorted(embedded_company_descriptions) == [
+        "",
+        "We are a jewellery brand",
+        "We are a technology company",
+    ]
+    assert sorted(predicted_embeddings) == [24, 27]
+    assert sic_codes[1] == {
+        "company_description": "We are a technology company",
+        "sic_code": "27",
+        "sic_name": None,
+        "sic_method": "closest distance",
+        "sic_confidence": 0.8,
+    }
+    assert sic_codes[3] == dict(sic_codes[1])
+    assert sic_codes[2]["sic_code"] == "24"
+    assert sic_codes[4] == {
+        "company_description": "",
+        "sic_code": None,
+        "sic_name": None,
+        "sic_method": None,
+        "sic_confidence": None,
+    }
+
+
+class DummyTokenizer:
+    """Tokenizes texts by splitting them on spaces, with one id per word"""
+
+    def __call__(self, texts, padding=False, return_tensors=None, **kwargs):
+        import numpy as np
+
+        input_ids = [[len(word) for word in text.split()] for text in texts]
+        if not padding:
+            return {"input_ids": input_ids}
+        max_length = max(len(text_ids) for text_ids in input_ids)
+        return {
+            "input_ids": np.array(
+                [
+                    text_ids + [0] * (max_length - len(text_ids))
+                    for text_ids in input_ids
+                ]
+            ),
+            "attention_mask": np.array(
+                [
+                    [1] * len(text_ids) + [0] * (max_length - len(text_ids))
+                    for text_ids in input_ids
+                ]
+            ),
+        }
+
+
+class DummyOnnxSession:
+    """An ONNX Runtime session whose model's output is given by run_model"""
+
+    def __init__(self, run_model, input_names=("input_ids", "attention_mask")):
+        self.run_model = run_model
+        self.input_names = input_names
+        self.runs = []
+
+    def get_inputs(self):
+        from types import SimpleNamespace
+
+        return [SimpleNamespace(name=name) for name in self.input_names]
+
+    def get_outputs(self):
+        from types import SimpleNamespace
+
+        return [SimpleNamespace(shape=["batch", "sequence", 2])]
+
+    def run(self, output_names, inputs):
+        self.runs.append(inputs)
+        return [self.run_model(**inputs)]
+
+
+def test_onnx_text_classifier(monkeypatch):
+    import numpy as np
+    from dap_prinz_green_jobs.utils import onnx_models
+
+    # Texts with more than 2 words are company descriptions
+    session = DummyOnnxSession(
+        lambda input_ids, attention_mask: np.stack(
+            [np.zeros(len(input_ids)), attention_mask.sum(axis=1) - 2.5], axis=1
+        )
+    )
+    monkeypatch.setattr(onnx_models, "create_onnx_session", lambda onnx_path: session)
+    classifier = onnx_models.OnnxTextClassifier(
+        "model_int8.onnx", DummyTokenizer(), {0: "LABEL_0", 1: "LABEL_1"}
+    )
+
+    preds = classifier(
+        ["We are a leading retailer", "Apply now", "We sell cars"], batch_size=2
+    )
+    assert [pred["label"] for pred in preds] == ["LABEL_1", "LABEL_0", "LABEL_1"]
+    # The scores are the softmax of the logits
+    assert round(preds[0]["score"], 4) == round(1 / (1 + np.exp(-2.5)), 4)
+    assert round(preds[1]["score"], 4) == round(1 / (1 + np.exp(-0.5)), 4)
+    assert [len(run["input_ids"]) for run in session.runs] == [2, 1]
+    assert all(
+        run[name].dtype == np.int64 for run in session.runs for name in run.keys()
+    )
+    assert classifier("Apply now") == [preds[1]]
+
+    # It can be used as the company description classifier in SicMapper
+    sm = create_sic_mapper_without_models(monkeypatch)
+    sm.company_description_classifier = classifier
+    sentences = ["We are a leading retailer", "Apply now", "We sell cars"]
+    for classifier_token_budget in [4, None]:
+        sm.classifier_token_budget = classifier_token_budget
+        assert sm.predict_company_descriptions(sentences, chunk_size=2) == {
+            "We are a leading retailer": True,
+            "Apply now": False,
+            "We sell cars": True,
+        }
+
+
+def test_onnx_sentence_encoder(monkeypatch):
+    import numpy as np
+    from dap_prinz_green_jobs.utils import onnx_models
+
+    # The token embeddings are (word length, 1)
+    session = DummyOnnxSession(
+        lambda input_ids, attention_mask: np.stack(
+            [input_ids, np.ones(input_ids.shape)], axis=2
+        ).astype(np.float32)
+    )
+    monkeypatch.setattr(onnx_models, "create_onnx_session", lambda onnx_path: session)
+
+    token_embeddings = np.array(
+        [[[1.0, 2.0], [3.0, 6.0], [100.0, 100.0]], [[4.0, 0.0], [0.0, 0.0], [0.0, 0.0]]]
+    )
+    attention_mask = np.array([[1, 1, 0], [1, 0, 0]])
+    for pooling_mode, pooled_embeddings in [
+        ("mean", [[2.0, 4.0], [4.0, 0.0]]),
+        ("cls", [[1.0, 2.0], [4.0, 0.0]]),
+        ("max", [[3.0, 6.0], [4.0, 0.0]]),
+    ]:
+        encoder = onnx_models.OnnxSentenceEncoder(
+            "model.onnx", DummyTokenizer(), 512, pooling_mode=pooling_mode
+        )
+        assert encoder.pool(token_embeddings, attention_mask).tolist() == (
+            pooled_embeddings
+        )
+
+    encoder = onnx_models.OnnxSentenceEncoder(
+        "model.onnx", DummyTokenizer(), 512, pooling_mode="mean", normalize=True
+    )
+    embeddings = encoder.encode(["ab abcd", "abc", " abc  "], batch_size=2)
+    assert embeddings.dtype == np.float32
+    # The padding isn't pooled, and the texts are stripped
+    assert np.allclose(embeddings[0], np.array([3.0, 1.0]) / np.sqrt(10))
+    assert np.allclose(embeddings[1], embeddings[2])
+    assert encoder.encode([]).shape == (0, 2)
+
+
+def test_cosine_agreement():
+    import numpy as np
+    from dap_prinz_green_jobs.utils.onnx_models import cosine_agreement
+
+    agreement = cosine_agreement(
+        np.array([[1.0, 0.0], [0.0, 2.0], [3.0, 4.0]]),
+        np.array([[2.0, 0.0], [1.0, 1.0], [3.0, 4.0]]),
+    )
+    assert agreement["num_texts"] == 3
+    assert round(agreement["mean_cosine"], 4) == round((2 + np.sqrt(0.5)) / 3, 4)
+    assert round(agreement["min_cosine"], 4) == round(np.sqrt(0.5), 4)
+
+
+def test_get_embeddings_backend(monkeypatch):
+    import numpy as np
+    from dap_prinz_green_jobs.utils import bert_vectorizer
+
+    class DummySentenceTransformer:
+        def __init__(self, bert_model_name, device=None):
+            self.bert_model_name = bert_model_name
+
+        def encode(self, texts, batch_size=32, **kwargs):
+            return np.array([[len(text), 0.0] for text in texts], dtype=np.float32)
+
+    class DummyOnnxSentenceEncoder(DummySentenceTransformer):
+        def encode(self, texts, batch_size=32, **kwargs):
+            return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+    onnx_encoder_loads = []
+
+    def load_onnx_sentence_encoder(bert_model, onnx_dir, quantize=True):
+        onnx_encoder_loads.append(quantize)
+        return DummyOnnxSentenceEncoder(bert_model.bert_model_name)
+
+    monkeypatch.setattr(
+        bert_vectorizer, "SentenceTransformer", DummySentenceTransformer
+    )
+    monkeypatch.setattr(
+        bert_vectorizer, "load_onnx_sentence_encoder", load_onnx_sentence_encoder
+    )
+
+    texts = ["communication", "excel", "communication"]
+    embeddings = bert_vectorizer.get_embeddings(texts, chunk_size=2)
+    assert onnx_encoder_loads == []
+    assert embeddings["excel"].tolist() == [5.0, 0.0]
+
+    for backend, quantize in [("onnx", False), ("onnx-int8", True)]:
+        embeddings = bert_vectorizer.get_embeddings(
+            texts, chunk_size=2, id_list=[1, 2, 3], backend=backend
+        )
+        assert onnx_encoder_loads[-1] == quantize
+        assert embeddings[2].tolist() == [5.0, 1.0]
+        assert len(embeddings) == 3
+
+    # The dummy ONNX embeddings are at 45 degrees to the dummy torch ones
+    bert_model = bert_vectorizer.BertVectorizer(backend="onnx").fit()
+    assert round(bert_model.backend_agreement(["a"])["mean_cosine"], 4) == round(
+        np.sqrt(0.5), 4
+    )
+
+    with pytest.raises(ValueError):
+        bert_vectorizer.BertVectorizer(backend="tensorflow")
+    with pytest.raises(ValueError):
+        bert_vectorizer.BertVectorizer(backend="onnx", multi_process=True)
+
+    # SicMapper embeds company descriptions with the configured backend
+    sm = create_sic_mapper_without_models(monkeypatch)
+    assert sm.bert_model.kwargs["backend"] == sm.config["industries"]["bert_backend"]
+
+
+def test_bert_vectorizer_multi_process_pool(monkeypatch):
+    import numpy as np
+    from dap_prinz_green_jobs.utils import bert_vectorizer
+
+    pool_events = []
+
+    class DummySentenceTransformer:
+        def __init__(self, bert_model_name, device=None):
+            pass
+
+        def start_multi_process_pool(self, target_devices=None):
+            pool_events.append(("start", target_devices))
+            return {"pool": len(pool_events)}
+
+        def stop_multi_process_pool(self, pool):
+            pool_events.append(("stop", pool))
+
+        def encode_multi_process(self, texts, pool, batch_size=32, chunk_size=None):
+            pool_events.append(("encode", pool, chunk_size))
+            return np.ones((len(texts), 2))
+
+    monkeypatch.setattr(
+        bert_vectorizer, "SentenceTransformer", DummySentenceTransformer
+    )
+
+    # The pool is started on the first transform call and reused until it's closed
+    bert_model = bert_vectorizer.BertVectorizer(
+        multi_process=True, num_workers=3, multi_process_chunk_size=10
+    ).fit()
+    assert pool_events == []
+    bert_model.transform(["a", "b"])
+    bert_model.transform(["c"])
+    assert [event[0] for event in pool_events] == ["start", "encode", "encode"]
+    assert len(pool_events[0][1]) == 3
+    assert pool_events[1][1:] == ({"pool": 1}, 10)
+    assert pool_events[2][1] is pool_events[1][1]
+    bert_model.close()
+    assert pool_events[-1] == ("stop", {"pool": 1})
+    assert bert_model.pool is None
+    # Closing again doesn't do anything
+    bert_model.close()
+    assert len(pool_events) == 4
+
+    # get_embeddings uses one pool for all its chunks, and stops it at the end
+    pool_events.clear()
+    embeddings = bert_vectorizer.get_embeddings(
+        ["a", "b", "c", "d", "e"], chunk_size=2, multi_process=True
+    )
+    assert len(embeddings) == 5
+    assert [event[0] for event in pool_events] == [
+        "start",
+        "encode",
+        "encode",
+        "encode",
+        "stop",
+    ]
+    # with the default devices
+    assert pool_events[0][1] == None
+
+    # The pool is stopped even if the embedding fails
+    pool_events.clear()
+    with pytest.raises(ZeroDivisionError):
+        with bert_vectorizer.BertVectorizer(multi_process=True).fit() as bert_model:
+            bert_model.transform(["a"])
+            1 / 0
+    assert [event[0] for event in pool_events] == ["start", "encode", "stop"]
+
+
+def test_sic_mapper_close(monkeypatch):
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.industries_measures import (
+        IndustryMeasures,
+    )
+
+    sm = create_sic_mapper_without_models(monkeypatch)
+    sm.close()
+    assert sm.bert_model.closed
+
+    with create_sic_mapper_without_models(monkeypatch) as sm:
+        assert not hasattr(sm.bert_model, "closed")
+    assert sm.bert_model.closed
+
+    # Closing before load() is a no-op, afterwards it stops the SicMapper's pool
+    im = IndustryMeasures()
+    im.close()
+    im.sm = create_sic_mapper_without_models(monkeypatch)
+    with im:
+        pass
+    assert im.sm.bert_model.closed
+
+
+def test_company_sic_cache(monkeypatch):
+    # No models are needed to reuse SIC codes across a company's job adverts
+    sm = create_sic_mapper_without_models(monkeypatch)
+    sm.sic_names = {}
+    sm.hard_coded_sics = {}
+    sm.hard_coded_sics_automaton = create_hard_coded_sics_automaton({})
+    sm.hard_coded_sic_counts = {}
+    sm.companies_house_index = None
+    sm.company_sic_cache = {}
+    sm.company_sic_cache_lookups = 0
+    sm.company_sic_cache_hits = 0
+    sm.company_sic_confidence_floor = 0.5
+    assert sm.company_sic_cache_descriptions == False
+
+    company_sics = {
+        "Nesta": ("72200", 0.9),
+        "Shaky Ltd": ("62012", 0.3),
+        None: ("47421", 0.9),
+        "this_is_a_madeup_company_name": ("78109", 0.9),
+    }
+    job_adverts = [
+        {"id": i, "company_name": company_name, "job_text": f"Job advert {i}"}
+        for i, company_name in enumerate(
+            [
+                "Nesta",
+                "Nesta Ltd.",
+                "nesta",
+                "Shaky Ltd",
+                "Shaky Ltd",
+                None,
+                None,
+                "this_is_a_madeup_company_name",
+            ]
+        )
+    ]
+    job_advert_company_names = {
+        job_ad["id"]: job_ad["company_name"] for job_ad in job_adverts
+    }
+
+    predicted_job_ids = []
+
+    def predict_job_advert_sic_codes(job_adverts, prepared_adverts=None):
+        predicted_job_ids.append([job_ad["id"] for job_ad in job_adverts])
+        sic_codes = {}
+        for job_ad in job_adverts:
+            sic_code, sic_prob = company_sics[job_ad["company_name"]]
+            sic_codes[job_ad["id"]] = {
+                "company_description": f"Company description {job_ad['id']}",
+                "sic_code": sic_code,
+                "sic_name": f"SIC {sic_code}",
+                "sic_method": "closest distance",
+                "sic_confidence": sic_prob,
+            }
+        return sic_codes
+
+    classified_job_ids = []
+
+    def extract_company_descriptions(preprocessed_job_adverts):
+        classified_job_ids.append([job_ad["id"] for job_ad in preprocessed_job_adverts])
+        return [
+            {
+                "id": job_ad["id"],
+                "company_description": f"Company description {job_ad['id']}",
+            }
+            for job_ad in preprocessed_job_adverts
+        ]
+
+    monkeypatch.setattr(
+        sm, "predict_job_advert_sic_codes", predict_job_advert_sic_codes
+    )
+    monkeypatch.setattr(
+        sm,
+        "preprocess_job_adverts",
+        lambda job_adverts, prepared_adverts=None: job_adverts,
+    )
+    monkeypatch.setattr(
+        sm, "extract_company_descriptions", extract_company_descriptions
+    )
+
+    sic_codes = sm.get_sic_codes(job_adverts)
+
+    # One job advert per company is predicted first, then the rest of the job adverts
+    # from companies without a confident prediction. Job adverts without a (usable) company
+    # name are always predicted.
+    assert predicted_job_ids == [[0, 3, 5, 6, 7], [4]]
+    assert len(sic_codes) == len(job_adverts)
+
+    # Only the SIC code information is reused, and the company description classifier
+    # isn't run on the job adverts which reuse it
+    assert classified_job_ids == []
+    for job_id in [1, 2]:
+        assert sic_codes[job_id] == {
+            "company_description": None,
+            "sic_code": "72200",
+            "sic_name": "SIC 72200",
+            "sic_method": "company cache",
+            "sic_confidence": 0.9,
+        }
+    assert sic_codes[0]["sic_method"] == "closest distance"
+    # Predictions below the confidence floor aren't reused
+    assert sic_codes[4]["sic_method"] == "closest distance"
+    assert sic_codes[4]["sic_confidence"] == 0.3
+
+    assert sm.company_sic_cache == {
+        "nesta": {"sic_code": "72200", "sic_name": "SIC 72200", "sic_confidence": 0.9}
+    }
+    # 5 job adverts have a usable company name, 2 of which were in the cache
+    assert sm.company_sic_cache_hit_rate() == 0.4
+
+    # The next job adverts from Nesta all use the cache, and can have their own
+    # company descriptions extracted
+    sm.company_sic_cache_descriptions = True
+    predicted_job_ids.clear()
+    sic_codes = sm.get_sic_codes(
+        [
+            {"id": 8, "company_name": "NESTA", "job_text": "Job advert 8"},
+            {"id": 9, "company_name": "Nesta", "job_text": "Job advert 9"},
+        ]
+    )
+    assert predicted_job_ids == [[], []]
+    assert classified_job_ids == [[8, 9]]
+    assert sic_codes[8]["sic_method"] == "company cache"
+    assert sic_codes[8]["company_description"] == "Company description 8"
+    assert sic_codes[9]["company_description"] == "Company description 9"
+
+    # The confidence floor is inclusive
+    sm.update_company_sic_cache(
+        [
+            {"id": 9, "company_name": "Floor Ltd"},
+            {"id": 10, "company_name": "Below Floor Ltd"},
+        ],
+        {
+            9: {"sic_code": "1", "sic_name": None, "sic_confidence": 0.5},
+            10: {"sic_code": "2", "sic_name": None, "sic_confidence": 0.49},
+        },
+    )
+    assert "floor" in sm.company_sic_cache
+    assert "below floor" not in sm.company_sic_cache
+
+
+def test_sic_description_index(tmp_path):
+    import numpy as np
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_description_index import (
+        build_sic_description_index,
+        load_sic_description_index,
+    )
+
+    sic_embeds = [[3.0, 4.0], [0.0, 2.0], [1.0, 0.0]]
+    sic_company_descriptions = [
+        {"sic_code": ["72200 "]},
+        {"sic_code": ["1110", "1120"]},
+        {"sic_code": [56101]},
+    ]
+    build_sic_description_index(
+        sic_embeds,
+        sic_company_descriptions,
+        str(tmp_path),
+        "sic_embeds.json",
+        upload=False,
+    )
+    sic_db, sic_codes = load_sic_description_index(
+        str(tmp_path), "sic.json", "sic_embeds.json"
+    )
+
+    assert sic_db.ntotal == 3
+    assert sic_codes.tolist() == ["72200", "1110", "56101"]
+    distances, indices = sic_db.search(np.array([[0.6, 0.8]], dtype=np.float32), 3)
+    assert indices[0].tolist() == [0, 1, 2]
+    assert np.allclose(distances[0], [1.0, 0.8, 0.6])
+
+
+def test_find_majority_sics():
+    import numpy as np
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_mapper_utils import (
+        encode_sic_prefixes,
+        find_majority_sics,
+    )
+
+    sic_codes = np.array(["62012", "62020", "1110", "58290", "9"])
+    sic_prefixes = encode_sic_prefixes(sic_codes, [2, 3, 4])
+    assert sic_prefixes[0][1][sic_prefixes[0][0]].tolist()[:4] == [
+        "62",
+        "62",
+        "11",
+        "58",
+    ]
+    assert sic_prefixes[0][0][4] == -1
+
+    top_k_distances = np.array(
+        [[0.4, 0.39, 0.35, 0.1], [0.4, 0.3, 0.2, 0.1]], dtype=np.float32
+    )
+    top_k_indices = np.array([[0, 1, 2, 4], [2, 3, 4, 0]])
+    majority_sics = find_majority_sics(top_k_distances, top_k_indices, sic_prefixes)
+
+    assert majority_sics[0][0] == "62"
+    assert round(float(majority_sics[0][1]), 2) == 0.4
+    assert majority_sics[1] == (None, None)
+
+
+def test_resolve_sic_codes(monkeypatch):
+    import numpy as np
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_mapper_utils import (
+        convert_indx_to_sic,
+        encode_sic_prefixes,
+        find_majority_sic,
+        find_majority_sics,
+        calculate_average_distance,
+    )
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.sic_description_index import (
+        get_sic_description_codes,
+    )
+
+    def resolve_sic_code(sm, top_k_distances, top_k_indices):
+        # The rules for one FAISS search result, applied with find_majority_sic
+        if top_k_distances[0] > sm.closest_distance_threshold:
+            sic_code = convert_indx_to_sic(top_k_indices[:1], sm.sic_company_desc_dict)[
+                0
+            ]
+            return (
+                sic_code,
+                round(top_k_distances[0], 2),
+                "closest distance",
+                sm.sic_names.get(sic_code),
+            )
+        std_threshold = top_k_distances[0] + 2 * np.std(top_k_distances)
+        top_dists = [d for d in top_k_distances if d < std_threshold]
+        top_sics = convert_indx_to_sic(
+            top_k_indices[: len(top_dists)], sm.sic_company_desc_dict
+        )
+        all_maj_sics = {
+            k: v
+            for level in sm.sic_levels
+            for k, v in find_majority_sic(top_sics, level).items()
+        }
+        if all_maj_sics == {}:
+            return None, None, None, None
+        sic_code = sorted(all_maj_sics.items(), key=lambda x: x[1], reverse=True)[0][0]
+        sic_prob = calculate_average_distance(sic_code, top_sics, top_dists)
+        if sic_prob < sm.majority_sic_threshold:
+            return None, None, None, None
+        return sic_code, sic_prob, "majority SIC", sm.sic_names.get(sic_code)
+
+    sm = create_sic_mapper_without_models(monkeypatch)
+    sm.closest_distance_threshold = 0.9
+    sm.majority_sic_threshold = 0.3
+
+    rng = np.random.default_rng(42)
+    # A few similar SIC codes (and ones shorter than some SIC levels), so there are tied counts
+    sic_codes = ["62012", "62020", "62011", "6201", "1110", "1120", "58290", "9"]
+    sm.sic_company_desc_dict = [
+        {"sic_code": [rng.choice(sic_codes)]} for _ in range(50)
+    ]
+    sm.sic_names = {sic_code: f"SIC {sic_code}" for sic_code in sic_codes}
+    sm.sic_description_codes = get_sic_description_codes(sm.sic_company_desc_dict)
+
+    # Sorted like FAISS search results, with tied distances
+    top_k_distances = -np.sort(
+        -rng.choice([0.2, 0.35, 0.5, 0.6, 0.7, 0.95], size=(500, 10)), axis=1
+    ).astype(np.float32)
+    top_k_indices = rng.integers(0, 50, size=(500, 10))
+
+    for sic_levels in [[2, 3, 4], [4, 3, 2], [5]]:
+        sm.sic_levels = sic_levels
+        sm.sic_description_prefixes = encode_sic_prefixes(
+            sm.sic_description_codes, sic_levels
+        )
+        sic_code_results = [
+            resolve_sic_code(sm, distances, indices)
+            for distances, indices in zip(top_k_distances, top_k_indices)
+        ]
+        assert sm.resolve_sic_codes(top_k_distances, top_k_indices) == (
+            sic_code_results
+        )
+        assert sm.resolve_sic_code(top_k_distances[0], top_k_indices[0]) == (
+            sic_code_results[0]
+        )
+        # Batching the searches doesn't change the majority SIC codes
+        assert find_majority_sics(
+            top_k_distances, top_k_indices, sm.sic_description_prefixes, batch_size=7
+        ) == find_majority_sics(
+            top_k_distances, top_k_indices, sm.sic_description_prefixes
+        )
+        assert {sic_code_result[2] for sic_code_result in sic_code_results} == {
+            "closest distance",
+            "majority SIC",
+            None,
+        }
+
+
+def test_build_industry_measures_table():
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.industry_measures_table import (
+        build_industry_measures_table,
+        INDUSTRY_MEASURE_COLUMNS,
+    )
+
+    industry_measures_table = build_industry_measures_table(
+        sic_codes=["62012", "6201", "01110"],
+        sic_to_section={"62012": "J", "01110": "A"},
+        ghg_emissions_dict={"62": 254, "011": 10},
+        ghg_unit_emissions_dict={"6201": 0.5},
+        sic_section_2_prop_hours={"J": 9.7, "A": 5.4},
+        sic_section_2_prop_workers={"J": 43.5},
+        sic_section_2_prop_workers_20={"J": 23.6},
+        ghg_employee_dict={"J": 0.6},
+        carbon_employee_dict={"J": "[c]"},
+    )
+
+    assert industry_measures_table.columns.tolist() == INDUSTRY_MEASURE_COLUMNS
+    assert (industry_measures_table.dtypes == "float64").all()
+    assert industry_measures_table.loc["62012"].tolist()[:5] == [
+        254,
+        0.5,
+        9.7,
+        43.5,
+        23.6,
+    ]
+    # "6201" is cleaned to "06201", which isn't in any of the datasets
+    assert industry_measures_table.loc["6201"].isna().all()
+    assert industry_measures_table.loc["01110", "INDUSTRY TOTAL GHG EMISSIONS"] == 10
+    assert (
+        industry_measures_table.loc[
+            ["62012", "01110"], "INDUSTRY CARBON DIOXIDE EMISSIONS PER EMPLOYEE"
+        ]
+        .isna()
+        .all()
+    )
+
+
+def test_load_concurrently():
+    import time
+    from dap_prinz_green_jobs.utils.processing import load_concurrently
+
+    def slow_load(loaded, seconds=0.2):
+        time.sleep(seconds)
+        return loaded
+
+    t0 = time.time()
+    loaded, load_times = load_concurrently(
+        {"a": lambda: slow_load(1), "b": lambda: slow_load("b"), "c": list}
+    )
+
+    assert loaded == {"a": 1, "b": "b", "c": []}
+    assert set(load_times) == {"a", "b", "c"}
+    assert load_times["a"] >= 0.2
+    # The slow loaders run at the same time
+    assert time.time() - t0 < 0.4
+    assert load_concurrently({}) == ({}, {})
+
+    def failing_load():
+        raise ValueError("Couldn't load")
+
+    with pytest.raises(ValueError):
+        load_concurrently({"a": list, "b": failing_load})
+
+
+def test_clean_and_split_texts():
+    from dap_prinz_green_jobs.utils import text_cleaning as tc
+
+    assert (
+        tc.clean_text("We use JavaScript and DevOps skillsBe a team player")
+        == "We use JavaScript and DevOps skills. Be a team player"
+    )
+    assert (
+        tc.clean_text(" [Remote]\n• R&D/Analysis: iOS\xa0apps ")
+        == "Remote.. RandD Analysis  iOS apps"
+    )
+
+    texts = [
+        "We use JavaScript and PowerPoint skillsBe a team player! Great pay",
+        "Ph. Dev. Ops role",
+        "",
+        None,
+    ]
+    cleaned_texts = tc.clean_and_split_texts(texts)
+
+    assert [text_clean for text_clean, _ in cleaned_texts] == tc.clean_texts(texts)
+    for text, (text_clean, sentences) in zip(texts, cleaned_texts):
+        assert text_clean == tc.clean_text(text)
+        assert sorted(sentences) == sorted(tc.split_sentences(text_clean))
+    # The output is the same when the texts are cleaned in several processes
+    assert tc.batch_apply(tc.clean_text, texts * 2, n_jobs=2, chunk_size=2) == [
+        tc.clean_text(text) for text in texts * 2
+    ]
+
+
+def test_prepare_job_adverts(tmp_path):
+    from dap_prinz_green_jobs.pipeline.green_measures.prepared_adverts import (
+        prepare_job_adverts,
+    )
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.sic_mapper.company_description_cache import (
+        CompanyDescriptionCache,
+    )
+    from dap_prinz_green_jobs.utils import text_cleaning as tc
+
+    job_adverts = [
+        dict(job_ad, job_title="Software Engineer - London") for job_ad in job_ads
+    ] + [{"id": 6, "job_title": None, "job_text": job_ads[0]["job_text"]}]
+    prepared_adverts = prepare_job_adverts(job_adverts)
+
+    assert set(prepared_adverts) == {1, 2, 3, 4, "5", 6}
+    for job_ad in job_adverts:
+        prepared_advert = prepared_adverts[job_ad["id"]]
+        assert prepared_advert.text_hash == tc.short_hash(job_ad["job_text"])
+        assert prepared_advert.job_text_clean == tc.clean_text(job_ad["job_text"])
+        assert sorted(prepared_advert.sentences) == sorted(
+            tc.split_sentences(prepared_advert.job_text_clean)
+        )
+        assert prepared_advert.sentence_hashes == [
+            tc.short_hash(sentence) for sentence in prepared_advert.sentences
+        ]
+    assert prepared_adverts[1].job_title_clean == "Software Engineer"
+    assert prepared_adverts[6].job_title_clean is None
+    # Job adverts with the same text share their sentences
+    assert prepared_adverts[6].sentences is prepared_adverts[1].sentences
+
+    # The given sentence hashes are used by the company description cache
+    sentence_hashes = dict(
+        zip(prepared_adverts[1].sentences, prepared_adverts[1].sentence_hashes)
+    )
+    cache = CompanyDescriptionCache(str(tmp_path / "cache.db"), "fingerprint")
+    cache.add_labels(
+        {sentence: True for sentence in prepared_adverts[1].sentences},
+        sentence_hashes=sentence_hashes,
+    )
+    assert cache.get_labels(prepared_adverts[1].sentences) == cache.get_labels(
+        prepared_adverts[1].sentences, sentence_hashes=sentence_hashes
+    )
+    assert len(cache.get_labels(prepared_adverts[1].sentences)) == len(
+        set(prepared_adverts[1].sentences)
+    )
+
+
+def test_industry_measures_table_sic_prefixes():
+    import pandas as pd
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.industries_measures import (
+        IndustryMeasures,
+    )
+    from dap_prinz_green_jobs.pipeline.green_measures.industries.industry_measures_table import (
+        build_industry_measures_table,
+        get_sic_code_prefixes,
+    )
+
+    assert get_sic_code_prefixes(["62012", "62020", "0111"], [2, 3, 4]) == [
+        "62",
+        "01",
+        "620",
+        "011",
+        "6201",
+        "6202",
+        "0111",
+    ]
+
+    industry_measures_datasets = {
+        "sic_to_section": {"62012": "J", "620": "J"},
+        "ghg_emissions_dict": {"620": 254},
+        "ghg_unit_emissions_dict": {"62": 0.5},
+        "sic_section_2_prop_hours": {"J": 9.7},
+        "sic_section_2_prop_workers": {},
+        "sic_section_2_prop_workers_20": {},
+        "ghg_employee_dict": {},
+        "carbon_employee_dict": {},
+    }
+    ons_sic_codes = ["62012"]
+    industry_measures_table = build_industry_measures_table(
+        ons_sic_codes + get_sic_code_prefixes(ons_sic_codes, [2, 3, 4]),
+        **industry_measures_datasets,
+    )
+    # A majority SIC prefix keeps its GHG values
+    assert industry_measures_table.loc["620"].tolist()[:3] == [254, 0.5, 9.7]
+    # As with get_ghg_sic, a 2 digit code only has the GHG values of 2 digit codes
+    assert pd.isna(industry_measures_table.loc["62", "INDUSTRY TOTAL GHG EMISSIONS"])
+    assert industry_measures_table.loc["62", "INDUSTRY GHG PER UNIT EMISSIONS"] == 0.5
+
+    # SIC codes which aren't in the table are found from the ONS datasets
+    im = IndustryMeasures.__new__(IndustryMeasures)
+    im.industry_measures_table = industry_measures_table.loc[["62012"]]
+    im.industry_measures_datasets = industry_measures_datasets
+    im.add_sic_codes_to_table(["62012", "620", None, "620", "62090"])
+    assert im.industry_measures_table.index.tolist() == ["62012", "620", "62090"]
+    pd.testing.assert_series_equal(
+        im.industry_measures_table.loc["620"], industry_measures_table.loc["620"]
+    )
+    assert (
+        im.industry_measures_table.loc["62090", "INDUSTRY TOTAL GHG EMISSIONS"] == 254
+    )
@@ -5,6 +5,7 @@ from dap_prinz_green_jobs.pipeline.green_measures.occupations.occupations_measur
 from dap_prinz_green_jobs.pipeline.green_measures.occupations.soc_map import SOCMapper
 from dap_prinz_green_jobs.pipeline.green_measures.occupations.occupations_data_processing import (
     job_title_cleaner,
+    batch_job_title_cleaner,
 )
 
 
@@ -54,6 +55,153 @@ def test_occupation_measures():
     )
 
 
+def test_get_measures_table(tmp_path):
+    import pandas as pd
+
+    om = OccupationMeasures()
+    om.soc_green_measures_dict = {
+        "2114": {
+            "SOC_name": ["Data scientists"],
+            "GLA_Green Category": "Green New & Emerging",
+            "GLA_Green/Non-green": "Green",
+            "timeshare_2019": 12.9,
+            "ONET_green_topics": ["Green construction", "Earth science"],
+        },
+        "2231": {
+            "SOC_name": ["Nurses"],
+            "GLA_Green Category": None,
+            "GLA_Green/Non-green": "Non-green",
+            "timeshare_2019": 0.0,
+            "ONET_green_topics": None,
+        },
+    }
+    om.job_title_2_match = {
+        "Data Scientist": (("2433/02", "2433", "2114"), "data scientist"),
+        "Nurse": (("2237/00", "2237", "2231"), "nurse"),
+        "Pharmacist": (("2251/00", "2251", "2213"), "pharmacist"),
+        "Zoologist": None,
+    }
+
+    job_titles = pd.Series(
+        ["Nurse", "Zoologist", "Data Scientist", "Pharmacist", "Nurse"],
+        index=[10, 11, 12, 13, 14],
+    )
+    measures = om.get_measures_table(job_titles)
+
+    assert measures.index.tolist() == [10, 11, 12, 13, 14]
+    assert measures["job_title"].tolist() == job_titles.tolist()
+    assert measures["GREEN TOPICS"].tolist() == [0, 0, 2, 0, 0]
+    assert measures["SOC_2010"].tolist() == ["2231", pd.NA, "2114", pd.NA, "2231"]
+    assert measures["GREEN TIMESHARE"].dtype == "float64"
+
+    # The same measures as get_measures
+    for job_title, row in zip(job_titles, measures.to_dict(orient="records")):
+        expected = om.get_green_measure_for_job_title(job_title)
+        for column in ["GREEN CATEGORY", "GREEN/NOT GREEN", "GREEN TIMESHARE"]:
+            assert (pd.isna(row[column]) and pd.isna(expected[column])) or (
+                row[column] == expected[column]
+            )
+        assert row["GREEN TOPICS"] == expected["GREEN TOPICS"]
+        if expected["SOC"]:
+            assert row["SOC_2020_EXT"] == expected["SOC"]["SOC_2020_EXT"]
+            assert row["SOC_name"] == expected["SOC"]["name"]
+        else:
+            assert pd.isna(row["SOC_2020_EXT"])
+
+    all_topics = om.get_measures_table(job_titles, return_all_green_topics=True)
+    assert all_topics.loc[12, "GREEN TOPICS"] == ["Green construction", "Earth science"]
+    assert all_topics.loc[11, "GREEN TOPICS"] is None
+
+    # The measures can be read back in from a CSV for the OJO analysis
+    from dap_prinz_green_jobs.analysis.ojo_analysis.process_ojo_green_measures import (
+        process_soc_columns,
+    )
+
+    csv_path = tmp_path / "occupation_measures.csv"
+    measures.to_csv(csv_path, index=False)
+    processed = process_soc_columns(pd.read_csv(csv_path))
+    assert processed["SOC_2010"].fillna("").tolist() == ["2231", "", "2114", "", "2231"]
+    assert processed["SOC_2020_EXT"].fillna("").tolist()[:3] == [
+        "2237/00",
+        "",
+        "2433/02",
+    ]
+    assert processed["SOC_name"].fillna("").tolist()[:3] == [
+        ["Nurses"],
+        "",
+        ["Data scientists"],
+    ]
+
+    # Older files have the SOC details in a SOC column
+    old_measures = pd.DataFrame(
+        {
+            "GREEN TIMESHARE": [12.9, ""],
+            "SOC": [
+                "{'SOC_2020_EXT': '2433/02', 'SOC_2020': '2433', 'SOC_2010': '2114', 'name': nan}",
+                None,
+            ],
+        }
+    )
+    old_processed = process_soc_columns(old_measures)
+    assert "SOC" not in old_processed.columns
+    assert old_processed["SOC_2020"].fillna("").tolist() == ["2433", ""]
+    assert old_processed["SOC_name"].fillna("").tolist() == ["None", ""]
+
+
+def test_load_soc_mapper_lazily(monkeypatch):
+    import pandas as pd
+    from dap_prinz_green_jobs.pipeline.green_measures.occupations import (
+        occupations_measures_utils,
+    )
+
+    monkeypatch.setattr(
+        occupations_measures_utils,
+        "load_soc_green_measures_dict",
+        lambda: {"2114": {"timeshare_2019": 12.9}},
+    )
+    soc_mapper_loads = []
+    monkeypatch.setattr(
+        SOCMapper, "load", lambda self, save_embeds: soc_mapper_loads.append(1)
+    )
+
+    soc_data_loads = []
+
+    def load_process_soc_data(self):
+        soc_data_loads.append(1)
+        return pd.DataFrame(
+            {
+                "SOC_2020_EXT": ["2433/02", "2433/01"],
+                "SUB-UNIT GROUP DESCRIPTIONS": ["Data scientists", "Actuaries"],
+                "SOC_2020": ["2433", "2433"],
+                "SOC 2020 UNIT GROUP DESCRIPTIONS": [
+                    "Actuaries, economists and statisticians",
+                    "Actuaries, economists and statisticians",
+                ],
+            }
+        )
+
+    monkeypatch.setattr(SOCMapper, "load_process_soc_data", load_process_soc_data)
+
+    om = OccupationMeasures()
+    om.load()
+    assert om.soc_green_measures_dict == {"2114": {"timeshare_2019": 12.9}}
+    assert soc_mapper_loads == []
+
+    # The SOC names only need the SOC data
+    soc_name_dict = om.get_soc_names()
+    assert soc_name_dict["soc_2020_6"]["2433/02"] == "Data scientists"
+    assert (
+        soc_name_dict["soc_2020_4"]["2433"] == "Actuaries, economists and statisticians"
+    )
+    assert om.get_soc_names() == soc_name_dict
+    assert soc_data_loads == [1]
+    assert soc_mapper_loads == []
+
+    assert om.load_soc_mapper() is om.soc_mapper
+    om.load_soc_mapper()
+    assert soc_mapper_loads == [1]
+
+
 def test_job_title_cleaner():
     assert job_title_cleaner("Data Scientist - London") == "Data Scientist"
     assert (
@@ -65,3 +213,296 @@ def test_job_title_cleaner():
     assert job_title_cleaner("£30k Data Scientist") == "£30k Data Scientist"
     assert job_title_cleaner("Data Scientist £30k") == "Data Scientist"
     assert job_title_cleaner("Remote - Data Scientist") == "Remote - Data Scientist"
+
+
+def test_batch_job_title_cleaner():
+    import pandas as pd
+
+    golden_job_titles = [
+        "Data Scientist - London",
+        "Data Scientist - Part-time - London",
+        "Data Scientist - 16hrs",
+        "Data Scientist - &#163;1000 bonus",
+        "£30k Data Scientist",
+        "Data Scientist £30k",
+        "Remote - Data Scientist",
+        "Part Home Based Block Manager - Chichester",
+        "Employment Solicitor - Claimant - Leeds",
+        "Retail Customer Service CSM 16hrs",
+        "Fulfillment Associate - &#163;1000 Sign on Bonus!",
+        "Sales &amp; Marketing&#160;Assistant (part time)",
+        "Manager(part&#160;time)",
+        "Sales (part&#160;time)",
+        "Sales &amp;amp; Marketing",
+        "Chef £10 - £12 per hour",
+        "Cleaner - - Nights",
+        "Driver -",
+        "Nurse - London",
+        "Nurse - London",
+        "",
+        None,
+    ]
+    expected = [job_title_cleaner(job_title) for job_title in golden_job_titles]
+
+    assert batch_job_title_cleaner(golden_job_titles) == expected
+
+    job_titles_series = pd.Series(
+        golden_job_titles, index=range(100, 100 + len(golden_job_titles)), dtype=object
+    )
+    cleaned_series = batch_job_title_cleaner(job_titles_series)
+    assert cleaned_series.index.equals(job_titles_series.index)
+    assert cleaned_series.tolist() == expected
+
+
+def test_unique_soc_job_titles():
+    import pandas as pd
+
+    jobtitle_soc_data = pd.DataFrame(
+        {
+            "SOC_2010": ["2425", "2136", "3539", "8139", "8131", "8132"],
+            "SOC_2020": ["2433", "2134", "3544", "8149", "8141", "8142"],
+            "SOC_2020_EXT": [
+                "2433/02",
+                "2134/99",
+                "3544/00",
+                "8149/00",
+                "8141/00",
+                "8142/02",
+            ],
+            "ADD": [None, "computing", None, None, "electric", "electric"],
+            "IND": [None, None, None, None, None, "engineering"],
+            "INDEXOCC NATURAL WORD ORDER": [
+                "data scientist",
+                "data analyst",
+                "data analyst",
+                "meter assembler",
+                "motor assembler",
+                "motor assembler",
+            ],
+        }
+    )
+
+    job_title_2_soc6_4 = SOCMapper().unique_soc_job_titles(jobtitle_soc_data)
+
+    assert job_title_2_soc6_4 == {
+        "data analyst": ("3544/00", "3544", "3539"),
+        "data analyst computing": ("2134/99", "2134", "2136"),
+        "data scientist": ("2433/02", "2433", "2425"),
+        "meter assembler": ("8149/00", "8149", "8139"),
+        "motor assembler electric": ("8141/00", "8141", "8131"),
+        "motor assembler electric engineering": ("8142/02", "8142", "8132"),
+    }
+
+
+def test_soc_match_store(tmp_path):
+    from dap_prinz_green_jobs.pipeline.green_measures.occupations.soc_match_store import (
+        SOCMatchStore,
+    )
+
+    db_path = str(tmp_path / "job_title_soc_store.db")
+
+    soc_match_store = SOCMatchStore(db_path, "fingerprint_1")
+    soc_match_store.add_matches(
+        {
+            "data scientist": (("2433/02", "2433", "2425"), "data scientist"),
+            "nurse assistant": (
+                (None, "6131", None),
+                {"assistant nurse", "nursing assistant"},
+            ),
+            "zoologist": None,
+        }
+    )
+    soc_match_store.close()
+
+    soc_match_store = SOCMatchStore(db_path, "fingerprint_1")
+    stored_matches = soc_match_store.get_matches(
+        ["data scientist", "nurse assistant", "zoologist", "pharmacist"]
+    )
+    assert stored_matches == {
+        "data scientist": (("2433/02", "2433", "2425"), "data scientist"),
+        "nurse assistant": (
+            (None, "6131", None),
+            {"assistant nurse", "nursing assistant"},
+        ),
+        "zoologist": None,
+    }
+
+    # Matches from a SOCMapper with different parameters aren't reused
+    assert SOCMatchStore(db_path, "fingerprint_2").get_matches(["data scientist"]) == {}
+
+
+def test_get_soc_iter():
+    import numpy as np
+
+    soc_mapper = SOCMapper(sim_threshold=0.995, top_n_sim_threshold=0.5, minimum_n=2)
+    soc_mapper.job_title_2_soc6_4 = {
+        "data scientist": ("2433/02", "2433", "2425"),
+        "data analyst": ("3544/00", "3544", "3539"),
+        "nurse": ("2237/00", "2237", "2231"),
+        "assistant nurse": ("6131/99", "6131", "6141"),
+        "nursing assistant": ("6131/99", "6131", "6141"),
+    }
+    soc_mapper.soc_job_titles = list(soc_mapper.job_title_2_soc6_4.keys())
+    soc_mapper.all_soc_embeddings = np.array(
+        [
+            [1.0, 0.0, 0.0],
+            [0.8, 0.6, 0.0],
+            [0.0, 0.0, 1.0],
+            [0.0, 0.8, 0.6],
+            [0.0, 0.6, 0.8],
+        ]
+    )
+    toy_embeddings = {
+        "data scientist": [1.0, 0.0, 0.0],
+        "nursing support": [0.0, 0.7, 0.7],
+        "zoologist": [0.0, 0.0, -1.0],
+    }
+    soc_mapper.embed_texts = lambda texts: np.array([toy_embeddings[t] for t in texts])
+    soc_mapper.index_soc_job_titles()
+
+    job_titles = ["data scientist", "nursing support", "zoologist", "data scientist"]
+
+    soc_iter = soc_mapper.get_soc_iter(iter(job_titles), batch_size=3)
+    assert list(soc_iter) == list(zip(job_titles, soc_mapper.get_soc(job_titles)))
+    assert soc_mapper.get_soc(job_titles)[0] == (
+        ("2433/02", "2433", "2425"),
+        "data scientist",
+    )
+    assert soc_mapper.get_soc(job_titles)[1] == (
+        (None, "6131", None),
+        {"assistant nurse", "nursing assistant"},
+    )
+    assert soc_mapper.get_soc(job_titles)[2] == None
+
+
+def test_find_most_likely_socs():
+    import numpy as np
+
+    soc_mapper = SOCMapper(match_top_n=5)
+    soc_mapper.soc_job_titles = [f"job title {i}" for i in range(20)]
+    soc_mapper.job_title_2_soc6_4 = {
+        job_title: (f"{i % 4}000/00", f"{i % 4}000", f"{i % 3}000")
+        for i, job_title in enumerate(soc_mapper.soc_job_titles)
+    }
+    soc_mapper.index_soc_job_titles()
+
+    rng = np.random.default_rng(42)
+    soc_mapper.all_soc_embeddings = rng.normal(size=(20, 8))
+    job_title_embeddings = rng.normal(size=(200, 8))
+    job_titles = [f"input {i}" for i in range(200)]
+
+    top_soc_ix, top_soc_scores = soc_mapper.find_top_matches(job_title_embeddings)
+    top_soc_matches = soc_mapper.format_top_matches(
+        job_titles, top_soc_ix, top_soc_scores
+    )
+
+    for sim_threshold, top_n_sim_threshold in [(0.67, 0.5), (0.8, 0.2), (0.9, 0.0)]:
+        soc_mapper.sim_threshold = sim_threshold
+        soc_mapper.top_n_sim_threshold = top_n_sim_threshold
+        assert soc_mapper.find_most_likely_socs(top_soc_ix, top_soc_scores) == [
+            soc_mapper.find_most_likely_soc(match_row) for match_row in top_soc_matches
+        ]
+
+
+def test_find_most_likely_socs_minimum_prop():
+    import numpy as np
+
+    # 63 of the 90 good matches have the same SOC, which isn't over the minimum_prop of 0.7
+    soc_mapper = SOCMapper(
+        match_top_n=90, sim_threshold=0.9, top_n_sim_threshold=0.5, minimum_prop=0.7
+    )
+    soc_mapper.soc_job_titles = [f"job title {i}" for i in range(90)]
+    soc_mapper.job_title_2_soc6_4 = {
+        job_title: (
+            (f"1000/{i:02d}", "1000", "1000")
+            if i < 63
+            else (f"{i}00/00", f"{i}00", f"{i}00")
+        )
+        for i, job_title in enumerate(soc_mapper.soc_job_titles)
+    }
+    soc_mapper.index_soc_job_titles()
+
+    top_soc_ix = np.arange(90)[None, :]
+    top_soc_scores = np.full((1, 90), 0.6)
+    top_soc_matches = soc_mapper.format_top_matches(
+        ["input"], top_soc_ix, top_soc_scores
+    )
+
+    assert soc_mapper.find_most_likely_soc(top_soc_matches[0]) == None
+    assert soc_mapper.find_most_likely_socs(top_soc_ix, top_soc_scores) == [None]
+
+    # but one more is
+    soc_mapper.job_title_2_soc6_4["job title 63"] = ("1000/63", "1000", "1000")
+    soc_mapper.index_soc_job_titles()
+    top_soc_matches = soc_mapper.format_top_matches(
+        ["input"], top_soc_ix, top_soc_scores
+    )
+    assert soc_mapper.find_most_likely_socs(top_soc_ix, top_soc_scores) == [
+        soc_mapper.find_most_likely_soc(top_soc_matches[0])
+    ]
+    assert soc_mapper.find_most_likely_socs(top_soc_ix, top_soc_scores)[0][0] == (
+        None,
+        "1000",
+        None,
+    )
+
+
+def test_coarse_search():
+    import numpy as np
+
+    soc_mapper = SOCMapper(match_top_n=5, coarse_search_groups=2)
+    soc_mapper.soc_job_titles = [f"job title {i}" for i in range(40)]
+    soc_mapper.job_title_2_soc6_4 = {
+        job_title: (f"{i % 8}000/00", f"{i % 8}000", f"{i % 3}000")
+        for i, job_title in enumerate(soc_mapper.soc_job_titles)
+    }
+    rng = np.random.default_rng(42)
+    soc_mapper.all_soc_embeddings = rng.normal(size=(40, 8))
+    soc_mapper.index_soc_job_titles()
+    job_title_embeddings = rng.normal(size=(100, 8))
+
+    top_soc_ix, top_soc_scores = soc_mapper.find_top_matches(job_title_embeddings)
+    assert top_soc_ix.shape == (100, 5)
+    # All the matches come from the 2 most similar SOC groups
+    assert all(len(set(soc_mapper.soc_2020_4_ids[ix])) <= 2 for ix in top_soc_ix)
+
+    recall = soc_mapper.evaluate_coarse_search_recall(job_title_embeddings)
+    assert 0 < recall["top_n_recall"] <= 1
+    assert soc_mapper.coarse_search_groups == 2
+
+    # Searching all the groups gives the exhaustive search results
+    soc_mapper.coarse_search_groups = 8
+    exact_top_soc_ix, exact_top_soc_scores = soc_mapper.find_top_matches(
+        job_title_embeddings
+    )
+    coarse_top_soc_ix, coarse_top_soc_scores = soc_mapper.find_top_matches_coarse(
+        job_title_embeddings
+    )
+    assert (exact_top_soc_ix == coarse_top_soc_ix).all()
+    assert np.allclose(exact_top_soc_scores, coarse_top_soc_scores)
+    assert soc_mapper.evaluate_coarse_search_recall(job_title_embeddings) == {
+        "top_match_recall": 1.0,
+        "top_n_recall": 1.0,
+    }
+
+
+def test_static_embedder():
+    import numpy as np
+    from dap_prinz_green_jobs.utils.static_embeddings import StaticEmbedder
+
+    vocab = {"data": 0, "scientist": 1, "nurse": 2}
+
+    def toy_tokenizer(texts, add_special_tokens=False):
+        return {
+            "input_ids": [
+                [vocab[word] for word in text.split() if word in vocab]
+                for text in texts
+            ]
+        }
+
+    token_embeddings = np.array([[1.0, 0.0], [0.0, 1.0], [3.0, 3.0]])
+    static_embedder = StaticEmbedder(toy_tokenizer, token_embeddings)
+
+    embeddings = static_embedder.encode(["data scientist", "zoologist", "nurse"])
+    assert embeddings.shape == (3, 2)
+    assert np.allclose(embeddings, [[0.5, 0.5], [0.0, 0.0], [3.0, 3.0]])
@@ -84,3 +84,38 @@ def test_skills_measures():
         / prop_green_skills["abc"]["NUM_SPLIT_ENTS"]
     )
     assert prop_green_skills["456"]["BENEFITS"] == ["pension"]
+
+
+def test_skill_measures_bert_backend(monkeypatch):
+    import pandas as pd
+    from dap_prinz_green_jobs.pipeline.green_measures.skills import (
+        skill_measures_utils,
+    )
+
+    embedding_backends = []
+
+    def get_embeddings(sent_list, id_list=None, backend="torch", **kwargs):
+        embedding_backends.append(backend)
+        return dict(zip(id_list or sent_list, [[1.0, 0.0]] * len(sent_list)))
+
+    # The green skill classifier and the taxonomy aren't needed to check the embeddings
+    monkeypatch.setattr(skill_measures_utils, "GreenSkillClassifier", lambda: None)
+    monkeypatch.setattr(skill_measures_utils, "get_embeddings", get_embeddings)
+    monkeypatch.setattr(
+        skill_measures_utils,
+        "load_s3_data",
+        lambda bucket_name, file_name: pd.DataFrame(
+            {"description": ["use spreadsheets software", "install heat pumps"]}
+        ),
+    )
+
+    sm = SkillMeasures(config_name="extract_green_skills_esco")
+    assert sm.bert_backend == sm.config["bert_backend"]
+
+    sm.bert_backend = "onnx-int8"
+    skill_embeddings = sm.get_skill_embeddings(["communication", "Excel"])
+    taxonomy_embeddings = sm.get_green_taxonomy_embeddings()
+
+    assert embedding_backends == ["onnx-int8", "onnx-int8"]
+    assert list(skill_embeddings.keys()) == ["communication", "Excel"]
+    assert list(taxonomy_embeddings.keys()) == [0, 1]
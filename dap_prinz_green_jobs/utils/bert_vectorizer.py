@@ -1,18 +1,38 @@
 from sentence_transformers import SentenceTransformer
+import os
 import time
-from dap_prinz_green_jobs import logger
+from dap_prinz_green_jobs import logger, PROJECT_DIR
 import numpy as np
 import torch
 
-from dap_prinz_green_jobs.utils.processing import list_chunks
+from dap_prinz_green_jobs.utils.processing import list_chunks, token_budget_batches
+from dap_prinz_green_jobs.utils.onnx_models import (
+    ONNX_BACKENDS,
+    load_onnx_sentence_encoder,
+    cosine_agreement,
+)
 
 import time
 import logging
 from tqdm import tqdm
 
+# Texts to check the ONNX backends give similar embeddings to the torch backend with
+backend_agreement_sample = [
+    "We are a leading renewable energy company based in London.",
+    "Data scientist",
+    "Experience with solar panel installation is essential.",
+    "You will be responsible for the day to day running of the warehouse, including managing stock levels and a team of 10 operatives.",
+    "communication skills",
+]
+
 
 def get_embeddings(
-    sent_list: list, chunk_size: int = 1000, id_list: list = None
+    sent_list: list,
+    chunk_size: int = 1000,
+    id_list: list = None,
+    backend="torch",
+    multi_process=False,
+    num_workers=None,
 ) -> dict:
     """
     Embed a list of sentences in chunks
@@ -20,15 +40,22 @@ def get_embeddings(
         sent_list: A list of sentences
         chunk_size: The number of sentences to embed at a time
         id_list: The keys you want in the output dictionary, if not given then the sent_list values will be given
+        backend: The BertVectorizer backend - "torch", "onnx" or "onnx-int8"
+        multi_process: Whether to embed with a pool of processes, which is reused for every chunk
+        num_workers: The number of processes in the pool (see BertVectorizer)
     Returns:
         dict: The sentence (key) and the embedding (value)
     """
 
-    bert_model = BertVectorizer(verbose=True, multi_process=False).fit()
-
-    embeddings = []
-    for batch_texts in tqdm(list_chunks(sent_list, chunk_size)):
-        embeddings.append(bert_model.transform(batch_texts))
+    with BertVectorizer(
+        verbose=True,
+        multi_process=multi_process,
+        backend=backend,
+        num_workers=num_workers,
+    ).fit() as bert_model:
+        embeddings = []
+        for batch_texts in tqdm(list_chunks(sent_list, chunk_size)):
+            embeddings.append(bert_model.transform(batch_texts))
     embeddings = np.concatenate(embeddings)
 
     if not id_list:
@@ -42,6 +69,19 @@ class BertVectorizer:
     """
     Use a pretrained transformers model to embed sentences.
     In this form so it can be used as a step in the pipeline.
+    If token_budget is given (and multi_process is False) then the texts are batched by
+    their number of tokens, with at most token_budget padded tokens and batch_size texts in a batch.
+    With backend="onnx" or "onnx-int8" the model is run with ONNX Runtime on CPU (see
+    utils/onnx_models.py), exporting it to onnx_dir the first time. The pooling and normalisation
+    are the same as the SentenceTransformer's, and fit() logs how closely the embeddings agree
+    with the torch backend's (see backend_agreement).
+    If multi_process is True then a pool of num_workers processes (by default one per GPU, or
+    4 on CPU) is started on the first transform call and reused by later calls, with the texts
+    sent to the processes in chunks of multi_process_chunk_size (by default chosen by
+    SentenceTransformer). Call close(), or use the vectorizer as a context manager, to stop the pool:
+
+        with BertVectorizer(multi_process=True).fit() as bert_model:
+            embeddings = bert_model.transform(texts)
     """
 
     def __init__(
@@ -50,33 +90,130 @@ class BertVectorizer:
         multi_process=False,
         batch_size=32,
         verbose=False,
+        token_budget=None,
+        backend="torch",
+        onnx_dir=None,
+        num_workers=None,
+        multi_process_chunk_size=None,
     ):
+        if backend not in ["torch"] + ONNX_BACKENDS:
+            raise ValueError(
+                f"backend must be one of {['torch'] + ONNX_BACKENDS}, not {backend}"
+            )
+        if backend != "torch" and multi_process:
+            raise ValueError("multi_process is only supported with the torch backend")
         self.bert_model_name = bert_model_name
         self.multi_process = multi_process
         self.batch_size = batch_size
         self.verbose = verbose
+        self.token_budget = token_budget
+        self.backend = backend
+        self.num_workers = num_workers
+        self.multi_process_chunk_size = multi_process_chunk_size
+        self.pool = None
+        self.onnx_dir = onnx_dir or os.path.join(
+            PROJECT_DIR, "outputs/models/onnx", bert_model_name
+        )
         if self.verbose:
             logger.setLevel(logging.INFO)
         else:
             logger.setLevel(logging.ERROR)
 
     def fit(self, *_):
-        device = torch.device(f"cuda:0" if torch.cuda.is_available() else "cpu")
+        device = torch.device(
+            f"cuda:0"
+            if torch.cuda.is_available() and self.backend == "torch"
+            else "cpu"
+        )
         self.bert_model = SentenceTransformer(self.bert_model_name, device=device)
         self.bert_model.max_seq_length = 512
+        if self.backend in ONNX_BACKENDS:
+            self.encoder = load_onnx_sentence_encoder(
+                self.bert_model, self.onnx_dir, quantize=self.backend == "onnx-int8"
+            )
+            logger.info(
+                f"{self.backend} backend agreement with torch: {self.backend_agreement(backend_agreement_sample)}"
+            )
+        else:
+            self.encoder = self.bert_model
         return self
 
+    def backend_agreement(self, texts):
+        """The mean and minimum cosine similarity between the embeddings of texts from this
+        vectorizer's backend and from the torch backend"""
+        return cosine_agreement(
+            self.bert_model.encode(texts, batch_size=self.batch_size),
+            self.encoder.encode(texts, batch_size=self.batch_size),
+        )
+
     def transform(self, texts):
         logger.info(f"Getting embeddings for {len(texts)} texts ...")
         t0 = time.time()
         if self.multi_process:
             logger.info(".. with multiprocessing")
-            pool = self.bert_model.start_multi_process_pool()
             self.embedded_x = self.bert_model.encode_multi_process(
-                texts, pool, batch_size=self.batch_size
+                texts,
+                self.start_pool(),
+                batch_size=self.batch_size,
+                chunk_size=self.multi_process_chunk_size,
             )
-            self.bert_model.stop_multi_process_pool(pool)
+        elif self.token_budget:
+            self.embedded_x = self.encode_token_budget_batches(texts)
         else:
-            self.embedded_x = self.bert_model.encode(texts, batch_size=self.batch_size)
+            self.embedded_x = self.encoder.encode(texts, batch_size=self.batch_size)
         logger.info(f"Took {time.time() - t0} seconds")
         return self.embedded_x
+
+    def start_pool(self):
+        """Start the pool of processes used when multi_process is True, if it hasn't been started yet"""
+        if self.pool is None:
+            target_devices = None
+            if self.num_workers:
+                target_devices = (
+                    [
+                        f"cuda:{i % torch.cuda.device_count()}"
+                        for i in range(self.num_workers)
+                    ]
+                    if torch.cuda.is_available()
+                    else ["cpu"] * self.num_workers
+                )
+            logger.info("Starting the multi-process pool")
+            self.pool = self.bert_model.start_multi_process_pool(target_devices)
+        return self.pool
+
+    def close(self):
+        """Stop the multi-process pool, if there is one"""
+        if self.pool is not None:
+            self.bert_model.stop_multi_process_pool(self.pool)
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def encode_token_budget_batches(self, texts):
+        """Embed texts in batches of similar numbers of tokens (see token_budget_batches),
+        and return the embeddings in the same order as the texts"""
+        texts = list(texts)
+        if not texts:
+            return self.encoder.encode(texts, batch_size=self.batch_size)
+
+        text_lengths = [
+            min(len(input_ids), self.encoder.max_seq_length)
+            for input_ids in self.encoder.tokenizer(texts)["input_ids"]
+        ]
+        batch_indices = token_budget_batches(
+            text_lengths, max_tokens=self.token_budget, max_batch_size=self.batch_size
+        )
+
+        embeddings = [None] * len(texts)
+        for batch in batch_indices:
+            batch_embeddings = self.encoder.encode(
+                [texts[i] for i in batch], batch_size=len(batch)
+            )
+            for i, embedding in zip(batch, batch_embeddings):
+                embeddings[i] = embedding
+
+        return np.array(embeddings)
@@ -0,0 +1,359 @@
+"""
+Run transformer models on CPU with ONNX Runtime rather than PyTorch.
+
+A HuggingFace model is exported to ONNX once (and optionally dynamically quantised
+to int8, which is usually several times faster on CPU), and then run with ONNX Runtime.
+onnx and onnxruntime are only needed if these backends are used.
+
+Text classification usage:
+
+from transformers import AutoTokenizer
+from dap_prinz_green_jobs.utils.onnx_models import load_onnx_text_classifier
+
+classifier = load_onnx_text_classifier("nestauk/jobbert-base-cased-compdecs", "outputs/models/company_description_classifier/", quantize=True)
+classifier(["We are a leading retailer.", "Apply now!"], batch_size=32)
+>>> [{'label': 'LABEL_1', 'score': 0.98}, {'label': 'LABEL_0', 'score': 0.99}]
+
+Sentence embeddings usage:
+
+from sentence_transformers import SentenceTransformer
+from dap_prinz_green_jobs.utils.onnx_models import load_onnx_sentence_encoder
+
+bert_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2", device="cpu")
+encoder = load_onnx_sentence_encoder(bert_model, "outputs/models/onnx/all-MiniLM-L6-v2/", quantize=True)
+encoder.encode(["data scientist", "nurse"])
+"""
+
+import inspect
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+import torch
+from sentence_transformers import models as st_models
+from transformers import AutoConfig, AutoModelForSequenceClassification, AutoTokenizer
+
+from dap_prinz_green_jobs.utils.processing import list_chunks
+from dap_prinz_green_jobs import logger
+
+ONNX_BACKENDS = ["onnx", "onnx-int8"]
+
+
+def export_to_onnx(
+    model: torch.nn.Module,
+    tokenizer,
+    onnx_path: str,
+    output_name: str,
+    quantize: bool = False,
+) -> str:
+    """Export a HuggingFace model to ONNX, with dynamic batch and sequence length axes.
+
+    Args:
+        model (torch.nn.Module): The model to export, e.g. from AutoModelForSequenceClassification
+        tokenizer: The model's tokenizer
+        onnx_path (str): Where to save the ONNX model
+        output_name (str): The name of the model output to use e.g. "logits" or "last_hidden_state"
+        quantize (bool): Whether to also save a dynamically int8 quantised version of the model
+
+    Returns:
+        str: The path to the (quantised if quantize is True) ONNX model
+    """
+    onnx_dir = os.path.dirname(onnx_path)
+    if onnx_dir:
+        os.makedirs(onnx_dir, exist_ok=True)
+
+    logger.info(f"Exporting model to {onnx_path}")
+    tokenized = tokenizer(["An example sentence."], return_tensors="pt")
+    # The tokenizer outputs are passed as the first positional arguments of the model's forward
+    # method (e.g. input_ids, attention_mask, token_type_ids for BERT models), in that order
+    input_names = list(inspect.signature(model.forward).parameters)[: len(tokenized)]
+    if set(input_names) != set(tokenized.keys()):
+        raise ValueError(
+            f"The tokenizer outputs {list(tokenized.keys())} aren't the first arguments of the model"
+        )
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes[output_name] = (
+        {0: "batch", 1: "sequence"}
+        if output_name == "last_hidden_state"
+        else {0: "batch"}
+    )
+
+    model = model.to("cpu").eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(tokenized[name] for name in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=[output_name],
+            dynamic_axes=dynamic_axes,
+            opset_version=14,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        quantized_onnx_path = onnx_path.replace(".onnx", "_int8.onnx")
+        logger.info(f"Quantising model to {quantized_onnx_path}")
+        quantize_dynamic(onnx_path, quantized_onnx_path, weight_type=QuantType.QInt8)
+        return quantized_onnx_path
+    else:
+        return onnx_path
+
+
+def create_onnx_session(onnx_path: str):
+    """Load an ONNX model into an ONNX Runtime session on CPU"""
+    import onnxruntime
+
+    return onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+
+
+class OnnxTextClassifier(object):
+    """
+    Run a text classification model exported to ONNX. This can be called in the same way
+    as a HuggingFace "text-classification" pipeline.
+
+    :param onnx_path: The path to the ONNX model
+    :type onnx_path: str
+
+    :param tokenizer: The model's tokenizer
+
+    :param id2label: The label name for each output index of the model
+    :type id2label: dict
+    """
+
+    def __init__(self, onnx_path: str, tokenizer, id2label: Dict[int, str]):
+        self.onnx_path = onnx_path
+        self.tokenizer = tokenizer
+        self.id2label = id2label
+        self.session = create_onnx_session(onnx_path)
+        self.input_names = [
+            model_input.name for model_input in self.session.get_inputs()
+        ]
+
+    def __call__(self, texts: List[str], batch_size: int = 1) -> List[dict]:
+        if isinstance(texts, str):
+            texts = [texts]
+
+        preds = []
+        for batch_texts in list_chunks(list(texts), batch_size):
+            inputs = self.tokenizer(
+                batch_texts, padding=True, truncation=True, return_tensors="np"
+            )
+            logits = self.session.run(
+                None, {name: inputs[name].astype(np.int64) for name in self.input_names}
+            )[0]
+            scores = np.exp(logits - logits.max(axis=1, keepdims=True))
+            scores = scores / scores.sum(axis=1, keepdims=True)
+            for text_scores in scores:
+                label_index = int(text_scores.argmax())
+                preds.append(
+                    {
+                        "label": self.id2label[label_index],
+                        "score": float(text_scores[label_index]),
+                    }
+                )
+
+        return preds
+
+
+def load_onnx_text_classifier(
+    model_path: str, onnx_dir: str, quantize: bool = True
+) -> OnnxTextClassifier:
+    """Load a text classification model with ONNX Runtime, exporting it from
+    HuggingFace to ONNX first if this hasn't been done yet.
+
+    Args:
+        model_path (str): The HuggingFace model name or path
+        onnx_dir (str): The directory to save the ONNX models in
+        quantize (bool): Whether to use the int8 quantised model
+
+    Returns:
+        OnnxTextClassifier: The classifier
+    """
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    onnx_path = os.path.join(onnx_dir, "model.onnx")
+    model_onnx_path = (
+        onnx_path.replace(".onnx", "_int8.onnx") if quantize else onnx_path
+    )
+
+    if not os.path.exists(model_onnx_path):
+        logger.info(f"{model_onnx_path} not found - exporting {model_path} to ONNX")
+        model_onnx_path = export_to_onnx(
+            AutoModelForSequenceClassification.from_pretrained(model_path),
+            tokenizer,
+            onnx_path,
+            output_name="logits",
+            quantize=quantize,
+        )
+
+    id2label = {
+        int(label_index): label
+        for label_index, label in AutoConfig.from_pretrained(
+            model_path
+        ).id2label.items()
+    }
+
+    return OnnxTextClassifier(model_onnx_path, tokenizer, id2label)
+
+
+class OnnxSentenceEncoder(object):
+    """
+    Embed texts with a SentenceTransformer's transformer model exported to ONNX, pooling
+    (and normalising) the token embeddings in the same way as the SentenceTransformer.
+    This can be used in place of SentenceTransformer.encode.
+
+    :param onnx_path: The path to the ONNX transformer model
+    :type onnx_path: str
+
+    :param tokenizer: The model's tokenizer
+
+    :param max_seq_length: The maximum number of tokens, longer texts are truncated
+    :type max_seq_length: int
+
+    :param pooling_mode: How to pool the token embeddings - "mean", "cls" or "max"
+    :type pooling_mode: str
+
+    :param normalize: Whether to normalise the embeddings to unit length
+    :type normalize: bool
+    """
+
+    def __init__(
+        self,
+        onnx_path: str,
+        tokenizer,
+        max_seq_length: int,
+        pooling_mode: str = "mean",
+        normalize: bool = False,
+    ):
+        self.onnx_path = onnx_path
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+        self.pooling_mode = pooling_mode
+        self.normalize = normalize
+        self.session = create_onnx_session(onnx_path)
+        self.input_names = [
+            model_input.name for model_input in self.session.get_inputs()
+        ]
+        self.embedding_dim = self.session.get_outputs()[0].shape[-1]
+
+    def pool(self, token_embeddings: np.ndarray, attention_mask: np.ndarray):
+        if self.pooling_mode == "cls":
+            return token_embeddings[:, 0]
+        mask = attention_mask[:, :, None].astype(token_embeddings.dtype)
+        if self.pooling_mode == "max":
+            return np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+        return (token_embeddings * mask).sum(axis=1) / np.clip(
+            mask.sum(axis=1), 1e-9, None
+        )
+
+    def encode(self, texts: List[str], batch_size: int = 32, **_) -> np.ndarray:
+        if isinstance(texts, str):
+            texts = [texts]
+
+        embeddings = [np.zeros((0, self.embedding_dim), dtype=np.float32)]
+        for batch_texts in list_chunks(
+            [str(text).strip() for text in texts], batch_size
+        ):
+            inputs = self.tokenizer(
+                batch_texts,
+                padding=True,
+                truncation="longest_first",
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            token_embeddings = self.session.run(
+                None, {name: inputs[name].astype(np.int64) for name in self.input_names}
+            )[0]
+            batch_embeddings = self.pool(token_embeddings, inputs["attention_mask"])
+            if self.normalize:
+                batch_embeddings = batch_embeddings / np.clip(
+                    np.linalg.norm(batch_embeddings, axis=1, keepdims=True),
+                    1e-12,
+                    None,
+                )
+            embeddings.append(np.float32(batch_embeddings))
+
+        return np.concatenate(embeddings)
+
+
+def get_sentence_transformer_pooling(sentence_transformer) -> Tuple[str, bool]:
+    """Find the pooling mode and whether the embeddings are normalised for a
+    SentenceTransformer made up of a Transformer, Pooling and (optionally) Normalize module
+    """
+    pooling_mode = None
+    normalize = False
+    for module in sentence_transformer:
+        if isinstance(module, st_models.Pooling):
+            # e.g. "mean" or "mean+max" (newer sentence_transformers versions store this as pooling_mode)
+            pooling_mode = (
+                module.get_pooling_mode_str()
+                if hasattr(module, "get_pooling_mode_str")
+                else module.pooling_mode
+            )
+        elif isinstance(module, st_models.Normalize):
+            normalize = True
+        elif not isinstance(module, st_models.Transformer):
+            raise ValueError(
+                f"SentenceTransformer modules of type {type(module).__name__} aren't supported with ONNX Runtime"
+            )
+    if pooling_mode not in ["mean", "cls", "max"]:
+        raise ValueError(
+            "Only mean, CLS or max pooling SentenceTransformers are supported with ONNX Runtime"
+        )
+
+    return pooling_mode, normalize
+
+
+def load_onnx_sentence_encoder(
+    sentence_transformer, onnx_dir: str, quantize: bool = True
+) -> OnnxSentenceEncoder:
+    """Load a SentenceTransformer's model with ONNX Runtime, exporting it to ONNX
+    first if this hasn't been done yet.
+
+    Args:
+        sentence_transformer (SentenceTransformer): The SentenceTransformer model (on CPU)
+        onnx_dir (str): The directory to save the ONNX models in
+        quantize (bool): Whether to use the int8 quantised model
+
+    Returns:
+        OnnxSentenceEncoder: The encoder
+    """
+    pooling_mode, normalize = get_sentence_transformer_pooling(sentence_transformer)
+    onnx_path = os.path.join(onnx_dir, "model.onnx")
+    model_onnx_path = (
+        onnx_path.replace(".onnx", "_int8.onnx") if quantize else onnx_path
+    )
+
+    if not os.path.exists(model_onnx_path):
+        logger.info(f"{model_onnx_path} not found - exporting model to ONNX")
+        model_onnx_path = export_to_onnx(
+            sentence_transformer[0].auto_model,
+            sentence_transformer.tokenizer,
+            onnx_path,
+            output_name="last_hidden_state",
+            quantize=quantize,
+        )
+
+    return OnnxSentenceEncoder(
+        model_onnx_path,
+        sentence_transformer.tokenizer,
+        sentence_transformer.max_seq_length,
+        pooling_mode=pooling_mode,
+        normalize=normalize,
+    )
+
+
+def cosine_agreement(embeddings: np.ndarray, other_embeddings: np.ndarray) -> dict:
+    """The mean and minimum cosine similarity between the rows of two sets of embeddings
+    of the same texts, e.g. from the torch and ONNX backends"""
+    cosines = (embeddings * other_embeddings).sum(axis=1) / np.clip(
+        np.linalg.norm(embeddings, axis=1) * np.linalg.norm(other_embeddings, axis=1),
+        1e-12,
+        None,
+    )
+    return {
+        "num_texts": len(cosines),
+        "mean_cosine": float(cosines.mean()),
+        "min_cosine": float(cosines.min()),
+    }
@@ -2,7 +2,12 @@
 Generically useful functions
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from itertools import islice
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+from dap_prinz_green_jobs import logger
 
 
 def list_chunks(orig_list: list, chunk_size: int = 100):
@@ -25,3 +30,80 @@ def dict_chunks(data_dict: dict, chunk_size: int = 100):
     it = iter(data_dict)
     for i in range(0, len(data_dict), chunk_size):
         yield {k: data_dict[k] for k in islice(it, chunk_size)}
+
+
+def token_budget_batches(
+    lengths: List[int], max_tokens: int = 4096, max_batch_size: int = None
+) -> List[List[int]]:
+    """Groups texts into batches of similar lengths, so there is little padding in each batch.
+
+    The texts are sorted from longest to shortest and each batch is filled until the padded
+    batch (the number of texts x the longest text length) would have more than max_tokens
+    tokens in it, or it has max_batch_size texts in it. A text longer than max_tokens is
+    put in a batch on its own.
+
+    Args:
+        lengths (List[int]): The number of tokens in each text
+        max_tokens (int, optional): The maximum number of (padded) tokens in a batch. Defaults to 4096.
+        max_batch_size (int, optional): The maximum number of texts in a batch. Defaults to None (no limit).
+
+    Returns:
+        List[List[int]]: The indices of the texts in each batch
+    """
+    batches = []
+    batch = []
+    batch_max_length = 0
+    for i in sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True):
+        if batch and (
+            (len(batch) + 1) * batch_max_length > max_tokens
+            or (max_batch_size and len(batch) >= max_batch_size)
+        ):
+            batches.append(batch)
+            batch = []
+        if not batch:
+            batch_max_length = max(lengths[i], 1)
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def load_concurrently(
+    loaders: Dict[str, Callable[[], Any]], max_workers: int = None
+) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """Runs independent loading steps (e.g. downloading and parsing datasets) at the same
+    time in a thread pool, so loading them all takes about as long as the slowest one.
+
+    Args:
+        loaders (Dict[str, Callable[[], Any]]): The name of each dataset and a function (with no
+            arguments) which loads it
+        max_workers (int, optional): The maximum number of threads. Defaults to None (one per loader).
+
+    Returns:
+        Tuple[Dict[str, Any], Dict[str, float]]: What each loader returned, and how many seconds
+            each loader took, by name
+    """
+
+    def timed(name: str, loader: Callable[[], Any]) -> Tuple[Any, float]:
+        t0 = time.time()
+        loaded = loader()
+        load_time = time.time() - t0
+        logger.info(f"Loaded {name} in {load_time:.2f} seconds")
+        return loaded, load_time
+
+    if not loaders:
+        return {}, {}
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(loaders)) as executor:
+        futures = {
+            name: executor.submit(timed, name, loader)
+            for name, loader in loaders.items()
+        }
+        # result() raises any error from a loader
+        results = {name: future.result() for name, future in futures.items()}
+
+    return (
+        {name: loaded for name, (loaded, _) in results.items()},
+        {name: load_time for name, (_, load_time) in results.items()},
+    )
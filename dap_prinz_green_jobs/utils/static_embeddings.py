@@ -0,0 +1,107 @@
+"""
+Fast static embeddings for short texts (e.g. job titles).
+
+A table of token embeddings is distilled once from a sentence transformers model
+by running every token in its vocabulary through the model on its own. Texts are then
+embedded by tokenising them with the model's tokenizer and averaging the rows of the table
+for their tokens. There is no transformer forward pass at encoding time, so this is orders
+of magnitude faster on CPU than SentenceTransformer.encode, at the cost of some accuracy.
+
+Usage:
+
+from sentence_transformers import SentenceTransformer
+from dap_prinz_green_jobs.utils.static_embeddings import StaticEmbedder
+
+bert_model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+static_embedder = StaticEmbedder.distill(bert_model)
+static_embedder.encode(["data scientist", "nurse"])
+"""
+
+from typing import List
+
+import numpy as np
+import torch
+from tqdm import tqdm
+
+from dap_prinz_green_jobs.utils.processing import list_chunks
+from dap_prinz_green_jobs import logger
+
+
+class StaticEmbedder(object):
+    """
+    Embed texts by mean pooling static token embeddings.
+
+    :param tokenizer: The (HuggingFace) tokenizer of the model the token embeddings came from
+    :param token_embeddings: An array of shape (vocabulary size, embedding dimension)
+    :type token_embeddings: np.ndarray
+    """
+
+    def __init__(self, tokenizer, token_embeddings: np.ndarray):
+        self.tokenizer = tokenizer
+        self.token_embeddings = np.float32(token_embeddings)
+
+    @classmethod
+    def distill(cls, sentence_transformer, batch_size: int = 1024):
+        """
+        Create the static token embeddings from a SentenceTransformer model. Each token
+        in the vocabulary is input to the transformer on its own (with the special start
+        and end tokens) and the output is mean pooled, as the SentenceTransformer does.
+        """
+
+        tokenizer = sentence_transformer.tokenizer
+        transformer = sentence_transformer[0].auto_model
+        device = next(transformer.parameters()).device
+
+        logger.info(
+            f"Distilling static embeddings for {tokenizer.vocab_size} tokens from the transformer model"
+        )
+        token_embeddings = []
+        for token_ids in tqdm(
+            list_chunks(list(range(tokenizer.vocab_size)), batch_size)
+        ):
+            input_ids = torch.tensor(
+                [
+                    [tokenizer.cls_token_id, token_id, tokenizer.sep_token_id]
+                    for token_id in token_ids
+                ],
+                device=device,
+            )
+            with torch.no_grad():
+                output = transformer(
+                    input_ids=input_ids, attention_mask=torch.ones_like(input_ids)
+                )
+            token_embeddings.append(output.last_hidden_state.mean(dim=1).cpu().numpy())
+
+        return cls(tokenizer, np.concatenate(token_embeddings))
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed a list of texts. Texts with no tokens are given a vector of zeros.
+        """
+
+        token_ids = self.tokenizer(
+            [str(text) for text in texts], add_special_tokens=False
+        )["input_ids"]
+
+        num_tokens = np.array([len(ids) for ids in token_ids])
+        all_token_ids = np.fromiter(
+            (token_id for ids in token_ids for token_id in ids),
+            dtype=np.int64,
+            count=num_tokens.sum(),
+        )
+
+        embeddings = np.zeros(
+            (len(token_ids), self.token_embeddings.shape[1]), dtype=np.float32
+        )
+        has_tokens = num_tokens > 0
+        if has_tokens.any():
+            # Sum the token embeddings for each text, starting at each text's first token
+            text_starts = np.concatenate([[0], np.cumsum(num_tokens)[:-1]])
+            embeddings[has_tokens] = (
+                np.add.reduceat(
+                    self.token_embeddings[all_token_ids], text_starts[has_tokens]
+                )
+                / num_tokens[has_tokens, None]
+            )
+
+        return embeddings
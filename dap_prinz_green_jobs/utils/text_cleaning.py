@@ -1,15 +1,26 @@
 """
 Functions to minimally clean job advertisements.
+
+To clean many job adverts at once (optionally in several processes), use clean_texts or
+clean_and_split_texts, which give the same output as clean_text and split_sentences.
 """
 from toolz import pipe
+import ahocorasick
+from concurrent.futures import ProcessPoolExecutor
+import os
 import re
-from typing import List
+from typing import Callable, List, Tuple
 
 from hashlib import md5
 
 # Pattern for fixing a missing space between enumerations, for
 # split_sentences()
 compiled_missing_space_pattern = re.compile("([a-z])([A-Z])")
+# The same, but matching the empty string between the two letters, for detect_camelcase()
+# (which is faster than substituting the groups back in)
+compiled_camelcase_boundary_pattern = re.compile("(?<=[a-z])(?=[A-Z])")
+# Pattern to split sentences on, for split_sentences()
+compiled_sentence_split_pattern = re.compile(r"([.?!])\s+")
 # Characters outside these rules will be padded, for pad_punctuation()
 compiled_nonalphabet_nonnumeric_pattern = re.compile(r"([^a-zA-Z0-9] )")
 
@@ -47,6 +58,32 @@ exception_camelcases = [
     "AutoCAD",
 ]
 
+# The camel cases which should be kept in, as they are after splitting camel cases (e.g. "Java. Script")
+exception_camelcases_split = [
+    compiled_missing_space_pattern.sub(r"\1. \2", exception)
+    for exception in exception_camelcases
+]
+
+
+def create_exception_camelcases_automaton(
+    exception_camelcases_split: List[str],
+) -> ahocorasick.Automaton:
+    """
+    Creates an Aho-Corasick automaton to find all the (split) exception camel cases
+    in a text in one pass. The value of each is its index in exception_camelcases_split.
+    """
+    automaton = ahocorasick.Automaton()
+    for i, exception_split in enumerate(exception_camelcases_split):
+        automaton.add_word(exception_split, i)
+    automaton.make_automaton()
+
+    return automaton
+
+
+exception_camelcases_automaton = create_exception_camelcases_automaton(
+    exception_camelcases_split
+)
+
 # Any trailing chars that match these are removed
 trim_chars = [" ", ".", ",", ";", ":", "\xa0"]
 
@@ -61,11 +98,17 @@ def detect_camelcase(text):
     Note that the present solution doesn't catch all such cases (e.g. "UKSkills")
     Reference: https://stackoverflow.com/questions/1097901/regular-expression-split-string-by-capital-letter-but-ignore-tla
     """
-    text = compiled_missing_space_pattern.sub(r"\1. \2", str(text))
-    for exception in exception_camelcases:
-        exception_cleaned = compiled_missing_space_pattern.sub(r"\1. \2", exception)
+    text = compiled_camelcase_boundary_pattern.sub(". ", str(text))
+    # Only the exceptions found in the text are replaced, but in the order of exception_camelcases
+    # as a replacement can remove another exception. Replacing an exception can't make another one
+    # since the split exceptions don't have any camel cases in.
+    found_exceptions = sorted(
+        set(i for _, i in exception_camelcases_automaton.iter(text))
+    )
+    for i in found_exceptions:
+        exception_cleaned = exception_camelcases_split[i]
         if exception_cleaned in text:
-            text = text.replace(exception_cleaned, exception)
+            text = text.replace(exception_cleaned, exception_camelcases[i])
 
     return text
 
@@ -81,6 +124,19 @@ compiled_punct_patterns = {
     re.compile(p): v for p, v in punctuation_replacement_rules.items()
 }
 
+# The replacements in replacements(), with punctuation_replacement_rules as single character
+# replacements. None of them make a character which is replaced later, so doing them one after
+# another with str.replace gives the same output as the regular expressions, but is faster.
+replacement_rules = [
+    ("&", "and"),
+    ("\xa0", " "),
+    ("\n", "."),
+    ("[", ""),
+    ("]", ""),
+    *[(char, ".") for char in "\u2022\u2023\u25E6\u2043\u2219*"],
+    *[(char, " ") for char in "/:\\"],
+]
+
 
 def replacements(text):
     """
@@ -90,16 +146,9 @@ def replacements(text):
     e.g. ";• managing the grants database;• preparing financial and interna"
     ":•\xa0NMC registration paid every year•\xa0Free train"
     """
-    text = (
-        text.replace("&", "and")
-        .replace("\xa0", " ")
-        .replace("\n", ".")
-        .replace("[", "")
-        .replace("]", "")
-    )
-
-    for pattern, rep in compiled_punct_patterns.items():
-        text = pattern.sub(rep, text)
+    for old, new in replacement_rules:
+        if old in text:
+            text = text.replace(old, new)
 
     return text.strip()
 
@@ -132,13 +181,84 @@ def split_sentences(text: str) -> List[str]:
         List[str]: A list of sentences
     """
     # split phrases on .?!
-    pattern = re.compile(r"([.?!])\s+")
-    # Split the text into sentences using the pattern
-    sentences = re.split(pattern, text)
+    sentences = compiled_sentence_split_pattern.split(text)
 
     return list(set(sentences))
 
 
+def clean_and_split_text(text: str) -> Tuple[str, List[str]]:
+    """Cleans a job advert (clean_text) and splits it on .?! (before removing
+    duplicate sentences as in split_sentences)
+
+    Args:
+        text (str): job advert
+
+    Returns:
+        Tuple[str, List[str]]: The cleaned job advert and its split parts
+    """
+    text_clean = clean_text(text)
+
+    return text_clean, compiled_sentence_split_pattern.split(text_clean)
+
+
+def batch_apply(
+    function: Callable, texts: List[str], n_jobs: int = 1, chunk_size: int = 1000
+) -> list:
+    """Applies a function to each text, in n_jobs processes if there are more than chunk_size texts.
+
+    Args:
+        function (Callable): A (module level) function to apply to each text
+        texts (List[str]): The texts
+        n_jobs (int, optional): The number of processes, -1 to use all the CPUs. Defaults to 1.
+        chunk_size (int, optional): The number of texts sent to a process at a time. Defaults to 1000.
+
+    Returns:
+        list: The output of the function for each text
+    """
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
+    if not n_jobs or n_jobs <= 1 or len(texts) <= chunk_size:
+        return [function(text) for text in texts]
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        return list(executor.map(function, texts, chunksize=chunk_size))
+
+
+def clean_texts(texts: List[str], n_jobs: int = 1) -> List[str]:
+    """Cleans many job adverts (see clean_text).
+
+    Args:
+        texts (List[str]): job adverts
+        n_jobs (int, optional): The number of processes to use for large numbers of job adverts. Defaults to 1.
+
+    Returns:
+        List[str]: The cleaned job adverts
+    """
+    return batch_apply(clean_text, texts, n_jobs=n_jobs)
+
+
+def clean_and_split_texts(
+    texts: List[str], n_jobs: int = 1
+) -> List[Tuple[str, List[str]]]:
+    """Cleans many job adverts and splits them into sentences, giving the same
+    output as clean_text followed by split_sentences.
+
+    Args:
+        texts (List[str]): job adverts
+        n_jobs (int, optional): The number of processes to use for large numbers of job adverts. Defaults to 1.
+
+    Returns:
+        List[Tuple[str, List[str]]]: The cleaned job advert and its sentences, for each job advert
+    """
+    # Duplicate sentences are removed here rather than in each process, so that the
+    # order of the sentences is the same as split_sentences would give
+    return [
+        (text_clean, list(set(sentences)))
+        for text_clean, sentences in batch_apply(
+            clean_and_split_text, texts, n_jobs=n_jobs
+        )
+    ]
+
+
 def short_hash(text: str) -> int:
     """Create a short hash from a string
 